@@ -0,0 +1,133 @@
+import asyncio
+import datetime
+import os
+import queue
+import threading
+
+from sqlalchemy import insert
+
+import models
+from database import SessionLocal
+
+
+class SecurityLogBuffer:
+    """
+    In-process buffer for security_logs rows.
+    Handlers enqueue and return immediately; a background thread writes the
+    buffer with one bulk INSERT whenever flush_size rows are waiting or
+    flush_interval seconds have passed. When the queue is full the event is
+    dropped (policy "drop") or the caller waits up to block_timeout seconds
+    (policy "block"). Coroutines call record_async, which never waits on the
+    event loop.
+    """
+
+    def __init__(self, max_size=10000, flush_size=200, flush_interval=1.0, policy="drop", block_timeout=0.05):
+        self._queue = queue.Queue(maxsize=max_size)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._flush_now = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="security-log-writer", daemon=True)
+            self._thread.start()
+
+    @staticmethod
+    def _row(event_type, description):
+        return {"event_type": event_type, "description": description, "timestamp": datetime.datetime.utcnow()}
+
+    def record(self, event_type, description):
+        self._put(self._row(event_type, description), self.policy == "block")
+
+    async def record_async(self, event_type, description):
+        row = self._row(event_type, description)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if self.policy != "block":
+                self.dropped += 1
+                return
+            # Wait for room in a worker thread so the event loop keeps serving
+            await asyncio.to_thread(self._put, row, True)
+            return
+        self._queued()
+
+    def _put(self, row, block):
+        try:
+            if block:
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._queued()
+
+    def _queued(self):
+        if self._thread is None:
+            self.start()
+        if self._queue.qsize() >= self.flush_size:
+            self._flush_now.set()
+
+    def flush(self):
+        with self._flush_lock:
+            rows = []
+            while True:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not rows:
+                return 0
+            db = SessionLocal()
+            try:
+                db.execute(insert(models.SecurityLog), rows)
+                db.commit()
+                self.written += len(rows)
+            except Exception as e:
+                self.failed_flushes += 1
+                self.dropped += len(rows)
+                print(f"❌ [AUDIT] Failed to flush {len(rows)} security logs: {e}")
+            finally:
+                db.close()
+            return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._flush_now.wait(self.flush_interval)
+            self._flush_now.clear()
+            self.flush()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._flush_now.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        self._thread = None
+        # Whatever arrived after the last cycle still gets written
+        self.flush()
+        self._stop.clear()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+security_log = SecurityLogBuffer(
+    max_size=int(os.environ.get("AUDIT_QUEUE_MAX", "10000")),
+    flush_size=int(os.environ.get("AUDIT_FLUSH_SIZE", "200")),
+    flush_interval=float(os.environ.get("AUDIT_FLUSH_INTERVAL", "1.0")),
+    policy=os.environ.get("AUDIT_FULL_POLICY", "drop"),
+)
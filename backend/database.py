@@ -1,6 +1,8 @@
 import os
 import re
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -19,43 +21,159 @@ else:
     SQLALCHEMY_DATABASE_URL = re.sub(r'^postgres://', 'postgresql://', raw_url)
     print(f"🚀 [STATUS] Attempting to connect to external DB (scheme: {SQLALCHEMY_DATABASE_URL.split('://')[0]})")
 
-# 3. Create Engine with Failsafe Fallback
-try:
+# 3. Create Engine (no connection is opened until first use)
+# "concurrent": WAL, busy_timeout, synchronous=NORMAL, a reader-sized pool and
+# one in-process writer at a time; "default": the plain pysqlite settings
+SQLITE_PROFILE = os.environ.get("SQLITE_PROFILE", "concurrent")
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", "16"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_WRITE_WAIT = float(os.environ.get("SQLITE_WRITE_WAIT", "30"))
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers run alongside the writer; NORMAL only syncs at checkpoints
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+def build_engine(url):
     # SQLite needs "check_same_thread": False
-    if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-        engine = create_engine(
-            SQLALCHEMY_DATABASE_URL, 
-            connect_args={"check_same_thread": False}
+    if url.startswith("sqlite"):
+        if SQLITE_PROFILE != "concurrent":
+            return create_engine(
+                url, 
+                connect_args={"check_same_thread": False}
+            )
+        sqlite_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+            # Connections are cheap readers under WAL; writes are serialized below
+            pool_size=SQLITE_POOL_SIZE,
+            max_overflow=0,
+            pool_timeout=30
         )
-    else:
-        # Use Standard Postgres settings
-        engine = create_engine(
-            SQLALCHEMY_DATABASE_URL,
-            pool_size=5,
-            max_overflow=10,
-            pool_pre_ping=True,
-            pool_recycle=300
-        )
-    
-    # Test connection immediately
-    with engine.connect() as conn:
-        print("🚀 [STATUS] Database Engine created and connection verified.")
+        event.listen(sqlite_engine, "connect", _sqlite_pragmas)
+        return sqlite_engine
+    # Postgres pool, tunable per deployment
+    return create_engine(
+        url,
+        pool_size=int(os.environ.get("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+        pool_pre_ping=True,
+        pool_recycle=int(os.environ.get("DB_POOL_RECYCLE", "300"))
+    )
+
+# Set to 0 to stay unready rather than serve from the emergency SQLite file
+DB_SQLITE_FALLBACK = os.environ.get("DB_SQLITE_FALLBACK", "1") != "0"
 
+try:
+    engine = build_engine(SQLALCHEMY_DATABASE_URL)
 except Exception as e:
+    # e.g. the Postgres driver is not installed
+    if not DB_SQLITE_FALLBACK:
+        raise
     print(f"❌ [ERROR] Could not initialize external DB: {e}")
     print("🚀 [STATUS] Falling back to emergency SQLite /tmp/qumail.db")
     SQLALCHEMY_DATABASE_URL = "sqlite:////tmp/qumail.db"
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, 
-        connect_args={"check_same_thread": False}
-    )
+    engine = build_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Single-writer queue for SQLite: a session takes the write lock at its first
+# write and holds it until its transaction ends, so concurrent writers wait
+# their turn in-process instead of failing with "database is locked".
+_sqlite_write_lock = threading.Lock()
+
+def _is_serialized(session):
+    bind = session.get_bind()
+    return SQLITE_PROFILE == "concurrent" and bind.dialect.name == "sqlite"
+
+def _acquire_write_lock(session):
+    if session.info.get("holds_write_lock") or not _is_serialized(session):
+        return
+    if not _sqlite_write_lock.acquire(timeout=SQLITE_WRITE_WAIT):
+        # A leaked session must not wedge every writer; fall back to busy_timeout
+        print(f"❌ [DB] Waited {SQLITE_WRITE_WAIT:.0f}s for the SQLite write lock; writing without it")
+        return
+    session.info["holds_write_lock"] = True
+
+@event.listens_for(SessionLocal, "before_flush")
+def _lock_before_flush(session, flush_context, instances):
+    _acquire_write_lock(session)
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _lock_before_bulk_write(orm_execute_state):
+    # text() statements report is_select=False too; only real DML takes the lock
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _acquire_write_lock(orm_execute_state.session)
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _release_write_lock(session, transaction):
+    if transaction.parent is None and session.info.pop("holds_write_lock", False):
+        _sqlite_write_lock.release()
 Base = declarative_base()
 
 def get_db():
+    # Requests that race startup wait for the tables instead of failing on them
+    wait_until_ready(DB_READY_WAIT)
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+# 4. Deferred connect: verified with retries at startup instead of at import
+DB_CONNECT_ATTEMPTS = int(os.environ.get("DB_CONNECT_ATTEMPTS", "5"))
+DB_CONNECT_BACKOFF = float(os.environ.get("DB_CONNECT_BACKOFF", "0.5"))
+DB_READY_WAIT = float(os.environ.get("DB_READY_WAIT", "10"))
+
+db_state = {"status": "pending", "url_scheme": SQLALCHEMY_DATABASE_URL.split("://")[0], "attempts": 0, "error": None}
+_ready = threading.Event()
+
+def connect_database():
+    """Verify the connection, retrying with backoff; returns the engine that should be used."""
+    global engine, SQLALCHEMY_DATABASE_URL
+    delay = DB_CONNECT_BACKOFF
+    for attempt in range(1, DB_CONNECT_ATTEMPTS + 1):
+        db_state["attempts"] = attempt
+        try:
+            with engine.connect():
+                print("🚀 [STATUS] Database Engine created and connection verified.")
+            db_state["status"] = "connected"
+            db_state["error"] = None
+            return engine
+        except Exception as e:
+            db_state["error"] = str(e)
+            print(f"❌ [ERROR] Database connect attempt {attempt}/{DB_CONNECT_ATTEMPTS} failed: {e}")
+            if attempt < DB_CONNECT_ATTEMPTS:
+                time.sleep(delay)
+                delay *= 2
+    if not DB_SQLITE_FALLBACK or SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+        db_state["status"] = "unavailable"
+        raise RuntimeError(f"Database unavailable after {DB_CONNECT_ATTEMPTS} attempts: {db_state['error']}")
+    print("🚀 [STATUS] Falling back to emergency SQLite /tmp/qumail.db")
+    SQLALCHEMY_DATABASE_URL = "sqlite:////tmp/qumail.db"
+    engine.dispose()
+    engine = build_engine(SQLALCHEMY_DATABASE_URL)
+    SessionLocal.configure(bind=engine)
+    db_state["status"] = "sqlite-fallback"
+    db_state["url_scheme"] = "sqlite"
+    return engine
+
+# 5. Full-text engine for the email metadata search index, chosen by dialect;
+# None means search falls back to unindexed LIKE matching
+FULL_TEXT_BACKENDS = {"sqlite": "fts5", "postgresql": "tsvector"}
+
+def full_text_backend(bind):
+    return FULL_TEXT_BACKENDS.get(bind.dialect.name)
+
+def mark_ready():
+    _ready.set()
+
+def wait_until_ready(timeout):
+    return _ready.wait(timeout)
+
+def is_ready():
+    return _ready.is_set()
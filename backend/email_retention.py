@@ -0,0 +1,129 @@
+"""
+Email retention, and with it the retirement of QKD keys.
+
+The backend keeps no key material of its own and re-retrieves an email's key
+every time the email is read, so the KM must hold a key for as long as the
+email exists. With EMAIL_RETENTION_DAYS set, a background thread deletes
+emails older than that a batch at a time. It consumes their keys at the KM
+first (retrieve with consume=true), which frees the KM's key capacity. 0,
+the default, keeps mail (and so its keys) forever.
+"""
+import datetime
+import os
+import threading
+
+import models
+from database import SessionLocal
+from email_storage import BLOB_DIR, STREAM, email_payload
+from encryption.crypto_plugins.otp_engine import otp_stream_key_ids
+from km_client.qkd_client import consume_qkd_keys_sync
+
+
+class EmailRetention:
+    """
+    Deletes emails older than retention_days every interval seconds.
+    A batch is only deleted once the KM has retired its keys; if the KM is
+    unreachable the batch stays and the next run tries again.
+    """
+
+    def __init__(self, retention_days=0, interval=3600.0, batch_size=500, blob_dir=BLOB_DIR):
+        self.retention_days = retention_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.blob_dir = blob_dir
+        self._stop = threading.Event()
+        self._thread = None
+        self.purged = 0
+        self.keys_consumed = 0
+        self.failed_runs = 0
+
+    def start(self):
+        if self.retention_days > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="email-retention", daemon=True)
+            self._thread.start()
+
+    def _blob_path(self, e):
+        _, blob_name, _ = email_payload(e)
+        return os.path.join(self.blob_dir, os.path.basename(blob_name.decode("utf-8")))
+
+    def _key_ids(self, e, blob_path):
+        key_ids = [e.key_id] if e.key_id else []
+        if e.algorithm == STREAM and e.security_level == 1 and os.path.exists(blob_path):
+            # Level 1 streams spend one key per frame; the row records only the first
+            with open(blob_path, "rb") as src:
+                key_ids.extend(otp_stream_key_ids(src))
+        return key_ids
+
+    def purge_batch(self, now=None):
+        """Delete up to batch_size expired emails; returns how many went."""
+        cutoff = (now or datetime.datetime.utcnow()) - datetime.timedelta(days=self.retention_days)
+        db = SessionLocal()
+        try:
+            emails = (db.query(models.Email).filter(models.Email.timestamp < cutoff)
+                      .order_by(models.Email.id).limit(self.batch_size).all())
+            if not emails:
+                return 0
+            blobs = [self._blob_path(e) if e.algorithm == STREAM else None for e in emails]
+            key_ids = [key_id for e, blob in zip(emails, blobs) for key_id in self._key_ids(e, blob)]
+            # Raises when a KM node is unreachable, which leaves the batch for the next run
+            self.keys_consumed += consume_qkd_keys_sync(key_ids)
+
+            ids = [e.id for e in emails]
+            risky = sum(1 for e in emails if (e.threat_score or 0) > 50)
+            db.query(models.OutboundDispatch).filter(models.OutboundDispatch.email_id.in_(ids)).delete(synchronize_session=False)
+            db.query(models.Email).filter(models.Email.id.in_(ids)).delete(synchronize_session=False)
+            db.query(models.EmailStats).filter(models.EmailStats.id == 1).update({
+                models.EmailStats.total_emails: models.EmailStats.total_emails - len(ids),
+                models.EmailStats.active_risks: models.EmailStats.active_risks - risky,
+                models.EmailStats.updated_at: datetime.datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        for blob in blobs:
+            if blob and os.path.exists(blob):
+                os.remove(blob)
+        self.purged += len(ids)
+        return len(ids)
+
+    def purge(self, now=None):
+        """Run batches until nothing older than the retention window is left."""
+        total = 0
+        while not self._stop.is_set():
+            count = self.purge_batch(now)
+            total += count
+            if count < self.batch_size:
+                break
+        return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                purged = self.purge()
+                if purged:
+                    print(f"🧹 [RETENTION] Deleted {purged} emails older than {self.retention_days} days and retired their keys")
+            except Exception as e:
+                self.failed_runs += 1
+                print(f"❌ [RETENTION] Purge failed: {e}")
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        self._thread = None
+        self._stop.clear()
+
+    def stats(self):
+        return {
+            "retention_days": self.retention_days,
+            "purged": self.purged,
+            "keys_consumed": self.keys_consumed,
+            "failed_runs": self.failed_runs,
+        }
+
+
+email_retention = EmailRetention(
+    retention_days=float(os.environ.get("EMAIL_RETENTION_DAYS", "0")),
+    interval=float(os.environ.get("EMAIL_RETENTION_INTERVAL", "3600")),
+    batch_size=int(os.environ.get("EMAIL_RETENTION_BATCH", "500")),
+)
@@ -0,0 +1,223 @@
+"""
+Full-text search over email metadata: subject, sender, recipient and any
+keyword tokens the client chose to store in plaintext. Bodies are never
+indexed or decrypted; a search returns email ids only.
+
+SQLite keeps an FTS5 index (emails_fts) in step with the emails table
+through triggers. Postgres keeps a generated tsvector column with a GIN
+index. database.full_text_backend picks one from the dialect; any other
+database falls back to an unindexed LIKE scan.
+"""
+import re
+
+from sqlalchemy import inspect, text
+
+import models
+from database import full_text_backend
+
+# Columns a search can be narrowed to, by API name
+SEARCH_FIELDS = {"subject": "subject", "sender": "sender", "recipient": "recipient", "keywords": "search_keywords"}
+MAX_TERMS = 16
+MAX_KEYWORDS = 32
+MAX_KEYWORD_LENGTH = 64
+
+search_state = {"backend": None}
+
+_FTS5_SETUP = (
+    # External-content table: the index stores tokens only, text stays in emails
+    """CREATE VIRTUAL TABLE emails_fts USING fts5(
+        subject, sender, recipient, search_keywords,
+        content='emails', content_rowid='id', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS emails_fts_ai AFTER INSERT ON emails BEGIN
+        INSERT INTO emails_fts(rowid, subject, sender, recipient, search_keywords)
+        VALUES (new.id, new.subject, new.sender, new.recipient, new.search_keywords);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS emails_fts_ad AFTER DELETE ON emails BEGIN
+        INSERT INTO emails_fts(emails_fts, rowid, subject, sender, recipient, search_keywords)
+        VALUES ('delete', old.id, old.subject, old.sender, old.recipient, old.search_keywords);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS emails_fts_au AFTER UPDATE OF subject, sender, recipient, search_keywords ON emails BEGIN
+        INSERT INTO emails_fts(emails_fts, rowid, subject, sender, recipient, search_keywords)
+        VALUES ('delete', old.id, old.subject, old.sender, old.recipient, old.search_keywords);
+        INSERT INTO emails_fts(rowid, subject, sender, recipient, search_keywords)
+        VALUES (new.id, new.subject, new.sender, new.recipient, new.search_keywords);
+    END""",
+)
+
+# Addresses are indexed whole (the parser's email token) and split on @ and .
+# so both "alice@qumail.local" and "alice" find them
+_TSVECTOR_EXPRESSION = """
+    to_tsvector('simple'::regconfig, coalesce(subject, ''))
+    || to_tsvector('simple'::regconfig, coalesce(sender, '') || ' ' || translate(coalesce(sender, ''), '@.', '  '))
+    || to_tsvector('simple'::regconfig, coalesce(recipient, '') || ' ' || translate(coalesce(recipient, ''), '@.', '  '))
+    || to_tsvector('simple'::regconfig, coalesce(search_keywords, ''))
+"""
+
+_TSQUERY_UNSAFE = re.compile(r"[^\w@.+-]")
+
+
+def normalize_keywords(keywords):
+    """Client-approved keyword tokens as the space-separated string stored in search_keywords."""
+    tokens = []
+    for keyword in keywords or ():
+        for token in keyword.lower().split():
+            token = token[:MAX_KEYWORD_LENGTH]
+            if token not in tokens:
+                tokens.append(token)
+    return " ".join(tokens[:MAX_KEYWORDS]) or None
+
+
+def _ensure_keywords_column(bind):
+    existing = {column["name"] for column in inspect(bind).get_columns("emails")}
+    if "search_keywords" in existing:
+        return
+    column = models.Email.__table__.c.search_keywords
+    with bind.begin() as conn:
+        conn.execute(text(f"ALTER TABLE emails ADD COLUMN search_keywords {column.type.compile(dialect=bind.dialect)}"))
+    print("🚀 [SEARCH] Added column to emails: search_keywords")
+
+
+def _ensure_fts5(bind):
+    with bind.begin() as conn:
+        created = not conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'emails_fts'")).first()
+        if created:
+            conn.execute(text(_FTS5_SETUP[0]))
+        for statement in _FTS5_SETUP[1:]:
+            conn.execute(text(statement))
+        if created:
+            # Index the rows written before the triggers existed
+            conn.execute(text("INSERT INTO emails_fts(emails_fts) VALUES ('rebuild')"))
+    if created:
+        print("🚀 [SEARCH] Built FTS5 index over email metadata")
+
+
+def _ensure_tsvector(bind):
+    existing = {column["name"] for column in inspect(bind).get_columns("emails")}
+    with bind.begin() as conn:
+        if "search_vector" not in existing:
+            # Stored generated column: Postgres keeps it current on every insert and update
+            conn.execute(text(f"ALTER TABLE emails ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({_TSVECTOR_EXPRESSION}) STORED"))
+            print("🚀 [SEARCH] Added tsvector column over email metadata")
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_emails_search_vector ON emails USING GIN (search_vector)"))
+
+
+def ensure_search_index(bind):
+    """Create (or backfill) the metadata index for this database; records which backend search uses."""
+    _ensure_keywords_column(bind)
+    backend = full_text_backend(bind)
+    try:
+        if backend == "fts5":
+            _ensure_fts5(bind)
+        elif backend == "tsvector":
+            _ensure_tsvector(bind)
+    except Exception as e:
+        # e.g. SQLite built without FTS5: search still works, just unindexed
+        print(f"❌ [SEARCH] Could not build the {backend} index, falling back to LIKE: {e}")
+        backend = None
+    search_state["backend"] = backend or "like"
+    return search_state["backend"]
+
+
+def _terms(query):
+    """Whitespace-separated terms as (text, is_prefix); a trailing * asks for prefix matching."""
+    terms = []
+    for raw in query.split()[:MAX_TERMS]:
+        term = raw.rstrip("*")
+        if term:
+            terms.append((term, term != raw))
+    return terms
+
+
+def _ids(db, sql, params):
+    # Straight on the session's connection: a read must never go through the
+    # ORM execute hooks that queue SQLite writers (database._lock_before_bulk_write)
+    return [row[0] for row in db.connection().execute(text(sql), params)]
+
+
+def _fts5_phrase(term, prefix=False, column=None):
+    # Quoted so FTS5 operators in user input are plain text. Whole-token
+    # matches stream straight off the index; a prefix term merges every token
+    # it covers first, which only the 2- and 3-character prefix indexes make cheap.
+    phrase = '"' + term.replace('"', '""') + '"' + ("*" if prefix else "")
+    return f"{column} : {phrase}" if column else phrase
+
+
+def _search_fts5(db, terms, column, recipient, before_id, limit):
+    match = " AND ".join(_fts5_phrase(term, prefix, column) for term, prefix in terms)
+    if recipient:
+        # Narrow inside the index first; the join below makes the match exact
+        match = f"({match}) AND {_fts5_phrase(recipient, column='recipient')}"
+    sql = "SELECT emails_fts.rowid FROM emails_fts"
+    params = {"match": match, "limit": limit}
+    if recipient:
+        sql += " JOIN emails ON emails.id = emails_fts.rowid"
+    sql += " WHERE emails_fts MATCH :match"
+    if recipient:
+        sql += " AND emails.recipient = :recipient"
+        params["recipient"] = recipient
+    if before_id is not None:
+        sql += " AND emails_fts.rowid < :before_id"
+        params["before_id"] = before_id
+    # FTS5 walks its doclists in rowid order, so newest-first needs no sort
+    sql += " ORDER BY emails_fts.rowid DESC LIMIT :limit"
+    return _ids(db, sql, params)
+
+
+def _search_tsvector(db, terms, column, recipient, before_id, limit):
+    lexemes = [(_TSQUERY_UNSAFE.sub("", term), prefix) for term, prefix in terms]
+    query = " & ".join(lexeme + (":*" if prefix else "") for lexeme, prefix in lexemes if lexeme)
+    if not query:
+        return []
+    condition = "search_vector @@ to_tsquery('simple', :query)"
+    params = {"query": query, "limit": limit}
+    if column:
+        # The vector has no per-column weights; check the column itself on the GIN candidates
+        for i, (term, _) in enumerate(terms):
+            condition += f" AND {column} ILIKE :term{i}"
+            params[f"term{i}"] = f"%{term}%"
+    sql = f"SELECT id FROM emails WHERE {condition}"
+    if recipient:
+        sql += " AND recipient = :recipient"
+        params["recipient"] = recipient
+    if before_id is not None:
+        sql += " AND id < :before_id"
+        params["before_id"] = before_id
+    sql += " ORDER BY id DESC LIMIT :limit"
+    return _ids(db, sql, params)
+
+
+def _search_like(db, terms, column, recipient, before_id, limit):
+    columns = [column] if column else list(SEARCH_FIELDS.values())
+    params = {"limit": limit}
+    clauses = []
+    for i, (term, _) in enumerate(terms):
+        params[f"term{i}"] = f"%{term}%"
+        clauses.append("(" + " OR ".join(f"{c} LIKE :term{i}" for c in columns) + ")")
+    sql = f"SELECT id FROM emails WHERE {' AND '.join(clauses)}"
+    if recipient:
+        sql += " AND recipient = :recipient"
+        params["recipient"] = recipient
+    if before_id is not None:
+        sql += " AND id < :before_id"
+        params["before_id"] = before_id
+    sql += " ORDER BY id DESC LIMIT :limit"
+    return _ids(db, sql, params)
+
+
+_SEARCHERS = {"fts5": _search_fts5, "tsvector": _search_tsvector, "like": _search_like}
+
+
+def search_email_ids(db, query, recipient=None, field=None, before_id=None, limit=50):
+    """
+    Ids of emails whose metadata matches every term of query (whole tokens,
+    or prefixes for terms ending in *), newest first, optionally limited to one recipient's mailbox, to
+    one field, and to ids below before_id (the keyset cursor).
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+    column = SEARCH_FIELDS[field] if field else None
+    # Until ensure_search_index has run there is no index to use
+    searcher = _SEARCHERS[search_state["backend"] or "like"]
+    return searcher(db, terms, column, recipient, before_id, limit)
@@ -0,0 +1,124 @@
+"""
+Binary ciphertext storage for the emails table.
+
+Rows store raw ciphertext and nonce bytes plus an algorithm column. Rows
+written before that carry a prefixed base64 string in body_encrypted
+(e.g. QAES_ENC(<b64>:<b64>)); they stay readable through email_payload until
+migrate_legacy_rows converts them. Run this module directly to migrate:
+
+    python email_storage.py --batch 500
+"""
+import argparse
+import base64
+import os
+import time
+
+from sqlalchemy import inspect, text, update
+
+import models
+from database import SessionLocal, connect_database
+
+OTP = "OTP"
+QAES = "QAES"
+PQC = "PQC"
+STREAM = "STREAM"
+PLAIN = "PLAIN"
+
+# Ciphertext of streamed sends lives on disk; the row's ciphertext column holds the blob name
+BLOB_DIR = os.environ.get("QUMAIL_BLOB_DIR", "/tmp/qumail_blobs")
+
+# security_level -> algorithm for single-part sends
+LEVEL_ALGORITHMS = {1: OTP, 2: QAES, 3: PQC}
+
+_LEGACY_PREFIXES = (
+    ("OTP_ENC(", OTP),
+    ("QAES_ENC(", QAES),
+    ("PQC_ENC(", PQC),
+    ("STREAM_ENC(", STREAM),
+)
+
+
+def parse_legacy_body(body):
+    """Split a prefixed body_encrypted string into (algorithm, ciphertext, nonce)."""
+    for prefix, algorithm in _LEGACY_PREFIXES:
+        if body.startswith(prefix):
+            inner = body[len(prefix):-1]
+            if algorithm == STREAM:
+                return STREAM, inner.encode("utf-8"), None
+            if algorithm == QAES:
+                enc_b64, nonce_b64 = inner.split(":")
+                return QAES, base64.b64decode(enc_b64), base64.b64decode(nonce_b64)
+            return algorithm, base64.b64decode(inner), None
+    return PLAIN, body.encode("utf-8"), None
+
+
+def email_payload(e):
+    """(algorithm, ciphertext, nonce) for a row in either storage format."""
+    if e.algorithm is not None:
+        return e.algorithm, e.ciphertext, e.nonce
+    return parse_legacy_body(e.body_encrypted or "")
+
+
+def ensure_binary_columns(bind):
+    """Add the ciphertext/nonce/algorithm columns to an emails table created before they existed."""
+    existing = {column["name"] for column in inspect(bind).get_columns("emails")}
+    missing = [models.Email.__table__.c[name] for name in ("ciphertext", "nonce", "algorithm") if name not in existing]
+    if not missing:
+        return []
+    with bind.begin() as conn:
+        for column in missing:
+            conn.execute(text(f"ALTER TABLE emails ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"))
+    print(f"🚀 [STORAGE] Added columns to emails: {', '.join(c.name for c in missing)}")
+    return [c.name for c in missing]
+
+
+def migrate_legacy_rows(batch_size=500):
+    """
+    Convert prefixed base64 rows to the binary columns, batch_size rows per
+    transaction, walking the primary key so memory stays flat however large
+    the table is. Safe to interrupt and rerun.
+    """
+    converted = 0
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            rows = db.query(models.Email.id, models.Email.body_encrypted).filter(
+                models.Email.id > last_id,
+                models.Email.algorithm.is_(None),
+                models.Email.body_encrypted.isnot(None)
+            ).order_by(models.Email.id).limit(batch_size).all()
+            if not rows:
+                return converted
+            values = []
+            for row_id, body in rows:
+                try:
+                    algorithm, ciphertext, nonce = parse_legacy_body(body)
+                except Exception as e:
+                    print(f"❌ [STORAGE] Leaving email {row_id} in legacy format: {e}")
+                    continue
+                values.append({"id": row_id, "algorithm": algorithm, "ciphertext": ciphertext, "nonce": nonce, "body_encrypted": None})
+            if values:
+                # Bulk UPDATE by primary key: one executemany per batch
+                db.execute(update(models.Email), values)
+                db.commit()
+            converted += len(values)
+            last_id = rows[-1][0]
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+    engine = connect_database()
+    models.Base.metadata.create_all(bind=engine)
+    ensure_binary_columns(engine)
+    start = time.perf_counter()
+    converted = migrate_legacy_rows(args.batch)
+    print(f"✅ [STORAGE] Converted {converted} legacy rows in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,136 @@
+import struct
+from time import perf_counter
+
+from metrics import crypto_latency
+
+# Large buffers are XORed by NumPy in one vectorized pass; smaller ones as
+# big integers in fixed-size chunks. Neither path iterates per byte in Python.
+CHUNK_SIZE = 1 << 20
+NUMPY_THRESHOLD = 64 << 10
+
+_numpy = None
+
+def _load_numpy():
+    # Imported on the first large buffer rather than at startup; False when unavailable
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy
+
+def xor_bytes(data, key):
+    length = min(len(data), len(key))
+    data_view = memoryview(data)[:length]
+    key_view = memoryview(key)[:length]
+    out = bytearray(length)
+    np = _load_numpy() if length >= NUMPY_THRESHOLD else False
+    if np:
+        np.bitwise_xor(
+            np.frombuffer(data_view, dtype=np.uint8),
+            np.frombuffer(key_view, dtype=np.uint8),
+            out=np.frombuffer(out, dtype=np.uint8),
+        )
+        return bytes(out)
+    for start in range(0, length, CHUNK_SIZE):
+        end = min(start + CHUNK_SIZE, length)
+        mixed = int.from_bytes(data_view[start:end], "big") ^ int.from_bytes(key_view[start:end], "big")
+        out[start:end] = mixed.to_bytes(end - start, "big")
+    return bytes(out)
+
 def encrypt_otp(plaintext: bytes, key: bytes):
     if len(key) < len(plaintext):
         raise Exception(f"QKD key too short. Need {len(plaintext)}, got {len(key)}")
-    return bytes([p ^ k for p, k in zip(plaintext, key)])
+    start = perf_counter()
+    ciphertext = xor_bytes(plaintext, key)
+    crypto_latency.observe(perf_counter() - start, "otp", "encrypt")
+    return ciphertext
 
 def decrypt_otp(ciphertext: bytes, key: bytes):
-    return bytes([c ^ k for c, k in zip(ciphertext, key)])
+    start = perf_counter()
+    plaintext = xor_bytes(ciphertext, key)
+    crypto_latency.observe(perf_counter() - start, "otp", "decrypt")
+    return plaintext
+
+# Streaming mode: every frame is XORed with exactly one freshly issued key
+# and records that key's id, so the decrypt side can fetch keys frame by frame.
+#   [key_id length: u16][payload length: u32][key_id][payload]
+STREAM_FRAME_HEADER = struct.Struct(">HI")
+
+def encrypt_otp_stream(chunks, next_key):
+    """
+    XOR an iterable of plaintext chunks, yielding one frame per consumed key.
+    next_key() must return a fresh (key_id, key_bytes) each call; a partially
+    used final key is discarded, never reused.
+    """
+    pending = bytearray()
+    key_id, key = None, b""
+    chunks = iter(chunks)
+    exhausted = False
+    while True:
+        if not key:
+            if exhausted and not pending:
+                return
+            key_id, key = next_key()
+            if not key_id or not key:
+                raise Exception("QKD key material exhausted during stream encryption")
+        while len(pending) < len(key) and not exhausted:
+            chunk = next(chunks, None)
+            if chunk is None:
+                exhausted = True
+            else:
+                pending += chunk
+        if not pending:
+            return
+        take = min(len(key), len(pending))
+        encoded_id = key_id.encode("ascii")
+        yield STREAM_FRAME_HEADER.pack(len(encoded_id), take) + encoded_id + xor_bytes(memoryview(pending)[:take], key)
+        del pending[:take]
+        key = b""
+
+def otp_stream_key_ids(src):
+    """Key ids of every frame in an OTP stream, reading only the frame headers."""
+    key_ids = []
+    while True:
+        header = src.read(STREAM_FRAME_HEADER.size)
+        if len(header) != STREAM_FRAME_HEADER.size:
+            return key_ids
+        id_len, length = STREAM_FRAME_HEADER.unpack(header)
+        key_ids.append(src.read(id_len).decode("ascii"))
+        src.seek(length, 1)
+
+def decrypt_otp_stream(src, get_keys, window=64, window_bytes=CHUNK_SIZE):
+    """
+    Read frames written by encrypt_otp_stream from a file object and yield plaintext chunks.
+    Frames are read a window at a time (up to window frames or window_bytes
+    of payload) and get_keys(key_ids) is called once per window; it returns
+    {key_id: key_bytes}. A key it does not return is an error, never a guess.
+    """
+    while True:
+        frames = []
+        buffered = 0
+        while len(frames) < window and buffered < window_bytes:
+            header = src.read(STREAM_FRAME_HEADER.size)
+            if not header:
+                break
+            if len(header) != STREAM_FRAME_HEADER.size:
+                raise ValueError("Truncated OTP stream frame header")
+            id_len, length = STREAM_FRAME_HEADER.unpack(header)
+            key_id = src.read(id_len).decode("ascii")
+            payload = src.read(length)
+            if len(payload) != length:
+                raise ValueError("Truncated OTP stream frame")
+            frames.append((key_id, payload))
+            buffered += length
+        if not frames:
+            return
+        keys = get_keys([key_id for key_id, _ in frames])
+        for key_id, payload in frames:
+            key = keys.get(key_id)
+            if key is None:
+                raise Exception(f"QKD key {key_id} unavailable for stream decryption")
+            if len(key) < len(payload):
+                raise Exception(f"QKD key too short. Need {len(payload)}, got {len(key)}")
+            yield xor_bytes(payload, key)
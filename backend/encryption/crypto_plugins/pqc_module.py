@@ -1,9 +1,31 @@
+from time import perf_counter
+
+from metrics import crypto_latency
+
 def encrypt_pqc(plaintext: bytes, public_key: bytes = b'mock_pk'):
     # In a full deployment, map to liboqs Kyber512 encapsulation
     # For testing, applying wrapper overlay structure mimicking PQC encapsulation
-    return b"PQC_HEADER:" + plaintext
+    start = perf_counter()
+    ciphertext = b"PQC_HEADER:" + plaintext
+    crypto_latency.observe(perf_counter() - start, "pqc", "encrypt")
+    return ciphertext
 
 def decrypt_pqc(ciphertext: bytes, private_key: bytes = b'mock_sk'):
-    if ciphertext.startswith(b"PQC_HEADER:"):
-        return ciphertext[len(b"PQC_HEADER:"):]
-    return ciphertext
+    start = perf_counter()
+    plaintext = ciphertext[len(b"PQC_HEADER:"):] if ciphertext.startswith(b"PQC_HEADER:") else ciphertext
+    crypto_latency.observe(perf_counter() - start, "pqc", "decrypt")
+    return plaintext
+
+PQC_STREAM_HEADER = b"PQC_HEADER:"
+
+def encrypt_pqc_stream(chunks, public_key: bytes = b'mock_pk'):
+    yield PQC_STREAM_HEADER
+    for chunk in chunks:
+        yield bytes(chunk)
+
+def decrypt_pqc_stream(src, private_key: bytes = b'mock_sk', chunk_size: int = 1 << 20):
+    header = src.read(len(PQC_STREAM_HEADER))
+    if header != PQC_STREAM_HEADER:
+        yield header
+    for chunk in iter(lambda: src.read(chunk_size), b""):
+        yield chunk
@@ -1,15 +1,155 @@
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from concurrent.futures import ThreadPoolExecutor
+import collections
 import hashlib
 import os
+import struct
+import threading
+from time import perf_counter
 
-def encrypt_quantum_aes(plaintext: bytes, qkd_key: bytes):
-    aes_key = hashlib.sha256(qkd_key).digest()
-    aesgcm = AESGCM(aes_key)
+from metrics import crypto_latency
+
+# Derived AESGCM contexts keyed by key_id alone; no key material or digest of
+# it is kept here. The KeyCache drops a key_id's context whenever it stores or
+# evicts that key, so a context built from the KM fallback key while the KM
+# was unreachable is gone once the real key arrives.
+AESGCM_CACHE_SIZE = int(os.environ.get("QAES_CONTEXT_CACHE", "512"))
+_context_cache = collections.OrderedDict()
+_context_lock = threading.Lock()
+BATCH_WORKERS = int(os.environ.get("QAES_BATCH_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+# Below this many items the pool hand-off costs more than it saves
+BATCH_MIN_PARALLEL = 64
+_batch_executor = None
+
+def _aesgcm_for(qkd_key: bytes, key_id=None):
+    if key_id is None:
+        return AESGCM(hashlib.sha256(qkd_key).digest())
+    aesgcm = _context_cache.get(key_id)
+    if aesgcm is not None:
+        # Lock-free hit; a concurrent eviction may already have removed it
+        try:
+            _context_cache.move_to_end(key_id)
+        except KeyError:
+            pass
+        return aesgcm
+    aesgcm = AESGCM(hashlib.sha256(qkd_key).digest())
+    with _context_lock:
+        _context_cache[key_id] = aesgcm
+        _context_cache.move_to_end(key_id)
+        while len(_context_cache) > AESGCM_CACHE_SIZE:
+            _context_cache.popitem(last=False)
+    return aesgcm
+
+def evict_quantum_aes_context(key_id=None):
+    """Drop one cached context, or all of them when key_id is None."""
+    with _context_lock:
+        if key_id is None:
+            _context_cache.clear()
+        else:
+            _context_cache.pop(key_id, None)
+
+def encrypt_quantum_aes(plaintext: bytes, qkd_key: bytes, key_id=None):
+    start = perf_counter()
     nonce = os.urandom(12)
-    ciphertext = aesgcm.encrypt(nonce, plaintext, None)
+    ciphertext = _aesgcm_for(qkd_key, key_id).encrypt(nonce, plaintext, None)
+    crypto_latency.observe(perf_counter() - start, "quantum_aes", "encrypt")
     return ciphertext, nonce
 
-def decrypt_quantum_aes(ciphertext: bytes, qkd_key: bytes, nonce: bytes):
-    aes_key = hashlib.sha256(qkd_key).digest()
-    aesgcm = AESGCM(aes_key)
-    return aesgcm.decrypt(nonce, ciphertext, None)
+def decrypt_quantum_aes(ciphertext: bytes, qkd_key: bytes, nonce: bytes, key_id=None):
+    start = perf_counter()
+    plaintext = _aesgcm_for(qkd_key, key_id).decrypt(nonce, ciphertext, None)
+    crypto_latency.observe(perf_counter() - start, "quantum_aes", "decrypt")
+    return plaintext
+
+def _decrypt_batch_slice(items):
+    # Items are not timed one by one; the batch is observed once as a whole
+    results = []
+    for ciphertext, nonce, qkd_key, key_id in items:
+        try:
+            results.append(_aesgcm_for(qkd_key, key_id).decrypt(nonce, ciphertext, None))
+        except Exception as ex:
+            results.append(ex)
+    return results
+
+def decrypt_quantum_aes_batch(items):
+    """
+    Decrypt many (ciphertext, nonce, qkd_key, key_id) tuples on a shared thread pool.
+    Work is split into one contiguous slice per worker; results come back in
+    input order and a failed item yields its exception instead of aborting
+    the whole batch.
+    """
+    start = perf_counter()
+    results = _decrypt_batch(list(items))
+    crypto_latency.observe(perf_counter() - start, "quantum_aes", "decrypt_batch")
+    return results
+
+def _decrypt_batch(items):
+    global _batch_executor
+    if len(items) < BATCH_MIN_PARALLEL:
+        return _decrypt_batch_slice(items)
+    if _batch_executor is None:
+        with _context_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="qaes-batch")
+    step = -(-len(items) // BATCH_WORKERS)
+    results = []
+    for part in _batch_executor.map(_decrypt_batch_slice, [items[i:i + step] for i in range(0, len(items), step)]):
+        results.extend(part)
+    return results
+
+# Streaming mode: the payload is sealed in independent AES-GCM chunks.
+# Each chunk nonce is a random 7-byte stream prefix, a 4-byte chunk counter
+# and a 1-byte "last chunk" flag, so reordering, dropping or truncating
+# chunks makes authentication fail on decrypt.
+STREAM_CHUNK_SIZE = 1 << 20
+STREAM_PREFIX_SIZE = 7
+STREAM_FRAME_HEADER = struct.Struct(">I")
+
+def _stream_nonce(prefix: bytes, counter: int, last: bool):
+    return prefix + counter.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+def encrypt_quantum_aes_stream(chunks, qkd_key: bytes):
+    """Yield the stream prefix followed by length-prefixed sealed chunks."""
+    aesgcm = AESGCM(hashlib.sha256(qkd_key).digest())
+    prefix = os.urandom(STREAM_PREFIX_SIZE)
+    yield prefix
+    counter = 0
+    chunks = iter(chunks)
+    current = next(chunks, b"")
+    while True:
+        # One chunk of lookahead tells us which chunk carries the last flag
+        following = next(chunks, None)
+        sealed = aesgcm.encrypt(_stream_nonce(prefix, counter, following is None), bytes(current), None)
+        yield STREAM_FRAME_HEADER.pack(len(sealed)) + sealed
+        if following is None:
+            return
+        current = following
+        counter += 1
+
+def _read_stream_frame(src):
+    header = src.read(STREAM_FRAME_HEADER.size)
+    if not header:
+        return None
+    if len(header) != STREAM_FRAME_HEADER.size:
+        raise ValueError("Truncated stream frame header")
+    (length,) = STREAM_FRAME_HEADER.unpack(header)
+    sealed = src.read(length)
+    if len(sealed) != length:
+        raise ValueError("Truncated stream frame")
+    return sealed
+
+def decrypt_quantum_aes_stream(src, qkd_key: bytes):
+    """Read a stream written by encrypt_quantum_aes_stream from a file object and yield plaintext chunks."""
+    aesgcm = AESGCM(hashlib.sha256(qkd_key).digest())
+    prefix = src.read(STREAM_PREFIX_SIZE)
+    if len(prefix) != STREAM_PREFIX_SIZE:
+        raise ValueError("Missing stream prefix")
+    counter = 0
+    current = _read_stream_frame(src)
+    if current is None:
+        raise ValueError("Empty stream")
+    while current is not None:
+        following = _read_stream_frame(src)
+        yield aesgcm.decrypt(_stream_nonce(prefix, counter, following is None), current, None)
+        current = following
+        counter += 1
@@ -0,0 +1,118 @@
+import collections
+import hashlib
+import os
+import re
+import threading
+import time
+
+from http_pool import HostPool
+
+GOOGLE_CERTS_URL = os.environ.get("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+google_http = HostPool("google", max_connections=10, max_keepalive=5, per_host_limit=5, timeout=5.0)
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class CertCache:
+    """
+    Google's signing certificates, kept until the Cache-Control max-age of the
+    response that delivered them runs out. A token signed with an unknown key
+    id forces one early refresh (at most every min_refresh_interval seconds),
+    which picks up key rotations before max-age expires.
+    """
+
+    def __init__(self, url, default_max_age=300, min_refresh_interval=30):
+        self.url = url
+        self.default_max_age = default_max_age
+        self.min_refresh_interval = min_refresh_interval
+        self._certs = None
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def _max_age(self, response):
+        match = _MAX_AGE_RE.search(response.headers.get("cache-control", ""))
+        max_age = int(match.group(1)) if match else self.default_max_age
+        # Age: seconds the response already spent in an intermediate cache
+        return max(0, max_age - int(response.headers.get("age", "0") or 0))
+
+    def _refresh(self, now):
+        response = google_http.request_sync("GET", self.url)
+        response.raise_for_status()
+        self._certs = response.json()
+        self._fetched_at = now
+        self._expires_at = now + self._max_age(response)
+        self.fetches += 1
+
+    def get(self, key_id=None):
+        now = time.monotonic()
+        with self._lock:
+            stale = self._certs is None or now >= self._expires_at
+            rotated = key_id is not None and self._certs is not None and key_id not in self._certs \
+                and now - self._fetched_at >= self.min_refresh_interval
+            if stale or rotated:
+                try:
+                    self._refresh(now)
+                except Exception as e:
+                    if self._certs is None:
+                        raise
+                    # Keep verifying with the last good set while Google is unreachable
+                    print(f"❌ [GOOGLE] Certificate refresh failed, using cached set: {e}")
+            return self._certs
+
+
+class VerifiedTokenCache:
+    """Claims of successfully verified ID tokens, keyed by token hash and kept until the token's exp."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode("utf-8") if isinstance(token, str) else token).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["exp"] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, token, claims):
+        with self._lock:
+            self._entries[self._key(token)] = claims
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+cert_cache = CertCache(GOOGLE_CERTS_URL, default_max_age=int(os.environ.get("GOOGLE_CERTS_DEFAULT_MAX_AGE", "300")))
+token_cache = VerifiedTokenCache(max_entries=int(os.environ.get("GOOGLE_TOKEN_CACHE_MAX", "2048")))
+
+
+def verify_google_id_token(token, audience):
+    """
+    Same checks as google.oauth2.id_token.verify_oauth2_token (signature,
+    audience, iat/exp, issuer) against the cached certificates. Raises
+    ValueError for any invalid token.
+    """
+    cached = token_cache.get(token)
+    if cached is not None and cached.get("aud") == audience:
+        return cached
+    # Imported on first use: google.auth is slow to load
+    from google.auth import jwt
+    header = jwt.decode_header(token)
+    claims = jwt.decode(token, certs=cert_cache.get(header.get("kid")), audience=audience)
+    if claims.get("iss") not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+    token_cache.put(token, claims)
+    return claims
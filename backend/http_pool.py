@@ -0,0 +1,69 @@
+import asyncio
+import os
+import threading
+from urllib.parse import urlsplit
+
+import httpx
+
+
+class HostPool:
+    """
+    Shared, keep-alive HTTP clients for one upstream service.
+    The async client serves request handlers; the sync client serves
+    background threads. Both are pooled and reused across calls, and
+    in-flight async requests are capped per host.
+    """
+
+    def __init__(self, name, max_connections=20, max_keepalive=10, per_host_limit=10, timeout=3.0):
+        prefix = name.upper()
+        self.name = name
+        self.limits = httpx.Limits(
+            max_connections=int(os.environ.get(f"{prefix}_MAX_CONNECTIONS", max_connections)),
+            max_keepalive_connections=int(os.environ.get(f"{prefix}_MAX_KEEPALIVE", max_keepalive)),
+        )
+        self.per_host_limit = int(os.environ.get(f"{prefix}_PER_HOST_LIMIT", per_host_limit))
+        self.timeout = float(os.environ.get(f"{prefix}_TIMEOUT", timeout))
+        self._lock = threading.Lock()
+        self._sync_client = None
+        self._async_client = None
+        self._async_loop = None
+        self._host_semaphores = {}
+
+    def sync_client(self):
+        if self._sync_client is None:
+            with self._lock:
+                if self._sync_client is None:
+                    self._sync_client = httpx.Client(limits=self.limits, timeout=self.timeout, follow_redirects=True)
+        return self._sync_client
+
+    def async_client(self):
+        # Async clients and semaphores are bound to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, follow_redirects=True)
+            self._async_loop = loop
+            self._host_semaphores = {}
+        return self._async_client
+
+    def _semaphore(self, url):
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return semaphore
+
+    async def request(self, method, url, **kwargs):
+        client = self.async_client()
+        async with self._semaphore(url):
+            return await client.request(method, url, **kwargs)
+
+    def request_sync(self, method, url, **kwargs):
+        return self.sync_client().request(method, url, **kwargs)
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
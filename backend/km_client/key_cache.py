@@ -0,0 +1,110 @@
+import collections
+import threading
+import time
+
+
+class KeyCache:
+    """
+    Size- and TTL-bounded LRU cache of retrieved QKD keys.
+    Key material is held in bytearrays so evicted entries can be zeroized
+    in place instead of waiting for the garbage collector. on_evict(key_id)
+    runs after a key leaves or is (re)stored in the cache (on_evict(None)
+    after zeroize), so anything derived from the key can be dropped along
+    with it.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=300, on_evict=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _wipe(buf):
+        # Same-length slice assignment overwrites the buffer in place
+        buf[:] = bytes(len(buf))
+
+    def _evicted(self, key_ids):
+        # Called outside the lock: the hook may take locks of its own
+        if self.on_evict is not None:
+            for key_id in key_ids:
+                self.on_evict(key_id)
+
+    def get(self, key_id):
+        with self._lock:
+            entry = self._entries.get(key_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, buf = entry
+            if expires_at >= time.monotonic():
+                self._entries.move_to_end(key_id)
+                self.hits += 1
+                return bytes(buf)
+            del self._entries[key_id]
+            self._wipe(buf)
+            self.evictions += 1
+            self.misses += 1
+        self._evicted([key_id])
+        return None
+
+    def put(self, key_id, key_bytes):
+        with self._lock:
+            old = self._entries.pop(key_id, None)
+            if old is not None:
+                self._wipe(old[1])
+            self._entries[key_id] = (time.monotonic() + self.ttl_seconds, bytearray(key_bytes))
+            # Whatever was derived from earlier material for this id is stale
+            evicted = [key_id]
+            while len(self._entries) > self.max_entries:
+                old_id, (_, buf) = self._entries.popitem(last=False)
+                self._wipe(buf)
+                evicted.append(old_id)
+            self.evictions += len(evicted) - 1
+        self._evicted(evicted)
+
+    def evict(self, key_id):
+        with self._lock:
+            entry = self._entries.pop(key_id, None)
+            if entry is not None:
+                self._wipe(entry[1])
+                self.evictions += 1
+        self._evicted([key_id])
+
+    def evict_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key_id for key_id, (expires_at, _) in self._entries.items() if expires_at < now]
+            for key_id in expired:
+                self._wipe(self._entries.pop(key_id)[1])
+            self.evictions += len(expired)
+        self._evicted(expired)
+        return len(expired)
+
+    def zeroize(self):
+        """Wipe and drop every cached key."""
+        with self._lock:
+            for _, buf in self._entries.values():
+                self._wipe(buf)
+            self._entries.clear()
+        self._evicted([None])
+
+    def __contains__(self, key_id):
+        with self._lock:
+            entry = self._entries.get(key_id)
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,102 @@
+import collections
+import threading
+import time
+
+
+class KeyPool:
+    """
+    Local pool of pre-fetched QKD keys.
+    Keys are handed out at most once; a background thread tops the pool up
+    in bulk whenever it drops below the low-water mark.
+    """
+
+    def __init__(self, fetch_bulk, low_water=16, batch_size=64, max_size=256, retry_delay=5.0):
+        self._fetch_bulk = fetch_bulk
+        self.low_water = low_water
+        self.batch_size = batch_size
+        self.max_size = max_size
+        self.retry_delay = retry_delay
+        self._keys = collections.deque()
+        self._lock = threading.Lock()
+        self._refill_needed = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_failures = 0
+        self.last_refill_ms = 0.0
+        self.total_refill_ms = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="qkd-key-pool", daemon=True)
+                self._thread.start()
+        self._refill_needed.set()
+
+    def take_nowait(self):
+        """Pop a pooled key, or return None (and schedule a refill) when the pool is dry."""
+        if self._thread is None:
+            self.start()
+        with self._lock:
+            if self._keys:
+                self.hits += 1
+                entry = self._keys.popleft()
+                if len(self._keys) < self.low_water:
+                    self._refill_needed.set()
+                return entry
+            self.misses += 1
+        self._refill_needed.set()
+        return None
+
+    def take(self):
+        entry = self.take_nowait()
+        if entry is not None:
+            return entry
+        # Pool is dry: fall back to a direct round trip for this one key
+        keys = self._fetch_bulk(1)
+        if keys:
+            return keys[0]
+        return None, None
+
+    def _refill(self):
+        with self._lock:
+            wanted = min(self.batch_size, self.max_size - len(self._keys))
+        if wanted <= 0:
+            return True
+        started = time.perf_counter()
+        keys = self._fetch_bulk(wanted)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if not keys:
+            self.refill_failures += 1
+            return False
+        with self._lock:
+            self._keys.extend(keys)
+            self.refills += 1
+            self.last_refill_ms = elapsed_ms
+            self.total_refill_ms += elapsed_ms
+        return True
+
+    def _run(self):
+        while True:
+            self._refill_needed.wait()
+            self._refill_needed.clear()
+            while len(self._keys) < self.max_size:
+                if not self._refill():
+                    # KM unreachable: back off, then try again
+                    time.sleep(self.retry_delay)
+                    self._refill_needed.set()
+                    break
+
+    def stats(self):
+        with self._lock:
+            size = len(self._keys)
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refills": self.refills,
+            "refill_failures": self.refill_failures,
+            "last_refill_ms": round(self.last_refill_ms, 2),
+            "avg_refill_ms": round(self.total_refill_ms / self.refills, 2) if self.refills else 0.0,
+        }
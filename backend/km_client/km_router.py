@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+# Key_ids minted by a sharded KM carry their shard: "<shard>.<uuid>".
+# Unprefixed key_ids come from an unsharded KM (or predate sharding).
+SHARD_SEPARATOR = "."
+
+
+def shard_of(key_id):
+    shard, sep, _ = key_id.partition(SHARD_SEPARATOR)
+    return shard if sep else None
+
+
+class KMNode:
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.in_flight = 0
+        self.ewma_ms = 0.0
+        self.down_until = 0.0
+        self.failures = 0
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "in_flight": self.in_flight,
+            "ewma_ms": round(self.ewma_ms, 2),
+            "down": self.down_until > time.monotonic(),
+            "failures": self.failures,
+        }
+
+
+class KMRouter:
+    """
+    Routes KM calls across a set of simulator nodes, each owning one shard
+    of key_ids. Retrievals go to the node named in the key_id; new keys are
+    fetched from the least loaded healthy node (fewest requests in flight,
+    then lowest recent latency). A node that fails a request is skipped for
+    retry_after seconds and the call moves on to the next candidate.
+    """
+
+    def __init__(self, nodes, retry_after=5.0, ewma_alpha=0.2):
+        self.nodes = nodes
+        self.retry_after = retry_after
+        self.ewma_alpha = ewma_alpha
+        self._by_name = {node.name: node for node in nodes}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        KM_NODES="km0=http://localhost:8001,km1=http://localhost:8002" names
+        each node after the shard it serves (KM_SHARD_ID on that node). A bare
+        URL gets the name km<position>. Without KM_NODES, KM_URL is a single
+        unsharded node.
+        """
+        spec = os.environ.get("KM_NODES", "").strip()
+        if not spec:
+            nodes = [KMNode("", os.environ.get("KM_URL", "http://localhost:8001"))]
+        else:
+            nodes = []
+            for i, entry in enumerate(part.strip() for part in spec.split(",") if part.strip()):
+                name, sep, url = entry.partition("=")
+                nodes.append(KMNode(name, url) if sep else KMNode(f"km{i}", entry))
+        return cls(nodes, retry_after=float(os.environ.get("KM_NODE_RETRY_AFTER", "5")))
+
+    def _healthy_first(self, nodes):
+        # Nodes marked down still come last: the mark may be stale, and trying is better than failing outright
+        now = time.monotonic()
+        return [n for n in nodes if n.down_until <= now] + [n for n in nodes if n.down_until > now]
+
+    def by_load(self):
+        with self._lock:
+            ranked = sorted(self.nodes, key=lambda n: (n.in_flight, n.ewma_ms))
+        return self._healthy_first(ranked)
+
+    def owners(self, key_id):
+        """Candidate nodes for a key_id, its owning node first."""
+        owner = self._by_name.get(shard_of(key_id) or "")
+        if owner is not None:
+            return [owner]
+        # Unknown or missing shard: the key can only be on one node, but we don't know which
+        return self._healthy_first(self.nodes)
+
+    def group_by_owner(self, key_ids):
+        """
+        Split key_ids into {node: [key_id, ...]} by owning node. As in
+        owners(), an id without a known shard is asked of every node, so it
+        lands in each node's list.
+        """
+        groups = {}
+        for key_id in key_ids:
+            owner = self._by_name.get(shard_of(key_id) or "")
+            for node in [owner] if owner is not None else self.nodes:
+                groups.setdefault(node, []).append(key_id)
+        return groups
+
+    def started(self, node):
+        with self._lock:
+            node.in_flight += 1
+
+    def finished(self, node, elapsed_ms, ok):
+        with self._lock:
+            node.in_flight -= 1
+            if ok:
+                node.ewma_ms += self.ewma_alpha * (elapsed_ms - node.ewma_ms) if node.ewma_ms else elapsed_ms
+                node.down_until = 0.0
+            else:
+                node.failures += 1
+                node.down_until = time.monotonic() + self.retry_after
+
+    def stats(self):
+        return {node.name or "default": node.stats() for node in self.nodes}
@@ -1,31 +1,282 @@
-import requests
+import asyncio
 import base64
+import os
+import struct
+import time
 
-def fetch_qkd_key(slave_id="slave1"):
+import httpx
+
+from http_pool import HostPool
+from metrics import km_latency
+from km_client.key_pool import KeyPool
+from km_client.key_cache import KeyCache
+from km_client.km_router import KMRouter
+from encryption.crypto_plugins.quantum_aes import evict_quantum_aes_context
+
+# KM_NODES lists a sharded KM cluster; KM_URL alone is one unsharded node
+km_router = KMRouter.from_env()
+KM_URL = km_router.nodes[0].url
+
+# One keep-alive pool for every KM call made by this process
+km_http = HostPool("km", max_connections=20, max_keepalive=10, per_host_limit=16, timeout=3.0)
+
+def _record(node, operation, start, response):
+    elapsed = time.perf_counter() - start
+    # Only a transport error or a 5xx takes the node out of rotation; a 4xx is the caller's problem
+    km_router.finished(node, elapsed * 1000, response is not None and response.status_code < 500)
+    km_latency.observe(elapsed, operation, "ok" if response is not None and response.status_code < 400 else "error")
+
+def _km_request_sync(operation, method, path, nodes, **kwargs):
+    """Send to the first of `nodes` that answers; transport errors and 5xx fail over to the next."""
+    error = None
+    for node in nodes:
+        start = time.perf_counter()
+        km_router.started(node)
+        response = None
+        try:
+            response = km_http.request_sync(method, node.url + path, **kwargs)
+        except httpx.TransportError as e:
+            error = e
+        finally:
+            _record(node, operation, start, response)
+        if response is not None:
+            if response.status_code < 500:
+                return response
+            error = RuntimeError(f"KM node {node.url} answered {response.status_code}")
+    raise error or RuntimeError("No KM nodes configured")
+
+async def _km_request(operation, method, path, nodes, **kwargs):
+    error = None
+    for node in nodes:
+        start = time.perf_counter()
+        km_router.started(node)
+        response = None
+        try:
+            response = await km_http.request(method, node.url + path, **kwargs)
+        except httpx.TransportError as e:
+            error = e
+        finally:
+            _record(node, operation, start, response)
+        if response is not None:
+            if response.status_code < 500:
+                return response
+            error = RuntimeError(f"KM node {node.url} answered {response.status_code}")
+    raise error or RuntimeError("No KM nodes configured")
+
+def _decode_keys(data):
+    entries = data["keys"] if "keys" in data else [data]
+    return [(entry["key_id"], base64.b64decode(entry["key"])) for entry in entries]
+
+# Binary bulk transport (GET /keys/{slave_id}/bulk), one frame per key:
+#   [key_id length: u16][key length: u32][key_id][key]
+KEY_FRAME_HEADER = struct.Struct(">HI")
+# Cleared the first time the KM answers 404, i.e. it predates the binary endpoint
+_binary_transport = {"supported": os.environ.get("QKD_BINARY_TRANSPORT", "1") != "0"}
+
+def _decode_key_frames(body):
+    """
+    Split a binary bulk response into (key_id, key) pairs. Each key is its
+    own bytearray: a pooled key must not keep the whole response body (and
+    so every other key in it) alive, and a bytearray can be wiped in place.
+    """
+    view = memoryview(body)
+    keys = []
+    offset = 0
+    while offset < len(view):
+        id_len, key_len = KEY_FRAME_HEADER.unpack_from(view, offset)
+        offset += KEY_FRAME_HEADER.size
+        key_id = str(view[offset:offset + id_len], "ascii")
+        offset += id_len
+        keys.append((key_id, bytearray(view[offset:offset + key_len])))
+        offset += key_len
+    if offset != len(view):
+        raise ValueError("Truncated key frame in KM response")
+    return keys
+
+def _decode_fetch(response, binary):
+    response.raise_for_status()
+    return _decode_key_frames(response.content) if binary else _decode_keys(response.json())
+
+def _fetch_path(slave_id, binary):
+    return f"/keys/{slave_id}/bulk" if binary else f"/keys/{slave_id}"
+
+def fetch_qkd_keys(number=1, slave_id="slave1"):
+    # Any node can mint: start with the least loaded one
     try:
-        response = requests.get(f"http://localhost:8001/keys/{slave_id}?number=1", timeout=3)
-        data = response.json()
-        key_id = data.get("key_id")
-        key_b64 = data.get("key")
-        key_bytes = base64.b64decode(key_b64)
-        return key_id, key_bytes
+        binary = _binary_transport["supported"]
+        params = {"number": number}
+        response = _km_request_sync("fetch", "GET", _fetch_path(slave_id, binary), km_router.by_load(), params=params)
+        if binary and response.status_code == 404:
+            _binary_transport["supported"] = binary = False
+            response = _km_request_sync("fetch", "GET", _fetch_path(slave_id, binary), km_router.by_load(), params=params)
+        return _decode_fetch(response, binary)
     except Exception:
         # Silently fail on production if simulator isn't running
-        return None, None
-        
-def retrieve_qkd_key(key_id):
+        return []
+
+async def fetch_qkd_keys_async(number=1, slave_id="slave1"):
     try:
-        response = requests.get(f"http://localhost:8001/keys/retrieve/{key_id}", timeout=3)
-        data = response.json()
-        if "key" in data:
-            return base64.b64decode(data["key"])
+        binary = _binary_transport["supported"]
+        params = {"number": number}
+        response = await _km_request("fetch", "GET", _fetch_path(slave_id, binary), km_router.by_load(), params=params)
+        if binary and response.status_code == 404:
+            _binary_transport["supported"] = binary = False
+            response = await _km_request("fetch", "GET", _fetch_path(slave_id, binary), km_router.by_load(), params=params)
+        return _decode_fetch(response, binary)
     except Exception:
-        pass
+        return []
+
+key_pool = KeyPool(
+    fetch_qkd_keys,
+    low_water=int(os.environ.get("QKD_POOL_LOW_WATER", "16")),
+    batch_size=int(os.environ.get("QKD_POOL_BATCH", "64")),
+    max_size=int(os.environ.get("QKD_POOL_MAX", "256")),
+)
+
+key_cache = KeyCache(
+    max_entries=int(os.environ.get("QKD_CACHE_MAX", "1024")),
+    ttl_seconds=int(os.environ.get("QKD_CACHE_TTL", "300")),
+    # The AES-GCM context derived from a key goes with it
+    on_evict=evict_quantum_aes_context,
+)
+
+def _issue(entry):
+    key_id, key_bytes = entry
+    if key_id and key_bytes:
+        # The local inbox will need this key again to decrypt; skip the KM for it
+        key_cache.put(key_id, key_bytes)
+    return key_id, key_bytes
+
+async def fetch_qkd_key(slave_id="slave1"):
+    # Served from the local pre-fetched pool; each key is handed out once
+    entry = key_pool.take_nowait()
+    if entry is None:
+        keys = await fetch_qkd_keys_async(1, slave_id)
+        entry = keys[0] if keys else (None, None)
+    return _issue(entry)
+
+def fetch_qkd_key_sync(slave_id="slave1"):
+    return _issue(key_pool.take())
+
+async def issue_qkd_keys(number, slave_id="slave1"):
+    """
+    Up to number keys for a multi-message send: one bulk KM request, with
+    any shortfall taken from the local pool. May return fewer than asked.
+    """
+    keys = await fetch_qkd_keys_async(number, slave_id) if number else []
+    while len(keys) < number:
+        entry = key_pool.take_nowait()
+        if entry is None:
+            break
+        keys.append(entry)
+    return [_issue(entry) for entry in keys]
+
+def _cache_retrieved(key_id, data):
+    if "key" in data:
+        key_bytes = base64.b64decode(data["key"])
+        key_cache.put(key_id, key_bytes)
+        return key_bytes
     return b"0" * 1024 # Fallback to match encryption phase
 
-def fetch_key_stats():
-    try:
-        response = requests.get("http://localhost:8001/stats", timeout=3)
-        return response.json().get("remaining_keys", 4289)
-    except Exception:
-        return 4289
+# A key lives only on the node that minted it, so retrievals go to its owner.
+# Key_ids without a known shard are looked for on each node in turn.
+async def retrieve_qkd_key(key_id):
+    cached = key_cache.get(key_id)
+    if cached is not None:
+        return cached
+    for node in km_router.owners(key_id):
+        try:
+            response = await _km_request("retrieve", "GET", f"/keys/retrieve/{key_id}", [node])
+            data = response.json()
+            if "key" in data:
+                return _cache_retrieved(key_id, data)
+        except Exception:
+            continue
+    return b"0" * 1024
+
+def retrieve_qkd_key_sync(key_id):
+    cached = key_cache.get(key_id)
+    if cached is not None:
+        return cached
+    for node in km_router.owners(key_id):
+        try:
+            response = _km_request_sync("retrieve", "GET", f"/keys/retrieve/{key_id}", [node])
+            data = response.json()
+            if "key" in data:
+                return _cache_retrieved(key_id, data)
+        except Exception:
+            continue
+    return b"0" * 1024
+
+async def retrieve_qkd_keys(key_ids):
+    """Warm the key cache for many key_ids with a single bulk KM request."""
+    missing = [key_id for key_id in dict.fromkeys(key_ids) if key_id and key_id not in key_cache]
+    if not missing:
+        return
+
+    async def from_node(node, node_key_ids):
+        try:
+            response = await _km_request("retrieve_bulk", "POST", "/keys/retrieve", [node], json={"key_ids": node_key_ids})
+            for entry in response.json().get("keys", []):
+                key_cache.put(entry["key_id"], base64.b64decode(entry["key"]))
+        except Exception:
+            # Individual lookups in retrieve_qkd_key still apply their own fallback
+            pass
+
+    # One bulk request per owning node, all in flight together
+    await asyncio.gather(*(from_node(node, ids) for node, ids in km_router.group_by_owner(missing).items()))
+
+def retrieve_qkd_keys_sync(key_ids):
+    """
+    {key_id: key_bytes} for the key_ids the KM still holds, one bulk request
+    per owning node. Bypasses the key cache, so a long stream of one-shot
+    keys does not evict the inbox's working set; missing keys are simply absent.
+    """
+    found = {}
+    for node, node_key_ids in km_router.group_by_owner(list(dict.fromkeys(key_ids))).items():
+        try:
+            response = _km_request_sync("retrieve_bulk", "POST", "/keys/retrieve", [node], json={"key_ids": node_key_ids})
+            for entry in response.json().get("keys", []):
+                found[entry["key_id"]] = base64.b64decode(entry["key"])
+        except Exception:
+            continue
+    return found
+
+def consume_qkd_keys_sync(key_ids):
+    """
+    Retire key_ids at the KM nodes that own them (retrieve with consume=true)
+    and drop any cached copies. Returns how many the KM still held; raises
+    if a node could not be reached, so the caller can try again later.
+    """
+    key_ids = list(dict.fromkeys(key_id for key_id in key_ids if key_id))
+    consumed = 0
+    for node, node_key_ids in km_router.group_by_owner(key_ids).items():
+        response = _km_request_sync("consume", "POST", "/keys/retrieve", [node], json={"key_ids": node_key_ids, "consume": True})
+        response.raise_for_status()
+        consumed += len(response.json().get("keys", []))
+    for key_id in key_ids:
+        key_cache.evict(key_id)
+    return consumed
+
+# The dashboard polls constantly; the KM pool depth only needs to be roughly fresh
+KEY_STATS_TTL = float(os.environ.get("QKD_STATS_TTL", "5"))
+_key_stats = {"value": None, "expires_at": 0.0}
+
+async def fetch_key_stats():
+    now = time.monotonic()
+    if _key_stats["value"] is not None and now < _key_stats["expires_at"]:
+        return _key_stats["value"]
+
+    async def node_remaining(node):
+        try:
+            response = await _km_request("stats", "GET", "/stats", [node])
+            return response.json().get("remaining_keys")
+        except Exception:
+            return None
+
+    # Cluster depth is the sum over the nodes that answered
+    counts = [c for c in await asyncio.gather(*(node_remaining(node) for node in km_router.nodes)) if c is not None]
+    remaining = sum(counts) if counts else 4289
+    _key_stats["value"] = remaining
+    _key_stats["expires_at"] = now + KEY_STATS_TTL
+    return remaining
@@ -0,0 +1,243 @@
+import datetime
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+
+import models
+from database import SessionLocal
+from mail_client.smtp_client import send_email as send_real_smtp
+
+PENDING = "PENDING"
+IN_FLIGHT = "IN_FLIGHT"
+SENT = "SENT"
+DEAD = "DEAD"
+
+
+class DispatchQueue:
+    """
+    Drains the outbound_queue table through the mail bridge.
+    A single poller claims due rows in batches, never more than there are
+    idle workers, and hands them to a bounded worker pool. Failures are
+    retried with exponential backoff and dead-lettered after max_attempts.
+    Rows left IN_FLIGHT longer than the lease (e.g. by a crashed process)
+    are re-queued on start and periodically after that.
+    """
+
+    def __init__(self, workers=4, batch_size=20, max_attempts=6, base_delay=2.0, max_delay=600.0,
+                 poll_interval=2.0, lease_seconds=120, send=send_real_smtp):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._send = send
+        self._slots = threading.Semaphore(workers)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._executor = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._recover()
+        self._scrub_sent()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="outbound-dispatch")
+        self._thread = threading.Thread(target=self._run, name="outbound-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        self._wake.set()
+        # start() may still be recovering leases when a shutdown arrives
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._thread = None
+        self._executor = None
+        self._stop.clear()
+
+    def wake(self):
+        """Signal that new rows were enqueued so the poller doesn't wait out its interval."""
+        self._wake.set()
+
+    def _recover(self):
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.lease_seconds)
+        db = SessionLocal()
+        try:
+            recovered = db.query(models.OutboundDispatch).filter(
+                models.OutboundDispatch.state == IN_FLIGHT,
+                models.OutboundDispatch.updated_at < cutoff
+            ).update({"state": PENDING}, synchronize_session=False)
+            db.commit()
+            if recovered:
+                print(f"🔁 [QUEUE] Re-queued {recovered} dispatches whose lease expired")
+        except Exception as e:
+            print(f"❌ [QUEUE] Recovery failed: {e}")
+        finally:
+            db.close()
+
+    def _scrub_sent(self):
+        # Delivered rows written before payloads were dropped on delivery
+        db = SessionLocal()
+        try:
+            scrubbed = db.query(models.OutboundDispatch).filter(
+                models.OutboundDispatch.state == SENT,
+                models.OutboundDispatch.ciphertext.isnot(None)
+            ).update({"ciphertext": None, "nonce": None}, synchronize_session=False)
+            db.commit()
+            if scrubbed:
+                print(f"🧹 [QUEUE] Dropped the payload copies of {scrubbed} delivered dispatches")
+        except Exception as e:
+            print(f"❌ [QUEUE] Scrub failed: {e}")
+        finally:
+            db.close()
+
+    def _claim(self, limit):
+        now = datetime.datetime.utcnow()
+        db = SessionLocal()
+        try:
+            candidates = db.query(models.OutboundDispatch.id).filter(
+                models.OutboundDispatch.state == PENDING,
+                models.OutboundDispatch.next_attempt_at <= now
+            ).order_by(models.OutboundDispatch.next_attempt_at).limit(limit).all()
+            claimed = []
+            for (dispatch_id,) in candidates:
+                # Conditional update so concurrent processes never claim the same row
+                updated = db.query(models.OutboundDispatch).filter(
+                    models.OutboundDispatch.id == dispatch_id,
+                    models.OutboundDispatch.state == PENDING
+                ).update({"state": IN_FLIGHT, "updated_at": now}, synchronize_session=False)
+                if updated:
+                    claimed.append(dispatch_id)
+            db.commit()
+            if not claimed:
+                return []
+            rows = db.query(models.OutboundDispatch).filter(models.OutboundDispatch.id.in_(claimed)).all()
+            db.expunge_all()
+            return rows
+        finally:
+            db.close()
+
+    def _run(self):
+        last_recovery = time.monotonic()
+        while not self._stop.is_set():
+            if time.monotonic() - last_recovery > self.lease_seconds:
+                self._recover()
+                last_recovery = time.monotonic()
+            idle = 0
+            while idle < self.batch_size and self._slots.acquire(blocking=False):
+                idle += 1
+            if idle == 0:
+                # Every worker is busy: wait for one to free up instead of claiming more
+                if not self._slots.acquire(timeout=self.poll_interval):
+                    continue
+                idle = 1
+            try:
+                rows = self._claim(idle)
+            except Exception as e:
+                print(f"❌ [QUEUE] Claim failed: {e}")
+                rows = []
+            for row in rows:
+                self._executor.submit(self._deliver, row)
+            for _ in range(idle - len(rows)):
+                self._slots.release()
+            if len(rows) < idle:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _deliver(self, row):
+        try:
+            try:
+                success = self._send(
+                    row.sender,
+                    None,
+                    row.recipient,
+                    row.ciphertext,
+                    row.security_level,
+                    row.key_id,
+                    row.nonce,
+                    f"QuMail: {row.subject} (from {row.sender})"
+                )
+                error = None if success else "Bridge rejected the dispatch"
+            except Exception as e:
+                success, error = False, str(e)
+            self._record(row, success, error)
+        finally:
+            self._slots.release()
+            # A freed worker may mean more due rows can be claimed right away
+            self._wake.set()
+
+    def _record(self, row, success, error):
+        now = datetime.datetime.utcnow()
+        attempts = (row.attempts or 0) + 1
+        values = {"attempts": attempts, "updated_at": now, "last_error": error}
+        if success:
+            values["state"] = SENT
+            # The emails row keeps the ciphertext; the queue's copy was only for the bridge
+            values["ciphertext"] = None
+            values["nonce"] = None
+            print(f"✅ [QUEUE] Delivered dispatch {row.id} to {row.recipient}")
+        elif attempts >= self.max_attempts:
+            values["state"] = DEAD
+            print(f"☠️ [QUEUE] Dispatch {row.id} to {row.recipient} dead-lettered after {attempts} attempts: {error}")
+        else:
+            delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+            values["state"] = PENDING
+            values["next_attempt_at"] = now + datetime.timedelta(seconds=delay)
+            print(f"⏳ [QUEUE] Dispatch {row.id} failed ({error}); retry {attempts}/{self.max_attempts} in {delay:.0f}s")
+        db = SessionLocal()
+        try:
+            db.query(models.OutboundDispatch).filter(models.OutboundDispatch.id == row.id).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+def enqueue_dispatch(db, email, ciphertext, nonce=None):
+    """Add the bridge dispatch for a stored email to the caller's transaction."""
+    dispatch = models.OutboundDispatch(
+        email_id=email.id,
+        sender=email.sender,
+        recipient=email.recipient,
+        subject=email.subject,
+        ciphertext=ciphertext,
+        security_level=email.security_level,
+        key_id=email.key_id,
+        nonce=nonce,
+        state=PENDING
+    )
+    db.add(dispatch)
+    return dispatch
+
+
+def queue_status(db):
+    counts = dict(
+        db.query(models.OutboundDispatch.state, func.count(models.OutboundDispatch.id))
+        .group_by(models.OutboundDispatch.state).all()
+    )
+    dead = db.query(models.OutboundDispatch).filter(models.OutboundDispatch.state == DEAD) \
+        .order_by(models.OutboundDispatch.id.desc()).limit(10).all()
+    return {
+        "pending": counts.get(PENDING, 0),
+        "in_flight": counts.get(IN_FLIGHT, 0),
+        "sent": counts.get(SENT, 0),
+        "dead": counts.get(DEAD, 0),
+        "recent_dead_letters": [
+            {"id": d.id, "email_id": d.email_id, "recipient": d.recipient, "attempts": d.attempts, "last_error": d.last_error}
+            for d in dead
+        ]
+    }
+
+
+dispatch_queue = DispatchQueue(
+    workers=int(os.environ.get("OUTBOUND_WORKERS", "4")),
+    batch_size=int(os.environ.get("OUTBOUND_BATCH", "20")),
+    max_attempts=int(os.environ.get("OUTBOUND_MAX_ATTEMPTS", "6")),
+)
@@ -1,46 +1,345 @@
+import base64
+import datetime
+import hashlib
+import hmac
 import imaplib
 import email
 import json
+import os
+import re
+import threading
+import time
+from email.parser import BytesHeaderParser
+from email.utils import parseaddr
+
+import models
+from email_storage import LEVEL_ALGORITHMS, PLAIN
+
+IMAP_HOST = os.environ.get("IMAP_HOST", "imap.gmail.com")
+IMAP_PORT = int(os.environ.get("IMAP_PORT", "993"))
+IMAP_SSL = os.environ.get("IMAP_SSL", "1") != "0"
+
+# UIDs requested per UID FETCH round trip
+SYNC_BATCH = int(os.environ.get("IMAP_SYNC_BATCH", "500"))
+
+_UID_RE = re.compile(rb"UID (\d+)")
+_BODY_FROM_RE = re.compile(r"^FROM: (.+)$", re.MULTILINE)
+_SUBJECT_RE = re.compile(r"^QuMail: (.*?)(?: \(from [^)]*\))?$", re.DOTALL)
+_header_parser = BytesHeaderParser()
+
+
+class IMAPConnectionPool:
+    """
+    Keeps logged-in IMAP connections per (host, port, user, credential) for
+    reuse. The credential part is an HMAC of the password under a per-process
+    secret, so a pooled session is only handed to a caller presenting the
+    password it logged in with. Connections are checked with NOOP when
+    leased and replaced if stale.
+    """
+
+    def __init__(self, max_per_account=2, idle_check_seconds=30):
+        self.max_per_account = max_per_account
+        self.idle_check_seconds = idle_check_seconds
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._secret = os.urandom(32)
+
+    def _account(self, host, port, user, password):
+        credential = hmac.new(self._secret, password.encode("utf-8"), hashlib.sha256).digest()
+        return host, port, user, credential
+
+    def _connect(self, host, port, use_ssl, user, password):
+        conn = imaplib.IMAP4_SSL(host, port) if use_ssl else imaplib.IMAP4(host, port)
+        conn.login(user, password)
+        return conn
+
+    def acquire(self, user, password, host=IMAP_HOST, port=IMAP_PORT, use_ssl=IMAP_SSL):
+        account = self._account(host, port, user, password)
+        while True:
+            with self._lock:
+                idle = self._idle.get(account)
+                entry = idle.pop() if idle else None
+            if entry is None:
+                return self._connect(host, port, use_ssl, user, password)
+            conn, last_used = entry
+            if time.monotonic() - last_used < self.idle_check_seconds:
+                return conn
+            try:
+                conn.noop()
+                return conn
+            except Exception:
+                self.discard(conn)
+
+    def release(self, conn, user, password, host=IMAP_HOST, port=IMAP_PORT):
+        account = self._account(host, port, user, password)
+        with self._lock:
+            idle = self._idle.setdefault(account, [])
+            if len(idle) < self.max_per_account:
+                idle.append((conn, time.monotonic()))
+                return
+        self.discard(conn)
+
+    def discard(self, conn):
+        try:
+            conn.logout()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            entries = [conn for idle in self._idle.values() for conn, _ in idle]
+            self._idle.clear()
+        for conn in entries:
+            self.discard(conn)
+
+
+imap_pool = IMAPConnectionPool()
+
+
+def _fetch_items(conn, uid_set, item):
+    """One UID FETCH round trip; returns {uid: payload bytes} for the literal of `item`."""
+    typ, data = conn.uid("FETCH", uid_set, f"(UID {item})")
+    if typ != "OK":
+        raise imaplib.IMAP4.error(f"UID FETCH {uid_set} failed: {data}")
+    found = {}
+    for part in data:
+        if isinstance(part, tuple):
+            match = _UID_RE.search(part[0])
+            if match:
+                found[int(match.group(1))] = part[1]
+    return found
+
+
+def _search_uids_after(conn, last_uid):
+    """UIDs above last_uid, ascending, in one UID SEARCH round trip."""
+    typ, data = conn.uid("SEARCH", "UID", f"{last_uid + 1}:*")
+    if typ != "OK":
+        raise imaplib.IMAP4.error(f"UID SEARCH failed: {data}")
+    # n:* always matches the highest UID, even when it is below n
+    return sorted(uid for uid in map(int, (data[0] or b"").split()) if uid > last_uid)
+
+
+def _uid_set(uids):
+    """Compact IMAP sequence set for ascending uids, e.g. 3:7,12,20:21."""
+    ranges = []
+    start = prev = uids[0]
+    for uid in uids[1:]:
+        if uid != prev + 1:
+            ranges.append((start, prev))
+            start = uid
+        prev = uid
+    ranges.append((start, prev))
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def _mailbox_state(conn, mailbox):
+    typ, data = conn.select(mailbox, readonly=True)
+    if typ != "OK":
+        raise imaplib.IMAP4.error(f"SELECT {mailbox} failed: {data}")
+    exists = int(data[0] or 0)
+    uidvalidity = conn.response("UIDVALIDITY")[1][0]
+    uidnext = conn.response("UIDNEXT")[1][0]
+    if uidvalidity is None or uidnext is None:
+        typ, data = conn.status(mailbox, "(UIDVALIDITY UIDNEXT)")
+        fields = dict(re.findall(rb"(UIDVALIDITY|UIDNEXT) (\d+)", data[0]))
+        uidvalidity, uidnext = fields[b"UIDVALIDITY"], fields[b"UIDNEXT"]
+    return exists, int(uidvalidity), int(uidnext)
+
+
+def _text_body(msg):
+    if msg.is_multipart():
+        for part in msg.walk():
+            if part.get_content_type() == "text/plain":
+                return part.get_payload(decode=True).decode(errors="replace")
+        return ""
+    payload = msg.get_payload(decode=True)
+    return payload.decode(errors="replace") if payload else ""
+
+
+def parse_secure_envelope(body):
+    """Extract the QuMail JSON payload from a dispatched email body, or None."""
+    start, end = body.find("{"), body.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        structured = json.loads(body[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(structured, dict) or not structured.get("qumail_secure_payload"):
+        return None
+    return structured
+
+
+def envelope_payload(envelope):
+    """(algorithm, ciphertext, nonce) columns for a bridge envelope."""
+    ciphertext = envelope.get("ciphertext", "")
+    algorithm = LEVEL_ALGORITHMS.get(envelope.get("security_level"))
+    if algorithm is None:
+        return PLAIN, ciphertext.encode("utf-8"), None
+    nonce = envelope.get("nonce")
+    return algorithm, base64.b64decode(ciphertext), base64.b64decode(nonce) if nonce else None
+
+
+def _load_sync_state(db, account, mailbox):
+    return db.query(models.ImapSyncState).filter(
+        models.ImapSyncState.account == account,
+        models.ImapSyncState.mailbox == mailbox
+    ).first()
+
+
+def _store_envelopes(db, user, candidates, bodies):
+    """Add Email rows for QuMail envelopes not already in the table; returns how many were added."""
+    parsed = []
+    for uid, raw in sorted(bodies.items()):
+        # Whole message: providers re-encode bodies (quoted-printable, base64,
+        # multipart alternatives), so the text part is decoded through MIME
+        text = _text_body(email.message_from_bytes(raw))
+        envelope = parse_secure_envelope(text)
+        if envelope is not None:
+            # The bridge sends from its own account; the QuMail sender is in the banner
+            original_sender = _BODY_FROM_RE.search(text)
+            subject = _SUBJECT_RE.match(candidates[uid].get("Subject") or "")
+            parsed.append((
+                original_sender.group(1).strip() if original_sender else candidates[uid].get("From"),
+                subject.group(1) if subject else candidates[uid].get("Subject"),
+                parseaddr(candidates[uid].get("To") or "")[1] or user,
+                envelope
+            ))
+    if not parsed:
+        return 0
+    # A key is only ever used for one message, so key_id identifies an envelope
+    # already stored by a previous sync (or sent from this server)
+    key_ids = [envelope.get("key_id") for *_, envelope in parsed if envelope.get("key_id")]
+    known = set()
+    if key_ids:
+        known = {k for (k,) in db.query(models.Email.key_id).filter(models.Email.key_id.in_(key_ids)).all()}
+    added = 0
+    for sender, subject, recipient, envelope in parsed:
+        key_id = envelope.get("key_id")
+        if key_id and key_id in known:
+            continue
+        try:
+            algorithm, ciphertext, nonce = envelope_payload(envelope)
+        except ValueError:
+            print(f"❌ [IMAP] Skipping envelope {key_id}: malformed base64")
+            continue
+        db.add(models.Email(
+            sender=sender,
+            recipient=recipient,
+            subject=subject,
+            ciphertext=ciphertext,
+            nonce=nonce,
+            algorithm=algorithm,
+            security_level=envelope.get("security_level", 1),
+            key_id=key_id
+        ))
+        if key_id:
+            known.add(key_id)
+        added += 1
+    return added
+
+
+def sync_mailbox(user, password, db, mailbox="INBOX", host=IMAP_HOST, port=IMAP_PORT, use_ssl=IMAP_SSL,
+                 batch=SYNC_BATCH, on_stored=None):
+    """
+    Incrementally pull QuMail envelopes that arrived since the last sync into
+    the emails table.
+
+    One UID SEARCH lists the UIDs above the stored high-water mark, so round
+    trips follow the number of new messages, not the UID span of a sparse
+    mailbox. Headers are fetched with one UID FETCH per `batch` of them;
+    full messages are fetched (again in one round trip per batch) only for
+    those whose subject marks them as QuMail dispatches. A changed
+    UIDVALIDITY restarts from UID 1. Every batch commits its emails together
+    with the new high-water mark; on_stored(db, n) runs inside that transaction.
+    """
+    account = f"{user}@{host}"
+    conn = imap_pool.acquire(user, password, host, port, use_ssl)
+    stats = {"fetched_headers": 0, "fetched_bodies": 0, "stored": 0, "round_trips": 1}
+    try:
+        _, uidvalidity, uidnext = _mailbox_state(conn, mailbox)
+        state = _load_sync_state(db, account, mailbox)
+        if state is None:
+            state = models.ImapSyncState(account=account, mailbox=mailbox, uidvalidity=uidvalidity, last_uid=0)
+            db.add(state)
+        elif state.uidvalidity != uidvalidity:
+            print(f"🔁 [IMAP] UIDVALIDITY changed for {account}/{mailbox}; resyncing from UID 1")
+            state.uidvalidity = uidvalidity
+            state.last_uid = 0
+        last_uid = state.last_uid
+        highest = uidnext - 1
+        uids = []
+        if last_uid < highest:
+            uids = _search_uids_after(conn, last_uid)
+            stats["round_trips"] += 1
+        for start in range(0, len(uids), batch):
+            chunk = uids[start:start + batch]
+            upper = chunk[-1]
+            headers = _fetch_items(conn, _uid_set(chunk), "BODY.PEEK[HEADER.FIELDS (FROM TO SUBJECT DATE)]")
+            stats["round_trips"] += 1
+            stats["fetched_headers"] += len(headers)
+            candidates = {}
+            for uid, raw in headers.items():
+                header = _header_parser.parsebytes(raw)
+                if (header.get("Subject") or "").startswith("QuMail"):
+                    candidates[uid] = header
+            added = 0
+            if candidates:
+                bodies = _fetch_items(conn, _uid_set(sorted(candidates)), "BODY.PEEK[]")
+                stats["round_trips"] += 1
+                stats["fetched_bodies"] += len(bodies)
+                added = _store_envelopes(db, user, candidates, bodies)
+                if added and on_stored is not None:
+                    on_stored(db, added)
+            state.last_uid = upper
+            state.synced_at = datetime.datetime.utcnow()
+            db.commit()
+            stats["stored"] += added
+            last_uid = upper
+        if last_uid < highest:
+            # The UIDs in between were expunged; nothing below UIDNEXT is left to see
+            state.last_uid = last_uid = highest
+        db.commit()
+        imap_pool.release(conn, user, password, host, port)
+        stats["last_uid"] = last_uid
+        stats["uidvalidity"] = uidvalidity
+        return stats
+    except Exception:
+        db.rollback()
+        imap_pool.discard(conn)
+        raise
+
 
 def fetch_inbox(user, password):
+    conn = None
     try:
-        mail = imaplib.IMAP4_SSL("imap.gmail.com")
-        mail.login(user, password)
-        mail.select("inbox")
-        
-        # Fetching latest 5 emails as an example
-        result, data = mail.search(None, "ALL")
-        mail_ids = data[0].split()[-5:]
+        conn = imap_pool.acquire(user, password)
+        exists, _, _ = _mailbox_state(conn, "inbox")
+        if exists == 0:
+            imap_pool.release(conn, user, password)
+            return []
+        # Latest 5 messages in a single FETCH round trip
+        typ, data = conn.fetch(f"{max(1, exists - 4)}:{exists}", "(RFC822)")
         emails = []
-        for i in mail_ids:
-            typ, msg_data = mail.fetch(i, '(RFC822)')
-            for response_part in msg_data:
-                if isinstance(response_part, tuple):
-                    msg = email.message_from_bytes(response_part[1])
-                    subject = msg['subject']
-                    sender = msg['from']
-                    # Simplified body fetch
-                    body = ""
-                    if msg.is_multipart():
-                        for part in msg.walk():
-                            if part.get_content_type() == "text/plain":
-                                body = part.get_payload(decode=True).decode()
-                                break
-                    else:
-                        body = msg.get_payload(decode=True).decode()
-                        
-                    # Safely handle QuMail structured JSON envelopes
-                    try:
-                        structured = json.loads(body)
-                        if structured.get("qumail_secure_payload"):
-                            body = structured["ciphertext"]
-                        else:
-                            body = "RAW_UNENCRYPTED_GMAIL_MESSAGE:\n" + body
-                    except:
-                         body = "RAW_UNENCRYPTED_GMAIL_MESSAGE:\n" + body
-                        
-                    emails.append({"subject": subject, "sender": sender, "body": body})
+        for response_part in data:
+            if isinstance(response_part, tuple):
+                msg = email.message_from_bytes(response_part[1])
+                subject = msg['subject']
+                sender = msg['from']
+                body = _text_body(msg)
+
+                # Safely handle QuMail structured JSON envelopes
+                structured = parse_secure_envelope(body)
+                if structured:
+                    body = structured["ciphertext"]
+                else:
+                    body = "RAW_UNENCRYPTED_GMAIL_MESSAGE:\n" + body
+
+                emails.append({"subject": subject, "sender": sender, "body": body})
+        imap_pool.release(conn, user, password)
         return emails
     except Exception as e:
+        if conn is not None:
+            imap_pool.discard(conn)
         print(f"Failed to fetch real email: {e}")
         return []
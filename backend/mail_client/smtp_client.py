@@ -1,13 +1,22 @@
-import requests
 import json
+import os
+import time
+
+from http_pool import HostPool
+from metrics import bridge_latency
 
 # GOOGLE APPS SCRIPT BRIDGE (Bypasses all cloud blocks)
-BRIDGE_URL = "https://script.google.com/macros/s/AKfycbzqoNZLXm-uy5vDX1OcPEj1gcS1O1ZYbSbTBZGXave9cvkzMr34Kqev5fMGae2RXb4K1g/exec"
+BRIDGE_URL = os.environ.get(
+    "BRIDGE_URL",
+    "https://script.google.com/macros/s/AKfycbzqoNZLXm-uy5vDX1OcPEj1gcS1O1ZYbSbTBZGXave9cvkzMr34Kqev5fMGae2RXb4K1g/exec"
+)
 
-def send_email(sender_email, password_unused, receiver, body, security_level, key_id, nonce=None, subject="QuMail Secure"):
+# Keep-alive pool to the bridge; Google Script answers with a 302, which the clients follow
+bridge_http = HostPool("bridge", max_connections=10, max_keepalive=5, per_host_limit=8, timeout=15.0)
+
+def build_secure_payload(sender_email, receiver, body, security_level, key_id, nonce=None, subject="QuMail Secure"):
     """
-    Sends a secure email using the Google Apps Script Bridge.
-    Guaranteed delivery to ANY recipient globally.
+    Builds the Google Apps Script Bridge request for a secure email.
     """
     algorithms = {
         1: "OTP (One-Time Pad)",
@@ -50,17 +59,29 @@ def send_email(sender_email, password_unused, receiver, body, security_level, ke
         "replyTo": sender_email             # Suggests a reply-to address
     }
 
+    return payload
+
+def _report_secure_dispatch(response):
+    if response.status_code == 200:
+        print(f"✅ [BRIDGE] Secure email delivered successfully")
+        return True
+    print(f"❌ [BRIDGE] Error: {response.status_code} - {response.text}")
+    return False
+
+def send_email(sender_email, password_unused, receiver, body, security_level, key_id, nonce=None, subject="QuMail Secure"):
+    """
+    Sends a secure email using the Google Apps Script Bridge.
+    Guaranteed delivery to ANY recipient globally.
+    """
+    payload = build_secure_payload(sender_email, receiver, body, security_level, key_id, nonce, subject)
+    start = time.perf_counter()
     try:
         print(f"🚀 [BRIDGE] Dispatching secure email from {sender_email} to {receiver} via Google Bridge...")
-        # Note: requests follows redirects (Google Script uses 302)
-        response = requests.post(BRIDGE_URL, json=payload, timeout=15)
-        if response.status_code == 200:
-            print(f"✅ [BRIDGE] Secure email delivered successfully")
-            return True
-        else:
-            print(f"❌ [BRIDGE] Error: {response.status_code} - {response.text}")
-            return False
+        delivered = _report_secure_dispatch(bridge_http.request_sync("POST", BRIDGE_URL, json=payload))
+        bridge_latency.observe(time.perf_counter() - start, "secure", "delivered" if delivered else "rejected")
+        return delivered
     except Exception as e:
+        bridge_latency.observe(time.perf_counter() - start, "secure", "failed")
         print(f"❌ [BRIDGE] Critical failure: {e}")
         return False
 
@@ -77,15 +98,19 @@ def send_otp_email(sender_unused, password_unused, receiver, otp):
         "body": body
     }
 
+    start = time.perf_counter()
     try:
         print(f"🔐 [BRIDGE] Dispatching OTP to {receiver} via Google Bridge...")
-        response = requests.post(BRIDGE_URL, json=payload, timeout=15)
+        response = bridge_http.request_sync("POST", BRIDGE_URL, json=payload)
         if response.status_code == 200:
+            bridge_latency.observe(time.perf_counter() - start, "otp", "delivered")
             print(f"✅ [BRIDGE] OTP delivered successfully")
             return True
         else:
+            bridge_latency.observe(time.perf_counter() - start, "otp", "rejected")
             print(f"❌ [BRIDGE] Error: {response.status_code}")
             return False
     except Exception as e:
+        bridge_latency.observe(time.perf_counter() - start, "otp", "failed")
         print(f"❌ [BRIDGE] Critical failure: {e}")
         return False
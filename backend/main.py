@@ -1,33 +1,124 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Header
-from typing import Optional
+from fastapi import FastAPI, Depends, HTTPException, status, Header, Query, Request, Response, UploadFile, File, Form
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional, List
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from database import engine, Base, get_db
+from sqlalchemy.orm import Session, defer
+from database import Base, get_db, SessionLocal, connect_database, mark_ready, is_ready, db_state
 import models
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import datetime
 import base64
 
-from km_client.qkd_client import fetch_qkd_key, retrieve_qkd_key, fetch_key_stats
-from encryption.crypto_plugins.otp_engine import encrypt_otp, decrypt_otp
-from encryption.crypto_plugins.quantum_aes import encrypt_quantum_aes, decrypt_quantum_aes
-from encryption.crypto_plugins.pqc_module import encrypt_pqc, decrypt_pqc
-from mail_client.smtp_client import send_email as send_real_smtp, send_otp_email
-from mail_client.imap_client import fetch_inbox as fetch_real_imap
+from km_client.qkd_client import fetch_qkd_key, fetch_qkd_key_sync, fetch_qkd_keys, issue_qkd_keys, retrieve_qkd_key_sync, retrieve_qkd_keys, retrieve_qkd_keys_sync, fetch_key_stats, key_pool, km_http, km_router
+from encryption.crypto_plugins.otp_engine import encrypt_otp, decrypt_otp, encrypt_otp_stream, decrypt_otp_stream
+from encryption.crypto_plugins.quantum_aes import encrypt_quantum_aes, decrypt_quantum_aes, decrypt_quantum_aes_batch, encrypt_quantum_aes_stream, decrypt_quantum_aes_stream, STREAM_CHUNK_SIZE
+from encryption.crypto_plugins.pqc_module import encrypt_pqc, decrypt_pqc, encrypt_pqc_stream, decrypt_pqc_stream
+from mail_client.smtp_client import send_otp_email, bridge_http
+from mail_client.imap_client import sync_mailbox, imap_pool
+from mail_client.dispatch_queue import dispatch_queue, enqueue_dispatch, queue_status
+from audit_log import security_log
+from threat_engine import threat_engine
+from otp_store import otp_store, email_rate_limiter, ip_rate_limiter
+from google_auth_cache import verify_google_id_token, google_http
+from metrics import http_requests, http_latency, instrument_sqlalchemy, render_metrics
+from email_storage import email_payload, ensure_binary_columns, migrate_legacy_rows, LEVEL_ALGORITHMS, QAES, PQC, OTP, STREAM, PLAIN, BLOB_DIR
+from email_retention import email_retention
+from email_search import ensure_search_index, search_email_ids, normalize_keywords, SEARCH_FIELDS
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import ipaddress
 import random
 import threading
+import os
+import uuid
+import time
 print(f"🚀 [STARTUP] QuMail Backend is booting...")
 
 app = FastAPI(title="QuMail API", description="Quantum Secure Email Client")
+instrument_sqlalchemy()
+
+DB_INIT_RETRY_INTERVAL = float(os.environ.get("DB_INIT_RETRY_INTERVAL", "30"))
+SEND_BATCH_MAX = int(os.environ.get("SEND_BATCH_MAX", "1000"))
+SEND_BATCH_WORKERS = int(os.environ.get("SEND_BATCH_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+# Below this many recipients the pool hand-off costs more than it saves
+SEND_BATCH_MIN_PARALLEL = 32
+send_executor = ThreadPoolExecutor(max_workers=SEND_BATCH_WORKERS, thread_name_prefix="send-encrypt")
+
+def initialize_database():
+    while True:
+        try:
+            db_engine = connect_database()
+            print(f"🚀 [STARTUP] Initializing database tables...")
+            models.Base.metadata.create_all(bind=db_engine)
+            ensure_binary_columns(db_engine)
+            # create_all skips indexes on tables that already exist
+            for index in models.Email.__table__.indexes:
+                index.create(bind=db_engine, checkfirst=True)
+            ensure_search_index(db_engine)
+            ensure_email_stats()
+            # Rows in the old prefixed base64 format stay readable while they are converted
+            threading.Thread(target=migrate_legacy_rows, name="legacy-body-migration", daemon=True).start()
+            # Requests queue outbound mail and security events as soon as /ready says so
+            dispatch_queue.start()
+            security_log.start()
+            email_retention.start()
+            mark_ready()
+            print(f"🚀 [STARTUP] Database tables initialized successfully.")
+            break
+        except Exception as e:
+            db_state["error"] = str(e)
+            print(f"❌ [STARTUP] Critical Error during database initialization: {e}; retrying in {DB_INIT_RETRY_INTERVAL:.0f}s")
+            time.sleep(DB_INIT_RETRY_INTERVAL)
 
 @app.on_event("startup")
 def startup_db_client():
-    print(f"🚀 [STARTUP] Initializing database tables...")
+    # Warm the QKD key pool so the first sends don't wait on the KM
+    key_pool.start()
+    # Connecting and creating tables happen off the startup path so the process
+    # answers / and /ready at once; DB-backed requests wait in get_db
+    threading.Thread(target=initialize_database, name="db-init", daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown_background_services():
+    # One failing step must not leave the later pools and clients open
+    steps = [
+        ("dispatch queue", lambda: run_in_threadpool(dispatch_queue.stop)),
+        ("security log", lambda: run_in_threadpool(security_log.stop)),
+        ("email retention", lambda: run_in_threadpool(email_retention.stop)),
+        ("IMAP pool", lambda: run_in_threadpool(imap_pool.close_all)),
+        ("send executor", lambda: run_in_threadpool(send_executor.shutdown)),
+        ("KM client", km_http.aclose),
+        ("bridge client", bridge_http.aclose),
+        ("Google client", google_http.aclose),
+    ]
+    for name, step in steps:
+        try:
+            await step()
+        except Exception as e:
+            print(f"❌ [SHUTDOWN] Failed to close {name}: {e}")
+
+def ensure_email_stats():
+    # One full count when the counters row is first created; sends keep it current after that
+    db = SessionLocal()
     try:
-        models.Base.metadata.create_all(bind=engine)
-        print(f"🚀 [STARTUP] Database tables initialized successfully.")
-    except Exception as e:
-        print(f"❌ [STARTUP] Critical Error during table creation: {e}")
+        if db.get(models.EmailStats, 1) is None:
+            db.add(models.EmailStats(
+                id=1,
+                total_emails=db.query(models.Email).count(),
+                active_risks=db.query(models.Email).filter(models.Email.threat_score > 50).count()
+            ))
+            db.commit()
+    finally:
+        db.close()
+
+def bump_email_stats(db: Session, sent: int, risky: int):
+    """Increment the dashboard counters inside the caller's transaction."""
+    db.query(models.EmailStats).filter(models.EmailStats.id == 1).update({
+        models.EmailStats.total_emails: models.EmailStats.total_emails + sent,
+        models.EmailStats.active_risks: models.EmailStats.active_risks + risky,
+        models.EmailStats.updated_at: datetime.datetime.utcnow()
+    }, synchronize_session=False)
 
 app.add_middleware(
     CORSMiddleware,
@@ -40,27 +131,62 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.middleware("http")
 async def log_requests(request, call_next):
     print(f"DEBUG: Incoming {request.method} request to {request.url}")
-    response = await call_next(request)
-    return response
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Label by route template (/email/{email_id}/decrypt), not the raw path
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        http_latency.observe(time.perf_counter() - start, route_path, request.method)
+        http_requests.inc(route_path, request.method, str(status_code))
 
-otp_store = {}
 
 class OTPRequest(BaseModel):
     email: str
 
+# Reverse proxies (IPs or CIDRs) whose X-Forwarded-For is believed; anyone else could forge it
+TRUSTED_PROXIES = [ipaddress.ip_network(p.strip(), strict=False)
+                   for p in os.environ.get("TRUSTED_PROXIES", "").split(",") if p.strip()]
+
+def _is_trusted_proxy(host):
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+def client_ip(request: Request):
+    peer = request.client.host if request.client else "unknown"
+    if not _is_trusted_proxy(peer):
+        return peer
+    # Each trusted hop appends the address it saw; the first untrusted one from the right is the client
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
 @app.post("/send-otp")
-def send_otp(req: OTPRequest):
+def send_otp(req: OTPRequest, request: Request):
     print(f"📩 [API] Received OTP request for: {req.email}")
     if not req.email:
         raise HTTPException(status_code=400, detail="Invalid email")
+    # Throttle before touching the bridge so bursts cost nothing downstream
+    if not ip_rate_limiter.hit(f"ip:{client_ip(request)}") or not email_rate_limiter.hit(f"email:{req.email}"):
+        raise HTTPException(status_code=429, detail="Too many verification requests. Try again later.")
     
     otp = str(random.randint(100000, 999999))
-    otp_store[req.email] = otp
+    otp_store.put(req.email, otp)
     
     # EMERGENCY LOGGING FOR HACKATHON LOGIN (Bypasses Sandbox restrictions)
     print("\n" + "🚀"*15)
@@ -85,12 +211,10 @@ class VerifyOTPRequest(BaseModel):
 
 @app.post("/verify-otp")
 def verify_otp(req: VerifyOTPRequest, db: Session = Depends(get_db)):
-    if otp_store.get(req.email) != req.otp:
+    # Matching code is removed from the store in the same step
+    if not otp_store.consume(req.email, req.otp):
         raise HTTPException(status_code=401, detail="Invalid or expired OTP")
     
-    # OTP verified, remove from store
-    del otp_store[req.email]
-    
     user = db.query(models.User).filter(models.User.email == req.email).first()
     if not user:
         user = models.User(email=req.email, hashed_password="OTP_AUTH_USER")
@@ -106,8 +230,17 @@ def read_root():
     print("🚀 [HEALTH] Received health check request.")
     return {"status": "QuMail Backend Running"}
 
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+def readiness(response: Response):
+    """Readiness probe: 200 once the database is connected and its tables exist."""
+    ready = is_ready()
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"ready": ready, "database": db_state}
 
 GOOGLE_CLIENT_ID = "458142597311-edo75f4laiivejnqgom88vb0piv2btd7.apps.googleusercontent.com"
 
@@ -117,8 +250,8 @@ class GoogleLoginRequest(BaseModel):
 @app.post("/google-login")
 def google_login(req: GoogleLoginRequest, db: Session = Depends(get_db)):
     try:
-        # Verify the token
-        idinfo = id_token.verify_oauth2_token(req.credential, google_requests.Request(), GOOGLE_CLIENT_ID)
+        # Verify the token against cached Google certificates; a retried token is a cache hit
+        idinfo = verify_google_id_token(req.credential, GOOGLE_CLIENT_ID)
         
         email = idinfo['email']
         name = idinfo.get('name', 'Google User')
@@ -140,81 +273,68 @@ class RecommendationRequest(BaseModel):
     recipient: str
     
 def calculate_risk_score(body: str, recipient: str):
-    body_lower = body.lower()
-    score_weights = {
-        "secret": 50,
-        "confidential": 40,
-        "contract": 30,
-        "finance": 25,
-        "password": 35,
-        "operation": 50,
-        "auth": 20
-    }
-    
-    total_score = 0
-    for keyword, weight in score_weights.items():
-        if keyword in body_lower:
-            total_score += weight
-            
-    # Domain penalty evaluation
-    trusted_domains = ["qumail.local", "command.local", "node.5"]
-    domain = recipient.split("@")[-1] if "@" in recipient else ""
-    if domain not in trusted_domains:
-        total_score += 30 
-        
-    recommended_level = 1
-    if total_score >= 60:
-        recommended_level = 3
-    elif total_score >= 30:
-        recommended_level = 2
-        
-    return recommended_level, total_score
+    # Memoized by content hash, so a send right after the UI's recommendation is free
+    return threat_engine.score(body, recipient)
 
 @app.post("/ai/recommend")
 def ai_recommend(req: RecommendationRequest):
     level, score = calculate_risk_score(req.body, req.recipient)
     return {"recommended_level": level, "threat_score": score}
 
+class BatchRecommendationRequest(BaseModel):
+    items: List[RecommendationRequest] = Field(..., max_length=1000)
+
+@app.post("/ai/recommend/batch")
+def ai_recommend_batch(req: BatchRecommendationRequest):
+    scores = threat_engine.score_many([(item.body, item.recipient) for item in req.items])
+    return [{"recommended_level": level, "threat_score": score} for level, score in scores]
+
 class SendEmailRequest(BaseModel):
     recipient: str
     subject: str
     body: str
     security_level: int
+    # Opt-in plaintext tokens for /email/search; the body itself is never indexed
+    keywords: Optional[List[str]] = None
+
+def encrypt_for_level(security_level: int, body: str, key_id, key_bytes):
+    """(ciphertext, nonce, enc_b64, nonce_b64) for a single-part send; unknown levels go out as plaintext."""
+    plaintext_bytes = body.encode("utf-8")
+    nonce = None
+    nonce_b64 = None
+    if security_level == 1:
+        ciphertext = encrypt_otp(plaintext_bytes, key_bytes)
+        enc_b64 = base64.b64encode(ciphertext).decode("utf-8")
+    elif security_level == 2:
+        ciphertext, nonce = encrypt_quantum_aes(plaintext_bytes, key_bytes, key_id)
+        enc_b64 = base64.b64encode(ciphertext).decode("utf-8")
+        nonce_b64 = base64.b64encode(nonce).decode("utf-8")
+    elif security_level == 3:
+        ciphertext = encrypt_pqc(plaintext_bytes)
+        enc_b64 = base64.b64encode(ciphertext).decode("utf-8")
+    else:
+        ciphertext = plaintext_bytes
+        enc_b64 = body
+    return ciphertext, nonce, enc_b64, nonce_b64
     
 @app.post("/email/send")
-def send_email(
+async def send_email(
     req: SendEmailRequest, 
     db: Session = Depends(get_db),
     x_agent_email: Optional[str] = Header(None)
 ):
     # 1. Fetch Real QKD Key
-    key_id, key_bytes = fetch_qkd_key()
+    key_id, key_bytes = await fetch_qkd_key()
     if not key_bytes or not key_id:
-        import uuid
         key_id = str(uuid.uuid4())
         key_bytes = b"0" * 1024 # Fallback
         
-    plaintext_bytes = req.body.encode("utf-8")
-    _, threat_score = calculate_risk_score(req.body, req.recipient)
-    
-    # 2. Encrypt
-    nonce_b64 = None
-    if req.security_level == 1:
-        ciphertext = encrypt_otp(plaintext_bytes, key_bytes)
-        enc_b64 = base64.b64encode(ciphertext).decode("utf-8")
-        encrypted = f"OTP_ENC({enc_b64})"
-    elif req.security_level == 2:
-        ciphertext, nonce = encrypt_quantum_aes(plaintext_bytes, key_bytes)
-        enc_b64 = base64.b64encode(ciphertext).decode("utf-8")
-        nonce_b64 = base64.b64encode(nonce).decode("utf-8")
-        encrypted = f"QAES_ENC({enc_b64}:{nonce_b64})"
-    elif req.security_level == 3:
-        ciphertext = encrypt_pqc(plaintext_bytes)
-        enc_b64 = base64.b64encode(ciphertext).decode("utf-8")
-        encrypted = f"PQC_ENC({enc_b64})"
-    else:
-        enc_b64 = req.body
-        encrypted = req.body
+    def score_and_encrypt():
+        _, threat_score = calculate_risk_score(req.body, req.recipient)
+        # 2. Encrypt
+        return (threat_score, *encrypt_for_level(req.security_level, req.body, key_id, key_bytes))
+    # Scoring and encryption are CPU-bound; keep them off the event loop too
+    threat_score, ciphertext, nonce, enc_b64, nonce_b64 = await run_in_threadpool(score_and_encrypt)
 
     # 3. Save to DB acting as Local SQLite encrypted cache
     sender_email = x_agent_email if x_agent_email else "demo@qumail.local" # Use authentic sender
@@ -223,109 +343,412 @@ def send_email(
         sender=sender_email,
         recipient=req.recipient,
         subject=req.subject,
-        body_encrypted=encrypted,
+        ciphertext=ciphertext,
+        nonce=nonce,
+        algorithm=LEVEL_ALGORITHMS.get(req.security_level, PLAIN),
         security_level=req.security_level,
         threat_score=threat_score,
-        key_id=key_id
+        key_id=key_id,
+        search_keywords=normalize_keywords(req.keywords)
     )
-    db.add(email_model)
     
-    description = f"Encrypted level {req.security_level} dispatched to {req.recipient}"
-    log = models.SecurityLog(event_type="OUTBOUND_SECURITY_DISPATCH", description=description)
-    db.add(log)
-    db.commit()
-    # Phase 2: Real SMTP Dispatch (Master Relay Gateway)
-    import threading
+    def persist():
+        db.add(email_model)
+        db.flush()
+        # Phase 2: Real SMTP Dispatch (Master Relay Gateway), queued in the same
+        # transaction so a stored email always has its dispatch
+        enqueue_dispatch(db, email_model, enc_b64, nonce_b64)
+        bump_email_stats(db, 1, 1 if threat_score > 50 else 0)
+        db.commit()
+    # Session work is blocking; keep it off the event loop
+    await run_in_threadpool(persist)
+    dispatch_queue.wake()
+    await security_log.record_async("OUTBOUND_SECURITY_DISPATCH", f"Encrypted level {req.security_level} dispatched to {req.recipient}")
     
-    def background_dispatch():
-        print(f"📧 [RESEND] Background thread initiating delivery to {req.recipient}...")
-        success = send_real_smtp(
-            sender_email, 
-            None, 
-            req.recipient, 
-            enc_b64, 
-            req.security_level, 
-            key_id, 
-            nonce_b64, 
-            f"QuMail: {req.subject} (from {sender_email})"
+    return {"status": "success", "message": "Email sent securely."}
+
+class BatchRecipient(BaseModel):
+    address: str
+    # Overrides the batch-wide level for this recipient
+    security_level: Optional[int] = None
+
+class SendBatchRequest(BaseModel):
+    recipients: List[BatchRecipient] = Field(..., min_length=1, max_length=SEND_BATCH_MAX)
+    subject: str
+    body: str
+    security_level: int
+    keywords: Optional[List[str]] = None
+
+def _encrypt_batch_slice(items):
+    return [encrypt_for_level(level, body, key_id, key_bytes) for level, body, key_id, key_bytes in items]
+
+@app.post("/email/send/batch")
+async def send_email_batch(
+    req: SendBatchRequest,
+    db: Session = Depends(get_db),
+    x_agent_email: Optional[str] = Header(None)
+):
+    # Same result as one /email/send per recipient, but with one KM request,
+    # pooled encryption and one transaction for the whole list
+    recipients = req.recipients
+    levels = [r.security_level if r.security_level is not None else req.security_level for r in recipients]
+    keys = await issue_qkd_keys(len(recipients))
+    if len(keys) < len(recipients):
+        print(f"❌ [BATCH] KM issued {len(keys)} of {len(recipients)} keys; using fallback keys for the rest")
+        keys += [(str(uuid.uuid4()), b"0" * 1024) for _ in range(len(recipients) - len(keys))]
+    scores = await run_in_threadpool(threat_engine.score_many, [(req.body, r.address) for r in recipients])
+
+    items = [(level, req.body, key_id, key_bytes) for level, (key_id, key_bytes) in zip(levels, keys)]
+    if len(items) < SEND_BATCH_MIN_PARALLEL:
+        encrypted = await run_in_threadpool(_encrypt_batch_slice, items)
+    else:
+        # One contiguous slice per worker; results keep recipient order
+        loop = asyncio.get_running_loop()
+        step = -(-len(items) // SEND_BATCH_WORKERS)
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(send_executor, _encrypt_batch_slice, items[i:i + step])
+            for i in range(0, len(items), step)
+        ))
+        encrypted = [result for part in parts for result in part]
+
+    sender_email = x_agent_email if x_agent_email else "demo@qumail.local"
+    search_keywords = normalize_keywords(req.keywords)
+    email_models = [
+        models.Email(
+            sender=sender_email,
+            recipient=r.address,
+            subject=req.subject,
+            ciphertext=ciphertext,
+            nonce=nonce,
+            algorithm=LEVEL_ALGORITHMS.get(level, PLAIN),
+            security_level=level,
+            threat_score=threat_score,
+            key_id=key_id,
+            search_keywords=search_keywords
         )
-        if success:
-            print(f"✅ [RESEND] Background delivery successful for {req.recipient}")
+        for r, level, (key_id, _), (_, threat_score), (ciphertext, nonce, _, _) in zip(recipients, levels, keys, scores, encrypted)
+    ]
+    risky = sum(1 for _, threat_score in scores if threat_score > 50)
+
+    def persist():
+        # One flush inserts every row (batched, with RETURNING for the ids),
+        # then all dispatches and the counters go in the same commit
+        db.add_all(email_models)
+        db.flush()
+        for email_model, (_, _, enc_b64, nonce_b64) in zip(email_models, encrypted):
+            enqueue_dispatch(db, email_model, enc_b64, nonce_b64)
+        bump_email_stats(db, len(email_models), risky)
+        db.commit()
+        return [email_model.id for email_model in email_models]
+    ids = await run_in_threadpool(persist)
+    dispatch_queue.wake()
+    for r, level in zip(recipients, levels):
+        await security_log.record_async("OUTBOUND_SECURITY_DISPATCH", f"Encrypted level {level} dispatched to {r.address}")
+
+    return {"status": "success", "message": f"{len(ids)} emails sent securely.", "ids": ids}
+
+def decrypt_email_body(e):
+    try:
+        algorithm, ciphertext, nonce = email_payload(e)
+        if algorithm == OTP:
+            key_bytes = retrieve_qkd_key_sync(e.key_id)
+            decrypted_body = decrypt_otp(ciphertext, key_bytes).decode("utf-8", errors="replace")
+        elif algorithm == QAES:
+            key_bytes = retrieve_qkd_key_sync(e.key_id)
+            decrypted_body = decrypt_quantum_aes(ciphertext, key_bytes, nonce, e.key_id).decode("utf-8", errors="replace")
+        elif algorithm == PQC:
+            decrypted_body = decrypt_pqc(ciphertext).decode("utf-8", errors="replace")
+        elif algorithm == STREAM:
+            # Large payloads are never decrypted inline; they are streamed on demand
+            decrypted_body = f"<Streamed secure payload: GET /email/{e.id}/stream>"
         else:
-            print(f"❌ [RESEND] Background delivery failed for {req.recipient}")
+            decrypted_body = ciphertext.decode("utf-8", errors="replace")
+    except Exception as ex:
+        import traceback
+        print(f"❌ [DECRYPT] Failure on msg {e.id} (Level {e.security_level}): {ex}")
+        print(traceback.format_exc())
+        decrypted_body = f"<Decryption Error: Key Mismatch or Integrity Failure>"
+    return decrypted_body
 
-    threading.Thread(target=background_dispatch).start()
-    
-    return {"status": "success", "message": "Email sent securely."}
+def decrypt_quantum_aes_rows(emails):
+    """Decrypt all QAES rows of a page in one batch; rows that fail are left to decrypt_email_body."""
+    rows = []
+    items = []
+    for e in emails:
+        try:
+            algorithm, ciphertext, nonce = email_payload(e)
+            if algorithm != QAES:
+                continue
+            items.append((ciphertext, nonce, retrieve_qkd_key_sync(e.key_id), e.key_id))
+            rows.append(e)
+        except Exception:
+            continue
+    bodies = {}
+    for e, plaintext in zip(rows, decrypt_quantum_aes_batch(items)):
+        if not isinstance(plaintext, Exception):
+            bodies[e.id] = plaintext.decode("utf-8", errors="replace")
+    return bodies
 
-@app.get("/email/inbox")
-def get_inbox(
+def email_headers(e):
+    return {
+        "id": e.id,
+        "sender": e.sender,
+        "subject": e.subject,
+        "security_level": e.security_level,
+        "threat_score": e.threat_score,
+        "timestamp": e.timestamp,
+        "key_id": e.key_id
+    }
+
+INBOX_PAGE_MAX = 200
+
+# Level 1 streams spend one 1 KB QKD key per KB of payload, so they are capped
+# well below what the KM can hold; keys move in windows of OTP_STREAM_KEY_WINDOW
+OTP_STREAM_MAX_BYTES = int(os.environ.get("OTP_STREAM_MAX_BYTES", str(1 << 20)))
+OTP_STREAM_KEY_WINDOW = int(os.environ.get("OTP_STREAM_KEY_WINDOW", "64"))
+OTP_KEY_SIZE = 1024
+
+def otp_stream_keys(payload_bytes):
+    """next_key for encrypt_otp_stream: bulk KM fetches sized to what is still needed, kept out of the key cache."""
+    window = []
+    issued = []
+    remaining = [-(-payload_bytes // OTP_KEY_SIZE)]
+    def next_key():
+        if not window:
+            window.extend(reversed(fetch_qkd_keys(max(1, min(OTP_STREAM_KEY_WINDOW, remaining[0])))))
+            if not window:
+                return None, None
+        remaining[0] -= 1
+        issued.append(window.pop())
+        return issued[-1]
+    return next_key, issued
+
+def upload_size(file: UploadFile):
+    src = file.file
+    src.seek(0, os.SEEK_END)
+    size = src.tell()
+    src.seek(0)
+    return size
+
+@app.post("/email/send/stream")
+def send_email_stream(
+    recipient: str = Form(...),
+    subject: str = Form(...),
+    security_level: int = Form(...),
+    file: UploadFile = File(...),
     db: Session = Depends(get_db),
     x_agent_email: Optional[str] = Header(None)
 ):
-    # Log the inbox access as a security scan event
-    scan_log = models.SecurityLog(
-        event_type="INBOUND_SECURITY_SCAN", 
-        description=f"Scanning secure node for incoming encrypted packets..."
+    # Plaintext is read and encrypted one chunk at a time, so memory stays flat
+    # regardless of payload size
+    chunks = iter(lambda: file.file.read(STREAM_CHUNK_SIZE), b"")
+    key_id = None
+    if security_level == 1:
+        size = upload_size(file)
+        if size > OTP_STREAM_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Level 1 streams are limited to {OTP_STREAM_MAX_BYTES} bytes")
+        next_key, issued = otp_stream_keys(size)
+        frames = encrypt_otp_stream(chunks, next_key)
+    elif security_level == 2:
+        key_id, key_bytes = fetch_qkd_key_sync()
+        if not key_bytes or not key_id:
+            raise HTTPException(status_code=503, detail="QKD key unavailable")
+        frames = encrypt_quantum_aes_stream(chunks, key_bytes)
+    elif security_level == 3:
+        frames = encrypt_pqc_stream(chunks)
+    else:
+        raise HTTPException(status_code=400, detail="Streaming requires security level 1-3")
+
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    blob_name = f"{uuid.uuid4()}.bin"
+    blob_path = os.path.join(BLOB_DIR, blob_name)
+    try:
+        with open(blob_path + ".part", "wb") as out:
+            for frame in frames:
+                out.write(frame)
+        os.replace(blob_path + ".part", blob_path)
+    except Exception as ex:
+        if os.path.exists(blob_path + ".part"):
+            os.remove(blob_path + ".part")
+        print(f"❌ [STREAM] Encryption failed for {recipient}: {ex}")
+        raise HTTPException(status_code=503, detail="Stream encryption failed")
+    if security_level == 1 and issued:
+        key_id = issued[0][0]
+
+    sender_email = x_agent_email if x_agent_email else "demo@qumail.local"
+    email_model = models.Email(
+        sender=sender_email,
+        recipient=recipient,
+        subject=subject,
+        ciphertext=blob_name.encode("utf-8"),
+        algorithm=STREAM,
+        security_level=security_level,
+        threat_score=0,
+        key_id=key_id
     )
-    db.add(scan_log)
+    db.add(email_model)
+    bump_email_stats(db, 1, 0)
     db.commit()
+    security_log.record("OUTBOUND_SECURITY_DISPATCH", f"Streamed level {security_level} payload stored for {recipient}")
+    # The Apps Script bridge cannot carry payloads of this size; the recipient
+    # pulls the ciphertext through /email/{id}/stream instead
+    return {"status": "success", "message": "Payload encrypted and stored.", "id": email_model.id}
 
+@app.get("/email/{email_id}/stream")
+def stream_email(
+    email_id: int,
+    db: Session = Depends(get_db),
+    x_agent_email: Optional[str] = Header(None)
+):
+    query = db.query(models.Email).filter(models.Email.id == email_id)
     if x_agent_email:
-        emails = db.query(models.Email).filter(models.Email.recipient == x_agent_email).order_by(models.Email.id.desc()).all()
-        # Find if any are "new" (just for logging purposes)
-        if emails:
-            new_log = models.SecurityLog(
-                event_type="INCOMING_SECURE_PACKET",
-                description=f"Detected {len(emails)} secure messages in quantum buffer."
-            )
-            db.add(new_log)
-            db.commit()
-        emails = db.query(models.Email).filter(models.Email.recipient == x_agent_email).order_by(models.Email.id.desc()).all()
-    else:
-        emails = db.query(models.Email).order_by(models.Email.id.desc()).all()
-    result = []
-    
-    for e in emails:
-        decrypted_body = e.body_encrypted
-        try:
-            if e.body_encrypted.startswith("OTP_ENC("):
-                enc_b64 = e.body_encrypted[8:-1]
-                ciphertext = base64.b64decode(enc_b64)
-                key_bytes = retrieve_qkd_key(e.key_id)
-                decrypted_body = decrypt_otp(ciphertext, key_bytes).decode("utf-8", errors="replace")
-            elif e.body_encrypted.startswith("QAES_ENC("):
-                parts = e.body_encrypted[9:-1].split(":")
-                ciphertext = base64.b64decode(parts[0])
-                nonce = base64.b64decode(parts[1])
-                key_bytes = retrieve_qkd_key(e.key_id)
-                decrypted_body = decrypt_quantum_aes(ciphertext, key_bytes, nonce).decode("utf-8", errors="replace")
-            elif e.body_encrypted.startswith("PQC_ENC("):
-                enc_b64 = e.body_encrypted[8:-1]
-                ciphertext = base64.b64decode(enc_b64)
-                decrypted_body = decrypt_pqc(ciphertext).decode("utf-8", errors="replace")
-        except Exception as ex:
-            import traceback
-            print(f"❌ [DECRYPT] Failure on msg {e.id} (Level {e.security_level}): {ex}")
-            print(traceback.format_exc())
-            decrypted_body = f"<Decryption Error: Key Mismatch or Integrity Failure>"
-            
-        result.append({
-            "id": e.id,
-            "sender": e.sender,
-            "subject": e.subject,
-            "body": decrypted_body,
-            "security_level": e.security_level,
-            "threat_score": e.threat_score,
-            "timestamp": e.timestamp,
-            "key_id": e.key_id
-        })
+        query = query.filter(models.Email.recipient == x_agent_email)
+    e = query.first()
+    algorithm, blob_name, _ = email_payload(e) if e else (None, None, None)
+    if algorithm != STREAM:
+        raise HTTPException(status_code=404, detail="Streamed payload not found")
+    blob_path = os.path.join(BLOB_DIR, os.path.basename(blob_name.decode("utf-8")))
+    if not os.path.exists(blob_path):
+        raise HTTPException(status_code=404, detail="Streamed payload not found")
+    security_level = e.security_level
+    key_id = e.key_id
+
+    def plaintext_chunks(src):
+        with src:
+            if security_level == 1:
+                yield from decrypt_otp_stream(src, retrieve_qkd_keys_sync, window=OTP_STREAM_KEY_WINDOW)
+            elif security_level == 2:
+                key_bytes = retrieve_qkd_keys_sync([key_id]).get(key_id)
+                if key_bytes is None:
+                    raise Exception(f"QKD key {key_id} unavailable for stream decryption")
+                yield from decrypt_quantum_aes_stream(src, key_bytes)
+            else:
+                yield from decrypt_pqc_stream(src)
+
+    # Decrypt the first chunk before answering, so a missing key or a corrupt
+    # blob is a 503 rather than a 200 that breaks off; a key lost later still
+    # aborts the transfer instead of yielding wrong plaintext
+    chunks = plaintext_chunks(open(blob_path, "rb"))
+    try:
+        first = next(chunks, b"")
+    except Exception as ex:
+        print(f"❌ [STREAM] Decryption failed for email {email_id}: {ex}")
+        raise HTTPException(status_code=503, detail="Stream decryption failed")
+
+    def body():
+        yield first
+        yield from chunks
+
+    return StreamingResponse(body(), media_type="application/octet-stream")
+
+@app.get("/email/inbox")
+async def get_inbox(
+    response: Response,
+    db: Session = Depends(get_db),
+    x_agent_email: Optional[str] = Header(None),
+    limit: int = Query(50, ge=1, le=INBOX_PAGE_MAX),
+    cursor: Optional[int] = None,
+    headers_only: bool = False
+):
+    def load_page():
+        # Keyset pagination: newest first, the cursor is the last id of the previous page
+        query = db.query(models.Email)
+        if x_agent_email:
+            query = query.filter(models.Email.recipient == x_agent_email)
+        if cursor is not None:
+            query = query.filter(models.Email.id < cursor)
+        if headers_only:
+            query = query.options(defer(models.Email.body_encrypted), defer(models.Email.ciphertext), defer(models.Email.nonce))
+        return query.order_by(models.Email.id.desc()).limit(limit + 1).all()
+
+    emails = await run_in_threadpool(load_page)
+    has_more = len(emails) > limit
+    emails = emails[:limit]
+
+    # Log the inbox access as a security scan event (buffered, never waits on a commit)
+    await security_log.record_async("INBOUND_SECURITY_SCAN", "Scanning secure node for incoming encrypted packets...")
+    # Find if any are "new" (just for logging purposes)
+    if x_agent_email and emails:
+        await security_log.record_async("INCOMING_SECURE_PACKET", f"Detected {len(emails)} secure messages in quantum buffer.")
+    if has_more:
+        response.headers["X-Next-Cursor"] = str(emails[-1].id)
+
+    if headers_only:
+        return [email_headers(e) for e in emails]
+
+    # One bulk KM request for every key the decrypt pass is going to need
+    await retrieve_qkd_keys([e.key_id for e in emails if e.security_level in (1, 2)])
+
+    def decrypt_page():
+        qaes_bodies = decrypt_quantum_aes_rows(emails)
+        result = []
+        for e in emails:
+            item = email_headers(e)
+            item["body"] = qaes_bodies[e.id] if e.id in qaes_bodies else decrypt_email_body(e)
+            result.append(item)
+        return result
+
+    return await run_in_threadpool(decrypt_page)
+
+@app.get("/email/search")
+def search_emails(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=256),
+    field: Optional[str] = Query(None, pattern="^(" + "|".join(SEARCH_FIELDS) + ")$"),
+    limit: int = Query(50, ge=1, le=INBOX_PAGE_MAX),
+    cursor: Optional[int] = None,
+    db: Session = Depends(get_db),
+    x_agent_email: Optional[str] = Header(None)
+):
+    # Metadata index only: ids come back newest first, nothing is decrypted
+    ids = search_email_ids(db, q, recipient=x_agent_email, field=field, before_id=cursor, limit=limit + 1)
+    if len(ids) > limit:
+        ids = ids[:limit]
+        response.headers["X-Next-Cursor"] = str(ids[-1])
+    return ids
+
+@app.get("/email/{email_id}/decrypt")
+def decrypt_email(
+    email_id: int,
+    db: Session = Depends(get_db),
+    x_agent_email: Optional[str] = Header(None)
+):
+    query = db.query(models.Email).filter(models.Email.id == email_id)
+    if x_agent_email:
+        query = query.filter(models.Email.recipient == x_agent_email)
+    e = query.first()
+    if not e:
+        raise HTTPException(status_code=404, detail="Email not found")
+    item = email_headers(e)
+    item["body"] = decrypt_email_body(e)
+    return item
+
+class ImapSyncRequest(BaseModel):
+    email: str
+    app_password: str
+    mailbox: str = "INBOX"
+
+@app.post("/email/imap-sync")
+def imap_sync(request: ImapSyncRequest, db: Session = Depends(get_db)):
+    """Pull QuMail envelopes delivered to the user's mailbox since the last sync into the inbox."""
+    try:
+        result = sync_mailbox(
+            request.email, request.app_password, db, mailbox=request.mailbox,
+            on_stored=lambda session, added: bump_email_stats(session, added, 0)
+        )
+    except Exception as e:
+        print(f"❌ [IMAP] Sync failed for {request.email}: {e}")
+        raise HTTPException(status_code=502, detail="IMAP sync failed")
+    if result["stored"]:
+        security_log.record("IMAP_SYNC", f"Synced {result['stored']} secure emails for {request.email}")
     return result
 
 @app.get("/security/dashboard")
-def get_dashboard(db: Session = Depends(get_db)):
-    remaining_keys = fetch_key_stats()
-    
+async def get_dashboard(db: Session = Depends(get_db)):
+    remaining_keys = await fetch_key_stats()
+    return await run_in_threadpool(dashboard_stats, db, remaining_keys)
+
+def dashboard_stats(db: Session, remaining_keys: int):
     # Calculate a dynamic risk meter based on recent email threat scores
     recent_emails = db.query(models.Email).order_by(models.Email.id.desc()).limit(10).all()
     if recent_emails:
@@ -334,14 +757,14 @@ def get_dashboard(db: Session = Depends(get_db)):
     else:
         risk_meter = 12
 
-    total_emails = db.query(models.Email).count()
-    active_risks = db.query(models.Email).filter(models.Email.threat_score > 50).count()
+    # Maintained counters instead of COUNT(*) scans that grow with the table
+    stats = db.get(models.EmailStats, 1)
 
     return {
         "remaining_keys": remaining_keys,
         "risk_meter": risk_meter,
-        "secured_comms": total_emails,
-        "active_risks": active_risks,
+        "secured_comms": stats.total_emails if stats else 0,
+        "active_risks": stats.active_risks if stats else 0,
         "recent_logs": [
             {
                 "id": log.id, 
@@ -352,3 +775,23 @@ def get_dashboard(db: Session = Depends(get_db)):
             for log in db.query(models.SecurityLog).order_by(models.SecurityLog.id.desc()).limit(5).all()
         ]
     }
+
+@app.get("/email/outbound/status")
+def get_outbound_status(db: Session = Depends(get_db)):
+    return queue_status(db)
+
+@app.get("/security/key-pool")
+def get_key_pool_stats():
+    return key_pool.stats()
+
+@app.get("/security/km-nodes")
+def get_km_node_stats():
+    return km_router.stats()
+
+@app.get("/security/audit-buffer")
+def get_audit_buffer_stats():
+    return security_log.stats()
+
+@app.get("/security/retention")
+def get_retention_stats():
+    return email_retention.stats()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Index, LargeBinary, Enum
 from database import Base
 import datetime
 
@@ -17,12 +17,30 @@ class Email(Base):
     sender = Column(String, index=True)
     recipient = Column(String, index=True)
     subject = Column(String)
-    body_encrypted = Column(Text)
+    body_encrypted = Column(Text, nullable=True) # Legacy prefixed base64 format, NULL once migrated
+    ciphertext = Column(LargeBinary, nullable=True) # Raw ciphertext; STREAM rows hold the blob file name
+    nonce = Column(LargeBinary, nullable=True) # QAES only
+    algorithm = Column(Enum("OTP", "QAES", "PQC", "STREAM", "PLAIN", name="email_algorithm", native_enum=False, length=8), nullable=True)
     security_level = Column(Integer, default=1)
-    threat_score = Column(Integer, default=0)
-    key_id = Column(String, nullable=True) # ID of the QKD key used
+    threat_score = Column(Integer, default=0, index=True)
+    key_id = Column(String, nullable=True, index=True) # ID of the QKD key used
+    search_keywords = Column(Text, nullable=True) # Client-approved plaintext search tokens, space separated
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
 
+    __table_args__ = (
+        # Serves the keyset-paginated inbox: WHERE recipient = ? AND id < ? ORDER BY id DESC
+        Index("ix_emails_recipient_id", "recipient", "id"),
+    )
+
+class EmailStats(Base):
+    __tablename__ = "email_stats"
+
+    # Single row (id=1) kept in step with the emails table by every send transaction
+    id = Column(Integer, primary_key=True)
+    total_emails = Column(Integer, default=0)
+    active_risks = Column(Integer, default=0) # emails with threat_score > 50
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 class SecurityLog(Base):
     __tablename__ = "security_logs"
     
@@ -30,3 +48,56 @@ class SecurityLog(Base):
     event_type = Column(String)
     description = Column(String)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+
+class OutboundDispatch(Base):
+    __tablename__ = "outbound_queue"
+
+    id = Column(Integer, primary_key=True, index=True)
+    email_id = Column(Integer, ForeignKey("emails.id"), nullable=True)
+    sender = Column(String)
+    recipient = Column(String)
+    subject = Column(String)
+    ciphertext = Column(Text) # Bridge-ready payload (base64 ciphertext or plaintext for level 0)
+    security_level = Column(Integer, default=1)
+    key_id = Column(String, nullable=True)
+    nonce = Column(String, nullable=True)
+    state = Column(String, default="PENDING") # PENDING -> IN_FLIGHT -> SENT, or DEAD after max retries
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        # Serves the drain query: WHERE state = 'PENDING' AND next_attempt_at <= now
+        Index("ix_outbound_queue_state_next", "state", "next_attempt_at"),
+    )
+
+class OTPCode(Base):
+    __tablename__ = "otp_codes"
+
+    email = Column(String, primary_key=True)
+    otp = Column(String)
+    expires_at = Column(DateTime, index=True)
+
+class RateLimit(Base):
+    __tablename__ = "rate_limits"
+
+    bucket = Column(String, primary_key=True) # e.g. "email:<address>" or "ip:<address>"
+    window = Column(Integer) # window number: unix time // window length
+    count = Column(Integer, default=0)
+
+class ImapSyncState(Base):
+    __tablename__ = "imap_sync_state"
+
+    # High-water mark per mailbox: UIDs <= last_uid have been synced for this uidvalidity
+    id = Column(Integer, primary_key=True)
+    account = Column(String) # "<user>@<imap host>"
+    mailbox = Column(String)
+    uidvalidity = Column(Integer)
+    last_uid = Column(Integer, default=0)
+    synced_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_imap_sync_state_account_mailbox", "account", "mailbox", unique=True),
+    )
@@ -0,0 +1,161 @@
+import datetime
+import heapq
+import os
+import threading
+import time
+
+from sqlalchemy import case
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import models
+from database import SessionLocal
+
+
+class MemoryOTPStore:
+    """
+    Per-process OTP store. Codes expire after ttl_seconds; a min-heap of
+    expiry times lets every call drop expired entries without scanning.
+    Only safe with a single worker process.
+    """
+
+    def __init__(self, ttl_seconds=600):
+        self.ttl_seconds = ttl_seconds
+        self._codes = {}
+        self._expiry_heap = []
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, email = heapq.heappop(self._expiry_heap)
+            entry = self._codes.get(email)
+            # Skip heap entries superseded by a newer code for the same email
+            if entry is not None and entry[1] == expires_at:
+                del self._codes[email]
+
+    def put(self, email, otp):
+        now = time.monotonic()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._purge(now)
+            self._codes[email] = (otp, expires_at)
+            heapq.heappush(self._expiry_heap, (expires_at, email))
+
+    def consume(self, email, otp):
+        """Return True and delete the code if it matches and has not expired."""
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            entry = self._codes.get(email)
+            if entry is None or entry[0] != otp:
+                return False
+            del self._codes[email]
+            return True
+
+    def __len__(self):
+        return len(self._codes)
+
+
+class DatabaseOTPStore:
+    """OTP store in the otp_codes table, shared by every worker and node on the same database."""
+
+    def __init__(self, ttl_seconds=600, purge_interval=60):
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+
+    def put(self, email, otp):
+        now = datetime.datetime.utcnow()
+        db = SessionLocal()
+        try:
+            if time.monotonic() - self._last_purge > self.purge_interval:
+                db.query(models.OTPCode).filter(models.OTPCode.expires_at <= now).delete(synchronize_session=False)
+                self._last_purge = time.monotonic()
+            db.merge(models.OTPCode(email=email, otp=otp, expires_at=now + datetime.timedelta(seconds=self.ttl_seconds)))
+            db.commit()
+        finally:
+            db.close()
+
+    def consume(self, email, otp):
+        db = SessionLocal()
+        try:
+            # Conditional delete: only one concurrent verifier can win the code
+            deleted = db.query(models.OTPCode).filter(
+                models.OTPCode.email == email,
+                models.OTPCode.otp == otp,
+                models.OTPCode.expires_at > datetime.datetime.utcnow()
+            ).delete(synchronize_session=False)
+            db.commit()
+            return deleted == 1
+        finally:
+            db.close()
+
+
+class MemoryRateLimiter:
+    """Fixed-window counter per key, local to this process."""
+
+    def __init__(self, limit, window_seconds):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """Count one request for key; False when the key is over its limit for this window."""
+        window = int(time.time() // self.window_seconds)
+        with self._lock:
+            current = self._windows.get(key)
+            if current is None or current[0] != window:
+                if len(self._windows) > 10000:
+                    self._windows = {k: v for k, v in self._windows.items() if v[0] == window}
+                current = [window, 0]
+                self._windows[key] = current
+            current[1] += 1
+            return current[1] <= self.limit
+
+
+# INSERT ... ON CONFLICT DO UPDATE ... RETURNING (SQLite 3.35+, Postgres)
+_DIALECT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+class DatabaseRateLimiter:
+    """Fixed-window counter per key in the rate_limits table, shared across workers."""
+
+    def __init__(self, limit, window_seconds):
+        self.limit = limit
+        self.window_seconds = window_seconds
+
+    def hit(self, key):
+        window = int(time.time() // self.window_seconds)
+        db = SessionLocal()
+        try:
+            # One conditional upsert: create the bucket, count into the current
+            # window, or restart a stale one, and read the result back atomically
+            insert = _DIALECT_INSERTS[db.get_bind().dialect.name]
+            stmt = insert(models.RateLimit).values(bucket=key, window=window, count=1)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.RateLimit.bucket],
+                set_={
+                    "count": case((models.RateLimit.window == stmt.excluded.window, models.RateLimit.count + 1), else_=1),
+                    "window": stmt.excluded.window,
+                },
+            ).returning(models.RateLimit.count)
+            count = db.execute(stmt).scalar_one()
+            db.commit()
+            return count <= self.limit
+        finally:
+            db.close()
+
+
+def build_otp_backend():
+    backend = os.environ.get("OTP_STORE_BACKEND", "memory")
+    ttl = int(os.environ.get("OTP_TTL_SECONDS", "600"))
+    window = int(os.environ.get("OTP_RATE_WINDOW", "600"))
+    per_email = int(os.environ.get("OTP_RATE_PER_EMAIL", "3"))
+    per_ip = int(os.environ.get("OTP_RATE_PER_IP", "20"))
+    if backend == "database":
+        return DatabaseOTPStore(ttl), DatabaseRateLimiter(per_email, window), DatabaseRateLimiter(per_ip, window)
+    return MemoryOTPStore(ttl), MemoryRateLimiter(per_email, window), MemoryRateLimiter(per_ip, window)
+
+
+otp_store, email_rate_limiter, ip_rate_limiter = build_otp_backend()
@@ -0,0 +1,178 @@
+import collections
+import hashlib
+import json
+import os
+import re
+import threading
+
+DEFAULT_LEXICON = {
+    "secret": 50,
+    "confidential": 40,
+    "contract": 30,
+    "finance": 25,
+    "password": 35,
+    "operation": 50,
+    "auth": 20
+}
+
+TRUSTED_DOMAINS = ["qumail.local", "command.local", "node.5"]
+
+
+def _trie_pattern(node):
+    # Alternation factored by shared prefixes, so the regex engine walks one
+    # trie path per position instead of trying every term
+    alternatives = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not alternatives:
+        return ""
+    inner = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+    if "" in node:
+        # Greedy optional: prefer the longer term, fall back to this one
+        return "(?:" + inner + ")?"
+    return inner
+
+
+class KeywordScorer:
+    """
+    Scores text against a weighted lexicon in a single regex pass.
+    Semantics match a per-keyword substring test: each term present anywhere
+    in the lowercased text adds its weight once, including terms that overlap
+    or sit inside other terms.
+    """
+
+    def __init__(self, lexicon):
+        self.weights = {term.lower(): weight for term, weight in lexicon.items() if term}
+        trie = {}
+        for term in self.weights:
+            node = trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[""] = True
+        # Lookahead finds the longest term starting at every position, overlaps included
+        self._pattern = re.compile("(?=(" + _trie_pattern(trie) + "))") if trie else None
+        self._contained = {}
+
+    def _longest_terms(self, text):
+        return {match.group(1) for match in self._pattern.finditer(text)}
+
+    def _closure(self, term):
+        # Every lexicon term occurring inside `term`; a proper substring of
+        # term lies within term[:-1] or term[1:]
+        found = self._contained.get(term)
+        if found is None:
+            found = {term}
+            for inner in self._longest_terms(term[:-1]) | self._longest_terms(term[1:]):
+                found |= self._closure(inner)
+            self._contained[term] = found
+        return found
+
+    def matches(self, text):
+        if self._pattern is None:
+            return set()
+        found = set()
+        for term in self._longest_terms(text.lower()):
+            found |= self._closure(term)
+        return found
+
+    def score(self, text):
+        return sum(self.weights[term] for term in self.matches(text))
+
+
+class ModelScorer:
+    """
+    Optional scikit-learn pipeline (e.g. TfidfVectorizer + regressor) saved
+    with joblib. Predictions are added to the lexicon score; whole batches go
+    through one vectorized predict call.
+    """
+
+    def __init__(self, path):
+        import joblib
+        self.model = joblib.load(path)
+
+    def score_many(self, texts):
+        return [int(round(max(0.0, float(value)))) for value in self.model.predict(texts)]
+
+
+def load_lexicon(path=None):
+    if path:
+        with open(path, "r") as f:
+            return json.load(f)
+    return DEFAULT_LEXICON
+
+
+def level_for(total_score):
+    if total_score >= 60:
+        return 3
+    if total_score >= 30:
+        return 2
+    return 1
+
+
+class ThreatEngine:
+    def __init__(self, keyword_scorer, model_scorer=None, cache_size=4096):
+        self.keyword_scorer = keyword_scorer
+        self.model_scorer = model_scorer
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @staticmethod
+    def _content_key(body, recipient):
+        return hashlib.sha256(body.encode("utf-8") + b"\0" + recipient.encode("utf-8")).digest()
+
+    def _domain_penalty(self, recipient):
+        # Domain penalty evaluation
+        domain = recipient.split("@")[-1] if "@" in recipient else ""
+        return 0 if domain in TRUSTED_DOMAINS else 30
+
+    def score_many(self, items):
+        """Score (body, recipient) pairs; returns (recommended_level, threat_score) per pair."""
+        keys = [self._content_key(body, recipient) for body, recipient in items]
+        results = [None] * len(items)
+        pending = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    pending.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    results[i] = cached
+            self.cache_hits += len(items) - len(pending)
+            self.cache_misses += len(pending)
+        if not pending:
+            return results
+
+        model_scores = [0] * len(pending)
+        if self.model_scorer is not None:
+            model_scores = self.model_scorer.score_many([items[i][0] for i in pending])
+        for i, model_score in zip(pending, model_scores):
+            body, recipient = items[i]
+            total_score = self.keyword_scorer.score(body) + model_score + self._domain_penalty(recipient)
+            results[i] = (level_for(total_score), total_score)
+
+        with self._lock:
+            for i in pending:
+                self._cache[keys[i]] = results[i]
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return results
+
+    def score(self, body, recipient):
+        return self.score_many([(body, recipient)])[0]
+
+
+def build_engine():
+    keyword_scorer = KeywordScorer(load_lexicon(os.environ.get("THREAT_LEXICON_PATH")))
+    model_scorer = None
+    model_path = os.environ.get("THREAT_MODEL_PATH")
+    if model_path:
+        try:
+            model_scorer = ModelScorer(model_path)
+        except Exception as e:
+            print(f"❌ [THREAT] Could not load model {model_path}: {e}")
+    return ThreatEngine(keyword_scorer, model_scorer, cache_size=int(os.environ.get("THREAT_CACHE_SIZE", "4096")))
+
+
+threat_engine = build_engine()
@@ -0,0 +1,84 @@
+"""
+Cold-start timing and import-time profile for the backend.
+
+Each run is a fresh interpreter, as on a serverless cold start. Reports the
+median time to import main, to answer GET / and to report ready on
+GET /ready, then the slowest modules from `python -X importtime -c
+"import main"` (cumulative microseconds, as printed by CPython).
+
+    python benchmarks/bench_cold_start.py --runs 5 --top 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+PROBE = r"""
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    client.get("/")
+    first_response = time.perf_counter()
+    while client.get("/ready").status_code != 200:
+        time.sleep(0.005)
+    ready = time.perf_counter()
+print("RESULT " + json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_response_ms": (first_response - start) * 1000,
+    "ready_ms": (ready - start) * 1000,
+}))
+"""
+
+
+def run_probe(env):
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND, env=env, capture_output=True, text=True, check=True)
+    line = next(l for l in out.stdout.splitlines() if l.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):])
+
+
+def import_profile(env, top):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND, env=env,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="qumail-cold-start-")
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+    # No KM running: the key pool's refill thread just backs off
+    env.setdefault("KM_URL", "http://127.0.0.1:9")
+
+    results = [run_probe(env) for _ in range(args.runs)]
+    print(f"cold start over {args.runs} fresh interpreters (median ms)")
+    for key in ("import_ms", "first_response_ms", "ready_ms"):
+        print(f"  {key:<18} {statistics.median(r[key] for r in results):>8.1f}")
+
+    print(f"\nslowest imports (python -X importtime -c 'import main')")
+    print(f"  {'cumulative ms':>13} {'self ms':>8}  module")
+    for cumulative_us, self_us, name in import_profile(env, args.top):
+        print(f"  {cumulative_us / 1000:>13.1f} {self_us / 1000:>8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
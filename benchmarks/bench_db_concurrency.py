@@ -0,0 +1,131 @@
+"""
+Mixed send/inbox concurrency benchmark for the SQLite profiles.
+
+Runs --threads workers for --seconds against a throwaway SQLite file. Each
+operation is either a send (Email row + outbound dispatch + stats bump in
+one transaction, as POST /email/send persists it) or an inbox page read
+(keyset query for the newest 50 rows of one recipient). Every profile runs
+in its own interpreter because database.py reads SQLITE_PROFILE at import.
+
+    python benchmarks/bench_db_concurrency.py --threads 16 --seconds 10 --send-ratio 0.3
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def worker_main(args):
+    sys.path.insert(0, BACKEND)
+    import models
+    from database import SessionLocal, connect_database
+    from mail_client.dispatch_queue import enqueue_dispatch
+
+    engine = connect_database()
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.merge(models.EmailStats(id=1, total_emails=0, active_risks=0))
+    db.commit()
+    db.close()
+
+    recipients = [f"agent{i}@qumail.local" for i in range(20)]
+    latencies = {"send": [], "inbox": []}
+    errors = {"send": 0, "inbox": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def send(db):
+        email = models.Email(
+            sender="bench@qumail.local", recipient=random.choice(recipients), subject="bench",
+            ciphertext=os.urandom(2048), algorithm="OTP", security_level=1, key_id=os.urandom(8).hex()
+        )
+        db.add(email)
+        db.flush()
+        enqueue_dispatch(db, email, "payload")
+        db.query(models.EmailStats).filter(models.EmailStats.id == 1).update(
+            {models.EmailStats.total_emails: models.EmailStats.total_emails + 1}, synchronize_session=False
+        )
+        db.commit()
+
+    def inbox(db):
+        db.query(models.Email).filter(models.Email.recipient == random.choice(recipients)) \
+            .order_by(models.Email.id.desc()).limit(50).all()
+
+    def run():
+        while time.perf_counter() < deadline:
+            kind = "send" if random.random() < args.send_ratio else "inbox"
+            db = SessionLocal()
+            start = time.perf_counter()
+            try:
+                (send if kind == "send" else inbox)(db)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies[kind].append(elapsed * 1000)
+            except Exception:
+                db.rollback()
+                with lock:
+                    errors[kind] += 1
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=run) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print("RESULT " + json.dumps({
+        kind: {
+            "ops": len(values),
+            "errors": errors[kind],
+            "p50_ms": statistics.median(values) if values else 0.0,
+            "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99),
+        }
+        for kind, values in latencies.items()
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--send-ratio", type=float, default=0.3)
+    parser.add_argument("--profiles", default="default,concurrent")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker_main(args)
+
+    print(f"{args.threads} threads, {args.seconds:.0f}s, {args.send_ratio:.0%} sends")
+    print(f"{'profile':<12} {'op':<6} {'ops/s':>8} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for profile in args.profiles.split(","):
+        tmp = tempfile.mkdtemp(prefix="qumail-db-bench-")
+        env = dict(os.environ, SQLITE_PROFILE=profile, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", "--threads", str(args.threads),
+             "--seconds", str(args.seconds), "--send-ratio", str(args.send_ratio)],
+            env=env, capture_output=True, text=True, check=True
+        )
+        line = next(l for l in out.stdout.splitlines() if l.startswith("RESULT "))
+        for kind, r in json.loads(line[len("RESULT "):]).items():
+            print(f"{profile:<12} {kind:<6} {r['ops'] / args.seconds:>8.0f} {r['errors']:>7} "
+                  f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+End-to-end latency and throughput of the send, inbox and dashboard paths.
+
+Runs the real km_simulator app and the backend app in this process, each
+under its own uvicorn server on a local port. A bridge stand-in replaces
+BRIDGE_URL, and a throwaway SQLite database and key log live in a temp
+directory. For every --mailbox-sizes value (ascending), the benchmark
+mailbox is topped up to that many encrypted messages, and then each of
+POST /email/send, GET /email/inbox and GET /security/dashboard is driven at
+every --concurrency level. The JSON report records p50/p95/p99 latency and
+throughput. --baseline compares the run with an earlier report and flags
+regressions beyond --tolerance.
+
+The load generator shares the process (and CPU) with both servers, so
+compare reports from the same machine only.
+
+    python benchmarks/bench_e2e.py --concurrency 1,8,32 --mailbox-sizes 100,1000 \\
+        --requests 300 --output e2e.json --baseline e2e-main.json
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bridge_stand_in import BridgeStandIn
+
+SENDER = "bench-sender@qumail.local"
+SEND_RECIPIENT = "bench-outbox@qumail.local"
+MAILBOX = "bench-inbox@qumail.local"
+
+
+def log(*args):
+    # stdout belongs to the servers (and is silenced unless --verbose)
+    print(*args, file=sys.stderr, flush=True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def serve(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def message_body(size, i):
+    text = f"Benchmark message {i}. "
+    return (text * (size // len(text) + 1))[:size]
+
+
+def seed_mailbox(current, target, body_bytes):
+    """Insert encrypted messages for MAILBOX the way POST /email/send stores them, with real KM keys."""
+    import models
+    from database import SessionLocal
+    from email_storage import LEVEL_ALGORITHMS
+    from encryption.crypto_plugins.otp_engine import encrypt_otp
+    from encryption.crypto_plugins.pqc_module import encrypt_pqc
+    from encryption.crypto_plugins.quantum_aes import encrypt_quantum_aes
+    from km_client.qkd_client import fetch_qkd_keys
+    from main import bump_email_stats
+
+    for start in range(current, target, 500):
+        count = min(500, target - start)
+        keys = fetch_qkd_keys(count)
+        if len(keys) != count:
+            raise RuntimeError("KM returned too few keys while seeding")
+        rows = []
+        for i, (key_id, key_bytes) in enumerate(keys, start):
+            level = i % 3 + 1
+            plaintext = message_body(body_bytes, i).encode("utf-8")
+            nonce = None
+            if level == 1:
+                ciphertext = encrypt_otp(plaintext, key_bytes)
+            elif level == 2:
+                ciphertext, nonce = encrypt_quantum_aes(plaintext, key_bytes, key_id)
+            else:
+                ciphertext = encrypt_pqc(plaintext)
+            rows.append(models.Email(
+                sender=SENDER, recipient=MAILBOX, subject=f"Seeded {i}", ciphertext=ciphertext, nonce=nonce,
+                algorithm=LEVEL_ALGORITHMS[level], security_level=level, threat_score=10, key_id=key_id,
+            ))
+        db = SessionLocal()
+        try:
+            db.add_all(rows)
+            bump_email_stats(db, len(rows), 0)
+            db.commit()
+        finally:
+            db.close()
+
+
+async def drive(request, concurrency, requests, warmup):
+    for i in range(warmup):
+        await request(i)
+    latencies = []
+    errors = 0
+    pending = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in pending:
+            start = time.perf_counter()
+            try:
+                ok = (await request(i)).status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2) if latencies else 0.0,
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2) if latencies else 0.0,
+    }
+
+
+async def run_scenarios(args, base_url):
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        def send(i):
+            return client.post("/email/send", headers={"x-agent-email": SENDER}, json={
+                "recipient": SEND_RECIPIENT, "subject": f"Bench {i}",
+                "body": message_body(args.body_bytes, i), "security_level": i % 3 + 1,
+            })
+
+        def inbox(i):
+            return client.get("/email/inbox", headers={"x-agent-email": MAILBOX}, params={"limit": args.inbox_limit})
+
+        def dashboard(i):
+            return client.get("/security/dashboard")
+
+        seeded = 0
+        for mailbox in sorted(args.mailbox_sizes):
+            log(f"Seeding mailbox to {mailbox} messages...")
+            await asyncio.to_thread(seed_mailbox, seeded, mailbox, args.body_bytes)
+            seeded = max(seeded, mailbox)
+            # A fast inbox that fails to decrypt is not a result worth recording
+            page = (await inbox(0)).json()
+            if any(m["body"].startswith("<Decryption Error") for m in page):
+                raise RuntimeError("Seeded messages did not decrypt; check the KM")
+            for endpoint, request in (("send", send), ("inbox", inbox), ("dashboard", dashboard)):
+                for concurrency in args.concurrency:
+                    result = await drive(request, concurrency, args.requests, args.warmup)
+                    entry = {"endpoint": endpoint, "mailbox": mailbox, "concurrency": concurrency, **result}
+                    results.append(entry)
+                    log(f"{endpoint:<10} mailbox={mailbox:<7} c={concurrency:<4} {result['throughput_rps']:>8.1f} req/s  "
+                        f"p50={result['p50_ms']:.1f}  p95={result['p95_ms']:.1f}  p99={result['p99_ms']:.1f} ms  "
+                        f"errors={result['errors']}")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print each result against the baseline entry for the same scenario; return the regressions."""
+    previous = {(r["endpoint"], r["mailbox"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    log(f"\nAgainst baseline {baseline['meta'].get('git_revision')} (tolerance {tolerance:.0%}):")
+    for r in results:
+        base = previous.get((r["endpoint"], r["mailbox"], r["concurrency"]))
+        if base is None:
+            continue
+        p95_change = r["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        rps_change = r["throughput_rps"] / base["throughput_rps"] - 1 if base["throughput_rps"] else 0.0
+        regressed = p95_change > tolerance or rps_change < -tolerance
+        if regressed:
+            regressions.append(r)
+        log(f"{'REGRESSED' if regressed else 'ok':<10} {r['endpoint']:<10} mailbox={r['mailbox']:<7} c={r['concurrency']:<4} "
+            f"p95 {base['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms ({p95_change:+.0%})  "
+            f"throughput {base['throughput_rps']:.1f} -> {r['throughput_rps']:.1f} req/s ({rps_change:+.0%})")
+    return regressions
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 32])
+    parser.add_argument("--mailbox-sizes", type=int_list, default=[100, 1000])
+    parser.add_argument("--requests", type=int, default=300, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--body-bytes", type=int, default=512)
+    parser.add_argument("--inbox-limit", type=int, default=50)
+    parser.add_argument("--bridge-delay-ms", type=float, default=50)
+    parser.add_argument("--output", default="e2e_report.json")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="keep the servers' console output")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix="qumail-e2e-") as tmp:
+        bridge = BridgeStandIn(("127.0.0.1", 0), delay=args.bridge_delay_ms / 1000)
+        km_port, backend_port = free_port(), free_port()
+        os.environ.update({
+            "KM_STORE_FILE": os.path.join(tmp, "keys_store.log"),
+            "KM_URL": f"http://127.0.0.1:{km_port}",
+            "BRIDGE_URL": bridge.start(),
+            "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'qumail.db')}",
+            "QUMAIL_BLOB_DIR": os.path.join(tmp, "blobs"),
+            "KM_PER_HOST_LIMIT": str(max(args.concurrency) * 2),
+            "KM_MAX_CONNECTIONS": str(max(args.concurrency) * 2),
+        })
+        os.environ.pop("KM_NODES", None)
+        # The KM resolves its legacy key file relative to the working directory
+        os.chdir(tmp)
+        sys.path.insert(0, ROOT)
+        sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+        quiet = open(os.devnull, "w") if not args.verbose else None
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            from km_simulator.km_server import app as km_app
+            from main import app as backend_app
+            km_server, km_thread = serve(km_app, km_port)
+            backend_server, backend_thread = serve(backend_app, backend_port)
+            try:
+                base_url = f"http://127.0.0.1:{backend_port}"
+                deadline = time.monotonic() + 30
+                while httpx.get(f"{base_url}/ready").status_code != 200:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError("Backend never became ready")
+                    time.sleep(0.1)
+                results = asyncio.run(run_scenarios(args, base_url))
+            finally:
+                backend_server.should_exit = True
+                backend_thread.join(timeout=30)
+                km_server.should_exit = True
+                km_thread.join(timeout=30)
+                bridge.shutdown()
+
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "verbose")},
+            "bridge_deliveries": bridge.delivered,
+        },
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    log(f"\nReport written to {output}")
+
+    if baseline is not None and compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
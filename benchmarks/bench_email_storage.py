@@ -0,0 +1,106 @@
+"""
+Storage size and decode cost of the emails table before and after the
+binary ciphertext migration.
+
+Builds a throwaway SQLite database with the pre-migration schema, fills it
+with --rows prefixed base64 rows of varying size, then runs email_storage's
+column upgrade, search index setup and streaming migration, as backend
+startup does. Reports the VACUUMed file size and the per-row cost of
+turning a loaded row into (algorithm, ciphertext, nonce) for both formats.
+
+    python benchmarks/bench_email_storage.py --rows 50000 --body 2048
+"""
+import argparse
+import base64
+import os
+import random
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="qumail-storage-bench-")
+_db_path = os.path.join(_tmp, "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_path}")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sqlalchemy import text
+
+import models
+from database import engine, SessionLocal
+from email_search import ensure_search_index
+from email_storage import email_payload, ensure_binary_columns, migrate_legacy_rows
+
+LEGACY_SCHEMA = """
+CREATE TABLE emails (
+    id INTEGER PRIMARY KEY,
+    sender VARCHAR, recipient VARCHAR, subject VARCHAR,
+    body_encrypted TEXT,
+    security_level INTEGER, threat_score INTEGER, key_id VARCHAR, timestamp DATETIME
+)
+"""
+
+
+def file_size_mb():
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+    return os.path.getsize(_db_path) / (1024 * 1024)
+
+
+def decode_cost_us(limit):
+    db = SessionLocal()
+    try:
+        rows = db.query(models.Email).order_by(models.Email.id).limit(limit).all()
+        start = time.perf_counter()
+        for e in rows:
+            email_payload(e)
+        return (time.perf_counter() - start) / len(rows) * 1e6
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--body", type=int, default=2048, help="mean ciphertext bytes per row")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--sample", type=int, default=5000, help="rows loaded for the decode timing")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        conn.execute(text(LEGACY_SCHEMA))
+        rows = []
+        for i in range(args.rows):
+            # Spread sizes so SQLite page packing doesn't mask the difference
+            ct = base64.b64encode(os.urandom(random.randint(args.body // 2, args.body * 3 // 2))).decode()
+            if i % 3 == 1:
+                body = f"QAES_ENC({ct}:{base64.b64encode(os.urandom(12)).decode()})"
+            else:
+                body = f"OTP_ENC({ct})" if i % 3 == 0 else f"PQC_ENC({ct})"
+            rows.append({"id": i + 1, "body": body, "level": i % 3 + 1, "key": f"key-{i}"})
+        conn.execute(text(
+            "INSERT INTO emails (id, sender, recipient, subject, body_encrypted, security_level, threat_score, key_id) "
+            "VALUES (:id, 'a@qumail.local', 'b@qumail.local', 's', :body, :level, 0, :key)"
+        ), rows)
+
+    # Same upgrade steps as backend startup; the Email model maps search_keywords too
+    ensure_binary_columns(engine)
+    ensure_search_index(engine)
+    before_mb = file_size_mb()
+    before_us = decode_cost_us(args.sample)
+
+    start = time.perf_counter()
+    converted = migrate_legacy_rows(args.batch)
+    elapsed = time.perf_counter() - start
+
+    after_mb = file_size_mb()
+    after_us = decode_cost_us(args.sample)
+
+    print(f"rows: {args.rows}, ciphertext {args.body} B/row, migrated {converted} in {elapsed:.2f}s (batch {args.batch})")
+    print(f"{'format':<22} {'table MB':>10} {'decode us/row':>14}")
+    print(f"{'prefixed base64':<22} {before_mb:>10.1f} {before_us:>14.2f}")
+    print(f"{'binary columns':<22} {after_mb:>10.1f} {after_us:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Google ID token verification cost with and without the certificate and
+verified-token caches, against the local certificate stand-in.
+
+Compares the old path (fresh google_requests.Request and a certificate fetch
+per login) with google_auth_cache for distinct tokens and for a retried
+token, and reports how many certificate fetches each made. --delay-ms adds
+a simulated network round trip to each certificate fetch.
+
+    python benchmarks/bench_google_login.py --logins 200 --delay-ms 40
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+from google_certs_stand_in import GoogleCertsStandIn
+
+AUDIENCE = "qumail-stand-in-client"
+
+
+def timed(label, fn, tokens, server):
+    before = server.requests
+    start = time.perf_counter()
+    for token in tokens:
+        fn(token)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / len(tokens) * 1000:>9.2f} ms/login  cert fetches={server.requests - before}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--delay-ms", type=float, default=40)
+    args = parser.parse_args()
+
+    server = GoogleCertsStandIn(("127.0.0.1", 0), max_age=300)
+    server.delay = args.delay_ms / 1000
+    os.environ["GOOGLE_CERTS_URL"] = server.start()
+
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+    from google.oauth2 import id_token
+    from google.auth.transport import requests as google_requests
+    from google_auth_cache import verify_google_id_token
+
+    tokens = [server.mint(AUDIENCE, email=f"user{i}@qumail.local") for i in range(args.logins)]
+
+    def legacy(token):
+        id_token.verify_token(token, google_requests.Request(), audience=AUDIENCE, certs_url=server.url)
+
+    print(f"{args.logins} logins, {args.delay_ms:.0f} ms simulated certificate round trip")
+    timed("per-login cert fetch (old)", legacy, tokens, server)
+    timed("cached certs, new tokens", lambda t: verify_google_id_token(t, AUDIENCE), tokens, server)
+    timed("cached certs, retried token", lambda t: verify_google_id_token(t, AUDIENCE), [tokens[0]] * args.logins, server)
+
+
+if __name__ == "__main__":
+    main()
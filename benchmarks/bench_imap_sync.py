@@ -0,0 +1,100 @@
+"""
+Timing for the incremental IMAP sync against the local stand-in server.
+
+Fills a stand-in mailbox with --messages messages (a --qumail-ratio share of
+them QuMail dispatches, in 7bit, quoted-printable, base64 and multipart
+bodies), then times a full initial sync, an incremental sync after --new
+more messages arrive, a no-op sync, and the legacy one-FETCH-per-message
+approach for comparison. A second mailbox of the same size with --sparse-gap
+expunged UIDs before every message shows round trips following the message
+count, not the UID span. Uses a throwaway SQLite file.
+
+    python benchmarks/bench_imap_sync.py --messages 20000 --batch 500
+"""
+import argparse
+import imaplib
+import os
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="qumail-imap-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp, 'bench.db')}")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import models
+from database import engine, SessionLocal
+from mail_client.imap_client import sync_mailbox, imap_pool
+from imap_stand_in import IMAPStandIn, Mailbox, populate
+
+
+def timed_sync(label, port, batch, server, user="agent@qumail.local"):
+    server.commands.clear()
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        stats = sync_mailbox(user, "stand-in", db, host="127.0.0.1", port=port, use_ssl=False, batch=batch)
+        elapsed = time.perf_counter() - start
+    finally:
+        db.close()
+    print(f"{label:<22} {elapsed * 1000:>10.1f} ms  headers={stats['fetched_headers']:<6} "
+          f"bodies={stats['fetched_bodies']:<6} stored={stats['stored']:<6} round_trips={stats['round_trips']}")
+    return elapsed
+
+
+def legacy_fetch(port):
+    # Pre-sync behaviour: SEARCH ALL then one RFC822 FETCH round trip per message
+    start = time.perf_counter()
+    conn = imaplib.IMAP4("127.0.0.1", port)
+    conn.login("agent@qumail.local", "stand-in")
+    conn.select("INBOX")
+    typ, data = conn.search(None, "ALL")
+    for num in data[0].split():
+        conn.fetch(num, "(RFC822)")
+    conn.logout()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--new", type=int, default=500)
+    parser.add_argument("--qumail-ratio", type=float, default=0.2)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--sparse-gap", type=int, default=100)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    mailbox = Mailbox()
+    populate(mailbox, args.messages, args.qumail_ratio)
+    server = IMAPStandIn(("127.0.0.1", 0), mailbox)
+    port = server.start()
+
+    print(f"mailbox: {args.messages} messages, {args.qumail_ratio:.0%} QuMail, batch {args.batch}")
+    timed_sync("initial sync", port, args.batch, server)
+    populate(mailbox, args.new, args.qumail_ratio)
+    timed_sync(f"incremental (+{args.new})", port, args.batch, server)
+    timed_sync("no-op sync", port, args.batch, server)
+    mailbox.reset(mailbox.uidvalidity + 1)
+    timed_sync("after UIDVALIDITY reset", port, args.batch, server)
+
+    sparse = Mailbox()
+    populate(sparse, args.messages, args.qumail_ratio, recipient="sparse@qumail.local",
+             gap=args.sparse_gap, key_prefix="sparse-key")
+    sparse_server = IMAPStandIn(("127.0.0.1", 0), sparse)
+    timed_sync(f"sparse (gap {args.sparse_gap})", sparse_server.start(), args.batch, sparse_server, user="sparse@qumail.local")
+    sparse_server.shutdown()
+
+    if not args.skip_legacy:
+        elapsed = legacy_fetch(port)
+        print(f"{'legacy per-message':<22} {elapsed * 1000:>10.1f} ms  round_trips={len(mailbox.messages) + 4}")
+
+    imap_pool.close_all()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
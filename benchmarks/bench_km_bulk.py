@@ -0,0 +1,92 @@
+"""
+Key fetch throughput of the km_simulator JSON and binary bulk transports.
+
+Starts the KM in a subprocess against a throwaway key store and fetches
+keys in batches of each --sizes value through both GET /keys/{slave_id}
+(base64 in JSON) and GET /keys/{slave_id}/bulk (length-framed
+application/octet-stream), decoding with the same qkd_client functions the
+backend uses. Reports keys/s, bytes on the wire per key, and the client
+decode time.
+
+    python benchmarks/bench_km_bulk.py --sizes 1,100,10000 --keys 20000
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from km_client.qkd_client import _decode_keys, _decode_key_frames
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"KM did not come up at {url}")
+
+
+def run(client, url, number, requests, binary):
+    wire = 0
+    decode = 0.0
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(url, params={"number": number})
+        response.raise_for_status()
+        wire += len(response.content)
+        t = time.perf_counter()
+        keys = _decode_key_frames(response.content) if binary else _decode_keys(response.json())
+        decode += time.perf_counter() - t
+        assert len(keys) == number
+    elapsed = time.perf_counter() - started
+    total = number * requests
+    return total / elapsed, wire / total, decode / total * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,100,10000")
+    parser.add_argument("--keys", type=int, default=20000, help="keys fetched per size and transport")
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=ROOT, KM_STORE_FILE=os.path.join(tmp, "keys_store.log"))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "km_simulator.km_server:app", "--port", str(port), "--log-level", "warning"],
+            cwd=tmp, env=env,
+        )
+        try:
+            base = f"http://127.0.0.1:{port}"
+            wait_for(f"{base}/stats")
+            print(f"{'number':>7} {'transport':<9} {'keys/s':>10} {'bytes/key':>10} {'decode us/key':>14}")
+            with httpx.Client(timeout=60) as client:
+                for number in (int(n) for n in args.sizes.split(",")):
+                    requests = max(3, args.keys // number)
+                    for label, path, binary in (("json", "/keys/slave1", False), ("binary", "/keys/slave1/bulk", True)):
+                        rate, per_key, decode_us = run(client, base + path, number, requests, binary)
+                        print(f"{number:>7} {label:<9} {rate:>10.0f} {per_key:>10.0f} {decode_us:>14.2f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Sharded KM cluster: load spread, key_id routing and failover.
+
+Starts --nodes local KM processes (km_simulator.cluster), points qkd_client
+at them through KM_NODES, and runs --concurrency async workers that each
+fetch a batch of keys and retrieve every one back from its owning node.
+Reports throughput and how fetches spread over the nodes. It then stops one
+node and repeats. Fetches fail over to the remaining nodes, and the keys
+they mint are retrieved from those nodes, so neither should fail.
+
+    python benchmarks/bench_km_cluster.py --nodes 3 --concurrency 16 --rounds 200
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from km_simulator.cluster import KMCluster
+
+
+def free_base_port(nodes):
+    # A run of consecutive free ports, one per node
+    while True:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            base = s.getsockname()[1]
+        if base + nodes >= 65535:
+            continue
+        try:
+            for port in range(base, base + nodes):
+                with socket.socket() as probe:
+                    probe.bind(("127.0.0.1", port))
+            return base
+        except OSError:
+            continue
+
+
+async def run_phase(qkd_client, concurrency, rounds, batch):
+    fetched = retrieved = fetch_failures = retrieve_failures = 0
+    by_shard = {}
+    fallback = b"0" * 1024
+    queue = iter(range(rounds))
+
+    async def worker():
+        nonlocal fetched, retrieved, fetch_failures, retrieve_failures
+        for _ in queue:
+            keys = await qkd_client.fetch_qkd_keys_async(batch)
+            if not keys:
+                fetch_failures += 1
+                continue
+            fetched += len(keys)
+            for key_id, key_bytes in keys:
+                shard = key_id.partition(".")[0]
+                by_shard[shard] = by_shard.get(shard, 0) + 1
+                if await qkd_client.retrieve_qkd_key(key_id) == fallback:
+                    retrieve_failures += 1
+                else:
+                    retrieved += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "keys/s": round((fetched + retrieved) / elapsed),
+        "fetch failures": fetch_failures,
+        "retrieve failures": retrieve_failures,
+        "keys by shard": dict(sorted(by_shard.items())),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cluster = KMCluster(args.nodes, free_base_port(args.nodes), tmp)
+        os.environ["KM_NODES"] = cluster.start()
+        os.environ["QKD_CACHE_MAX"] = "1"
+        try:
+            from km_client import qkd_client
+
+            async def scenario():
+                print(f"{args.nodes} nodes, {args.concurrency} workers, {args.rounds} x {args.batch} keys")
+                print("all nodes up:  ", await run_phase(qkd_client, args.concurrency, args.rounds, args.batch))
+                stopped = cluster.shards[0][0]
+                cluster.stop_node(stopped)
+                print(f"{stopped} stopped:    ", await run_phase(qkd_client, args.concurrency, args.rounds, args.batch))
+                print("node stats:    ", qkd_client.km_router.stats())
+
+            asyncio.run(scenario())
+        finally:
+            cluster.stop()
+
+
+if __name__ == "__main__":
+    main()
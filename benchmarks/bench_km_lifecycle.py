@@ -0,0 +1,88 @@
+"""
+Simulated months of KM traffic against the key store lifecycle, following
+the backend's call pattern.
+
+Each simulated day the backend sends --emails-per-day emails. It mints
+their keys in key-pool batches of --pool-batch. Recipients open
+--read-ratio of that day's mail, and each opened email's key is retrieved
+without consume, in inbox-sized bulk requests. When an email passes
+--retention-days, the retention purge consumes its key, read or not. The
+KM sweeper (and compaction when it is due) runs at each day's virtual
+clock.
+
+Prints the live key count, log size and index rebuild time, which stay
+flat once the retention window is full. Also prints how many emails still
+inside the retention window have lost their key. That count stays 0
+unless --ttl-days (KM_KEY_TTL) is set, in which case unread mail loses its
+keys once the TTL passes.
+
+    python benchmarks/bench_km_lifecycle.py --days 120 --emails-per-day 2000 --retention-days 30
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from km_simulator import key_store
+from km_simulator.key_store import KeyStore
+
+DAY = 86400
+# Keys per inbox bulk retrieve and per retention purge batch, as the backend sends them
+INBOX_PAGE = 50
+PURGE_BATCH = 500
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--emails-per-day", type=int, default=2000)
+    parser.add_argument("--read-ratio", type=float, default=0.7)
+    parser.add_argument("--retention-days", type=int, default=30)
+    parser.add_argument("--ttl-days", type=float, default=0, help="KM_KEY_TTL in days; 0 never expires issued keys")
+    parser.add_argument("--pool-batch", type=int, default=64)
+    parser.add_argument("--report-every", type=int, default=15)
+    args = parser.parse_args()
+
+    clock = [time.time()]
+    sent_by_day = []
+    with tempfile.TemporaryDirectory() as tmp, mock.patch.object(key_store.time, "time", lambda: clock[0]):
+        path = os.path.join(tmp, "keys_store.log")
+        store = KeyStore(path, key_ttl=args.ttl_days * DAY or None)
+        print(f"{'day':>5} {'sent':>9} {'retained':>9} {'live keys':>10} {'log MB':>8} {'rebuild ms':>11} {'unreadable':>11}")
+        for day in range(1, args.days + 1):
+            ids = [str(uuid.uuid4()) for _ in range(args.emails_per_day)]
+            for start in range(0, len(ids), args.pool_batch):
+                store.put_many((key_id, os.urandom(1024)) for key_id in ids[start:start + args.pool_batch])
+            sent_by_day.append(ids)
+            opened = random.sample(ids, int(len(ids) * args.read_ratio))
+            for start in range(0, len(opened), INBOX_PAGE):
+                store.deliver_many(opened[start:start + INBOX_PAGE])
+            if len(sent_by_day) > args.retention_days:
+                expired = sent_by_day.pop(0)
+                for start in range(0, len(expired), PURGE_BATCH):
+                    store.deliver_many(expired[start:start + PURGE_BATCH], consume=True)
+            clock[0] += DAY
+            store.sweep()
+            if store.needs_compaction():
+                with mock.patch("builtins.print"):
+                    store.compact()
+            if day % args.report_every == 0 or day == args.days:
+                started = time.perf_counter()
+                reopened = KeyStore(path)
+                rebuild_ms = (time.perf_counter() - started) * 1000
+                reopened.close()
+                retained = sum(len(day_ids) for day_ids in sent_by_day)
+                unreadable = sum(1 for day_ids in sent_by_day for key_id in day_ids if key_id not in store)
+                print(f"{day:>5} {day * args.emails_per_day:>9} {retained:>9} {len(store):>10} "
+                      f"{os.path.getsize(path) / 1e6:>8.1f} {rebuild_ms:>11.1f} {unreadable:>11}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Mint-latency benchmark for the km_simulator append-only key store.
+
+Appends keys in request-sized batches and reports the mean mint latency per
+window, so a flat curve past 100k keys shows appends stay O(batch).
+
+    python benchmarks/bench_km_store.py --keys 120000 --batch 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from km_simulator.key_store import KeyStore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=120000)
+    parser.add_argument("--batch", type=int, default=10)
+    parser.add_argument("--window", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "keys_store.log")
+        store = KeyStore(path)
+        window_start = time.perf_counter()
+        window_requests = 0
+        minted = 0
+        print(f"{'keys':>10} {'mint ms/request':>16}")
+        while minted < args.keys:
+            store.put_many((str(uuid.uuid4()), os.urandom(1024)) for _ in range(args.batch))
+            minted += args.batch
+            window_requests += 1
+            if minted % args.window < args.batch:
+                elapsed = time.perf_counter() - window_start
+                print(f"{minted:>10} {elapsed / window_requests * 1000:>16.3f}")
+                window_start = time.perf_counter()
+                window_requests = 0
+        store.close()
+
+        started = time.perf_counter()
+        reopened = KeyStore(path)
+        print(f"Index rebuild for {len(reopened)} keys: {(time.perf_counter() - started) * 1000:.1f} ms")
+        reopened.close()
+
+
+if __name__ == "__main__":
+    main()
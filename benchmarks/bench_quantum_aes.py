@@ -0,0 +1,54 @@
+"""
+Inbox-style Quantum-AES decrypt throughput.
+
+Decrypts --messages ciphertexts spread over --keys distinct key_ids three
+ways: the original per-call derivation, the key_id-cached context, and the
+thread-pooled batch API. Reports messages per second for each.
+
+    python benchmarks/bench_quantum_aes.py --messages 20000 --keys 50 --size 2048
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from encryption.crypto_plugins.quantum_aes import encrypt_quantum_aes, decrypt_quantum_aes, decrypt_quantum_aes_batch
+
+
+def legacy_decrypt(ciphertext, qkd_key, nonce):
+    return AESGCM(hashlib.sha256(qkd_key).digest()).decrypt(nonce, ciphertext, None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=50)
+    parser.add_argument("--size", type=int, default=2048)
+    args = parser.parse_args()
+
+    keys = [(str(uuid.uuid4()), os.urandom(1024)) for _ in range(args.keys)]
+    messages = []
+    for i in range(args.messages):
+        key_id, key = keys[i % len(keys)]
+        ciphertext, nonce = encrypt_quantum_aes(os.urandom(args.size), key)
+        messages.append((ciphertext, nonce, key, key_id))
+
+    def report(name, fn):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        print(f"{name:>10}: {args.messages / elapsed:>10.0f} msg/s")
+
+    report("legacy", lambda: [legacy_decrypt(c, k, n) for c, n, k, _ in messages])
+    report("cached", lambda: [decrypt_quantum_aes(c, k, n, key_id) for c, n, k, key_id in messages])
+    report("batch", lambda: decrypt_quantum_aes_batch(messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Multi-recipient send: one POST /email/send per recipient vs POST /email/send/batch.
+
+Starts the km_simulator and backend apps in this process, as bench_e2e does
+(bridge stand-in, throwaway SQLite database and key log). For each
+--recipients count it sends one message to that many recipients twice: as
+individual /email/send calls from --concurrency clients, and as a single
+/email/send/batch call. Then it reports emails/s for both. Levels cycle
+1-3 across recipients, so every batch mixes OTP, QAES and PQC.
+
+    python benchmarks/bench_send_batch.py --recipients 10,100,500 --concurrency 8
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_e2e import SENDER, free_port, int_list, log, message_body, serve
+from bridge_stand_in import BridgeStandIn
+
+
+async def send_individually(client, recipients, body, concurrency):
+    pending = iter(enumerate(recipients))
+
+    async def worker():
+        for i, address in pending:
+            r = await client.post("/email/send", headers={"x-agent-email": SENDER}, json={
+                "recipient": address, "subject": "Bulletin", "body": body, "security_level": i % 3 + 1,
+            })
+            r.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def send_batch(client, recipients, body):
+    r = await client.post("/email/send/batch", headers={"x-agent-email": SENDER}, json={
+        "recipients": [{"address": address, "security_level": i % 3 + 1} for i, address in enumerate(recipients)],
+        "subject": "Bulletin", "body": body, "security_level": 1,
+    })
+    r.raise_for_status()
+    if len(r.json()["ids"]) != len(recipients):
+        raise RuntimeError("Batch stored fewer emails than recipients")
+
+
+async def run(args, base_url):
+    body = message_body(args.body_bytes, 0)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        # Warm the key pool, threat model and connection pools before timing anything
+        await send_individually(client, [f"warmup{i}@qumail.local" for i in range(10)], body, 1)
+        await send_batch(client, [f"warmup{i}@qumail.local" for i in range(10)], body)
+        log(f"{'recipients':>10} {'single emails/s':>16} {'batch emails/s':>15} {'speedup':>8}")
+        for count in args.recipients:
+            recipients = [f"bulletin{i}@qumail.local" for i in range(count)]
+            single = batch = float("inf")
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                await send_individually(client, recipients, body, args.concurrency)
+                single = min(single, time.perf_counter() - started)
+                started = time.perf_counter()
+                await send_batch(client, recipients, body)
+                batch = min(batch, time.perf_counter() - started)
+            log(f"{count:>10} {count / single:>16.0f} {count / batch:>15.0f} {single / batch:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int_list, default=[10, 100, 500])
+    parser.add_argument("--concurrency", type=int, default=8, help="clients for the one-call-per-recipient run")
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs per size")
+    parser.add_argument("--body-bytes", type=int, default=512)
+    parser.add_argument("--verbose", action="store_true", help="keep the servers' console output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="qumail-batch-") as tmp:
+        bridge = BridgeStandIn(("127.0.0.1", 0))
+        km_port, backend_port = free_port(), free_port()
+        os.environ.update({
+            "KM_STORE_FILE": os.path.join(tmp, "keys_store.log"),
+            "KM_URL": f"http://127.0.0.1:{km_port}",
+            "BRIDGE_URL": bridge.start(),
+            "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'qumail.db')}",
+        })
+        os.environ.pop("KM_NODES", None)
+        os.chdir(tmp)
+        sys.path.insert(0, ROOT)
+        sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+        quiet = open(os.devnull, "w") if not args.verbose else None
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            from km_simulator.km_server import app as km_app
+            from main import app as backend_app
+            km_server, km_thread = serve(km_app, km_port)
+            backend_server, backend_thread = serve(backend_app, backend_port)
+            try:
+                base_url = f"http://127.0.0.1:{backend_port}"
+                deadline = time.monotonic() + 30
+                while httpx.get(f"{base_url}/ready").status_code != 200:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError("Backend never became ready")
+                    time.sleep(0.1)
+                asyncio.run(run(args, base_url))
+            finally:
+                backend_server.should_exit = True
+                backend_thread.join(timeout=30)
+                km_server.should_exit = True
+                km_thread.join(timeout=30)
+                bridge.shutdown()
+
+
+if __name__ == "__main__":
+    main()
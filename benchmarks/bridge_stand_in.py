@@ -0,0 +1,63 @@
+"""
+Local stand-in for the Google Apps Script mail bridge.
+
+Accepts the JSON POSTs smtp_client sends to BRIDGE_URL and answers 200, as
+the real bridge does for a delivered message, after an optional simulated
+delay. Counts deliveries so a benchmark can check the outbound queue kept up.
+
+    python benchmarks/bridge_stand_in.py --port 8097 --delay-ms 50
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class BridgeStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay=0.0):
+        super().__init__(address, BridgeHandler)
+        self.delay = delay  # simulated Apps Script execution time
+        self.delivered = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/exec"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="bridge-stand-in", daemon=True).start()
+        return self.url
+
+
+class BridgeHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        with self.server._lock:
+            self.server.delivered += 1
+        body = b"Success"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8097)
+    parser.add_argument("--delay-ms", type=float, default=0)
+    args = parser.parse_args()
+    server = BridgeStandIn(("127.0.0.1", args.port), delay=args.delay_ms / 1000)
+    print(f"BRIDGE_URL={server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
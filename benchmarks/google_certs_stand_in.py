@@ -0,0 +1,113 @@
+"""
+Local stand-in for Google's OAuth2 certificate endpoint.
+
+Serves {key_id: PEM certificate} like https://www.googleapis.com/oauth2/v1/certs,
+with a Cache-Control max-age header, and mints ID tokens signed by the
+matching private key. Point the backend at it with GOOGLE_CERTS_URL.
+
+    python benchmarks/google_certs_stand_in.py --port 8098 --max-age 300
+"""
+import argparse
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+
+class SigningKey:
+    def __init__(self, key_id):
+        self.key_id = key_id
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "qumail-google-stand-in")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.certificate = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(self.private_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=30))
+            .sign(self.private_key, hashes.SHA256())
+        )
+
+    def certificate_pem(self):
+        return self.certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+    def private_pem(self):
+        return self.private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode()
+
+
+class GoogleCertsStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, max_age=300, keys=1):
+        super().__init__(address, CertsHandler)
+        self.max_age = max_age
+        self.keys = [SigningKey(f"stand-in-{i}") for i in range(keys)]
+        self.requests = 0
+        self.delay = 0.0  # simulated network round trip
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/oauth2/v1/certs"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="google-certs-stand-in", daemon=True).start()
+        return self.url
+
+    def rotate(self):
+        """Add a new signing key, as Google does ahead of retiring an old one."""
+        key = SigningKey(f"stand-in-{len(self.keys)}")
+        self.keys.append(key)
+        return key
+
+    def mint(self, audience, email="agent@qumail.local", lifetime=3600, key=None, issuer="https://accounts.google.com"):
+        from google.auth import crypt, jwt
+        key = key or self.keys[-1]
+        now = int(time.time())
+        signer = crypt.RSASigner.from_string(key.private_pem(), key_id=key.key_id)
+        payload = {"iss": issuer, "aud": audience, "sub": email, "email": email, "name": "Stand-in User",
+                   "iat": now, "exp": now + lifetime}
+        return jwt.encode(signer, payload).decode()
+
+
+class CertsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        if server.delay:
+            time.sleep(server.delay)
+        body = json.dumps({key.key_id: key.certificate_pem() for key in server.keys}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Cache-Control", f"public, max-age={server.max_age}, must-revalidate, no-transform")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--max-age", type=int, default=300)
+    parser.add_argument("--audience", default="qumail-stand-in-client")
+    args = parser.parse_args()
+    server = GoogleCertsStandIn(("127.0.0.1", args.port), max_age=args.max_age)
+    print(f"certs: {server.url}")
+    print(f"sample token (aud={args.audience}): {server.mint(args.audience)}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Minimal in-memory IMAP4rev1 server for exercising mail_client.imap_client
+without a real mailbox.
+
+Implements just what the client uses: CAPABILITY, LOGIN, SELECT/EXAMINE
+(with UIDVALIDITY/UIDNEXT response codes), STATUS, SEARCH ALL, UID SEARCH UID
+n:*, FETCH/UID FETCH of RFC822, BODY[], BODY[TEXT] and BODY[HEADER.FIELDS (...)],
+NOOP and LOGOUT. Every command is counted so callers can check round trips.
+
+QuMail messages rotate through the transfer encodings real providers hand
+back (7bit, quoted-printable, base64, and a multipart/alternative with an
+HTML part), with a non-ASCII banner so none of them is plain ASCII text.
+
+    python benchmarks/imap_stand_in.py --messages 10000 --port 1143
+"""
+import argparse
+import email.policy
+import email.utils
+from email.message import EmailMessage
+import json
+import re
+import socketserver
+import threading
+
+_FETCH_ITEM_RE = re.compile(r"BODY(?:\.PEEK)?\[([^\]]*)\]|RFC822|UID", re.IGNORECASE)
+
+
+QUMAIL_ENCODINGS = ("7bit", "quoted-printable", "base64", "multipart")
+
+
+def qumail_message(uid, recipient="agent@qumail.local", sender="alice@qumail.local", encoding="7bit", key_prefix="stand-in-key"):
+    """A message shaped like a bridge dispatch from mail_client.smtp_client, as delivered with `encoding`."""
+    payload = {
+        "qumail_secure_payload": True,
+        "security_level": 1,
+        "algorithm": "OTP (One-Time Pad)",
+        "key_id": f"{key_prefix}-{uid}",
+        "ciphertext": "c2VjdXJlIHBheWxvYWQ="
+    }
+    body = (
+        "  QUMAIL QUANTUM SECURE DISPATCH\n\n"
+        f"FROM: {sender}\n"
+        f"TO: {recipient}\n\n"
+        "--- PAYLOAD ---\n"
+        f"{json.dumps(payload, indent=2)}\n"
+    )
+    headers = (
+        f"From: bridge@qumail.local\r\n"
+        f"To: {recipient}\r\n"
+        f"Subject: QuMail: Status report {uid} (from {sender})\r\n"
+        f"Date: {email.utils.formatdate()}\r\n"
+    )
+    if encoding == "7bit":
+        return (headers + "Content-Type: text/plain; charset=utf-8\r\n\r\n" + body).encode()
+    msg = EmailMessage(policy=email.policy.SMTP)
+    for name, value in (line.split(": ", 1) for line in headers.strip().split("\r\n")):
+        msg[name] = value
+    # Non-ASCII banner, so the provider must re-encode the text part
+    banner = "⚛ Quantum-secured message · do not reply\n\n"
+    if encoding == "multipart":
+        msg.set_content(banner + body, cte="quoted-printable")
+        msg.add_alternative(f"<html><body><pre>{banner + body}</pre></body></html>", subtype="html", cte="base64")
+    else:
+        msg.set_content(banner + body, cte=encoding)
+    return msg.as_bytes()
+
+
+def plain_message(uid, recipient="agent@qumail.local"):
+    return (
+        "From: newsletter@example.com\r\n"
+        f"To: {recipient}\r\n"
+        f"Subject: Weekly digest {uid}\r\n"
+        f"Date: {email.utils.formatdate()}\r\n"
+        "\r\n"
+        + "Ordinary mail that the sync should skip without downloading.\n" * 20
+    ).encode()
+
+
+class Mailbox:
+    def __init__(self, uidvalidity=1):
+        self.uidvalidity = uidvalidity
+        self.messages = []  # (uid, raw bytes), ascending uid
+        self.uidnext = 1
+        self.lock = threading.Lock()
+
+    def append(self, raw):
+        with self.lock:
+            self.messages.append((self.uidnext, raw))
+            self.uidnext += 1
+
+    def skip(self, count):
+        """Burn UIDs as if that many messages arrived and were expunged."""
+        with self.lock:
+            self.uidnext += count
+
+    def reset(self, uidvalidity):
+        """Simulate a server-side mailbox rebuild: new UIDVALIDITY, UIDs renumbered."""
+        with self.lock:
+            self.uidvalidity = uidvalidity
+            self.messages = [(i + 1, raw) for i, (_, raw) in enumerate(self.messages)]
+            self.uidnext = len(self.messages) + 1
+
+
+def _parse_set(spec, highest):
+    selected = set()
+    for part in spec.split(","):
+        if ":" in part:
+            low, high = part.split(":")
+            low = highest if low == "*" else int(low)
+            high = highest if high == "*" else int(high)
+            selected.update(range(min(low, high), max(low, high) + 1))
+        else:
+            selected.add(highest if part == "*" else int(part))
+    return selected
+
+
+def _section(raw, section):
+    head, _, text = raw.partition(b"\r\n\r\n")
+    section = section.upper()
+    if section == "TEXT":
+        return text
+    if section.startswith("HEADER.FIELDS"):
+        wanted = {name.encode().lower() for name in section[section.index("(") + 1:section.rindex(")")].split()}
+        lines = [line for line in head.split(b"\r\n") if line.split(b":", 1)[0].lower() in wanted]
+        return b"\r\n".join(lines) + b"\r\n\r\n"
+    if section == "HEADER":
+        return head + b"\r\n\r\n"
+    return raw
+
+
+class IMAPHandler(socketserver.StreamRequestHandler):
+    def send(self, line):
+        self.wfile.write(line if isinstance(line, bytes) else line.encode())
+
+    def handle(self):
+        server = self.server
+        self.send("* OK [CAPABILITY IMAP4rev1] QuMail IMAP stand-in ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.decode().rstrip("\r\n").split(" ", 2)
+            if len(parts) < 2:
+                continue
+            tag, command = parts[0], parts[1].upper()
+            args = parts[2] if len(parts) > 2 else ""
+            with server.stats_lock:
+                server.commands[command] = server.commands.get(command, 0) + 1
+            if command == "UID":
+                sub, _, args = args.partition(" ")
+                if sub.upper() == "FETCH":
+                    self.fetch(tag, args, by_uid=True)
+                elif sub.upper() == "SEARCH":
+                    self.uid_search(tag, args)
+                else:
+                    self.send(f"{tag} BAD unsupported\r\n")
+            elif command == "FETCH":
+                self.fetch(tag, args, by_uid=False)
+            elif command == "CAPABILITY":
+                self.send("* CAPABILITY IMAP4rev1\r\n" f"{tag} OK CAPABILITY completed\r\n")
+            elif command == "LOGIN":
+                self.send(f"{tag} OK LOGIN completed\r\n")
+            elif command in ("SELECT", "EXAMINE"):
+                box = server.mailbox
+                self.send(
+                    f"* {len(box.messages)} EXISTS\r\n* 0 RECENT\r\n"
+                    f"* OK [UIDVALIDITY {box.uidvalidity}] UIDs valid\r\n"
+                    f"* OK [UIDNEXT {box.uidnext}] Predicted next UID\r\n"
+                    f"{tag} OK [{'READ-ONLY' if command == 'EXAMINE' else 'READ-WRITE'}] {command} completed\r\n"
+                )
+            elif command == "STATUS":
+                box = server.mailbox
+                name = args.split(" ", 1)[0]
+                self.send(
+                    f"* STATUS {name} (UIDVALIDITY {box.uidvalidity} UIDNEXT {box.uidnext} MESSAGES {len(box.messages)})\r\n"
+                    f"{tag} OK STATUS completed\r\n"
+                )
+            elif command == "SEARCH":
+                # Only SEARCH ALL, as used by the pre-sync client
+                seqs = " ".join(str(i) for i in range(1, len(server.mailbox.messages) + 1))
+                self.send(f"* SEARCH {seqs}\r\n{tag} OK SEARCH completed\r\n")
+            elif command == "NOOP":
+                self.send(f"{tag} OK NOOP completed\r\n")
+            elif command == "LOGOUT":
+                self.send(f"* BYE logging out\r\n{tag} OK LOGOUT completed\r\n")
+                return
+            else:
+                self.send(f"{tag} BAD unsupported command\r\n")
+            self.wfile.flush()
+
+    def uid_search(self, tag, args):
+        # Only "UID <set>", as used by the incremental sync
+        criterion, _, spec = args.partition(" ")
+        if criterion.upper() != "UID":
+            self.send(f"{tag} BAD unsupported search\r\n")
+            return
+        with self.server.mailbox.lock:
+            uids = [uid for uid, _ in self.server.mailbox.messages]
+        selected = _parse_set(spec, uids[-1] if uids else 0)
+        found = "".join(f" {uid}" for uid in uids if uid in selected)
+        self.send(f"* SEARCH{found}\r\n{tag} OK SEARCH completed\r\n")
+
+    def fetch(self, tag, args, by_uid):
+        spec, _, items = args.partition(" ")
+        wanted = [m.group(0) for m in _FETCH_ITEM_RE.finditer(items)]
+        with self.server.mailbox.lock:
+            messages = list(self.server.mailbox.messages)
+        if by_uid:
+            highest = messages[-1][0] if messages else 0
+            selected = _parse_set(spec, highest)
+            chosen = [(seq, uid, raw) for seq, (uid, raw) in enumerate(messages, 1) if uid in selected]
+        else:
+            selected = _parse_set(spec, len(messages))
+            chosen = [(seq, uid, raw) for seq, (uid, raw) in enumerate(messages, 1) if seq in selected]
+        out = []
+        for seq, uid, raw in chosen:
+            fields, literal = [f"UID {uid}"], None
+            for item in wanted:
+                upper = item.upper()
+                if upper == "UID":
+                    continue
+                if upper == "RFC822":
+                    name, literal = "RFC822", raw
+                else:
+                    section = _FETCH_ITEM_RE.match(item).group(1)
+                    name, literal = f"BODY[{section}]", _section(raw, section)
+                fields.append(f"{name} {{{len(literal)}}}")
+            if literal is None:
+                out.append(f"* {seq} FETCH ({' '.join(fields)})\r\n".encode())
+            else:
+                out.append(f"* {seq} FETCH ({' '.join(fields)}\r\n".encode() + literal + b")\r\n")
+        out.append(f"{tag} OK FETCH completed\r\n".encode())
+        self.send(b"".join(out))
+
+
+class IMAPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, mailbox):
+        super().__init__(address, IMAPHandler)
+        self.mailbox = mailbox
+        self.commands = {}
+        self.stats_lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="imap-stand-in", daemon=True).start()
+        return self.server_address[1]
+
+
+def populate(mailbox, messages, qumail_ratio=0.2, recipient="agent@qumail.local", gap=0, key_prefix="stand-in-key"):
+    """Append messages; gap > 0 burns that many UIDs before each one, for a sparse mailbox."""
+    every = max(1, round(1 / qumail_ratio)) if qumail_ratio else 0
+    for i in range(messages):
+        if gap:
+            mailbox.skip(gap)
+        uid = mailbox.uidnext
+        if every and i % every == 0:
+            encoding = QUMAIL_ENCODINGS[(i // every) % len(QUMAIL_ENCODINGS)]
+            mailbox.append(qumail_message(uid, recipient, encoding=encoding, key_prefix=key_prefix))
+        else:
+            mailbox.append(plain_message(uid, recipient))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--qumail-ratio", type=float, default=0.2)
+    parser.add_argument("--port", type=int, default=1143)
+    args = parser.parse_args()
+
+    mailbox = Mailbox()
+    populate(mailbox, args.messages, args.qumail_ratio)
+    server = IMAPStandIn(("127.0.0.1", args.port), mailbox)
+    print(f"IMAP stand-in with {args.messages} messages on 127.0.0.1:{args.port} (IMAP_SSL=0)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Load test for the pooled async KM client against a local stand-in KM.
+
+The stand-in answers /keys/retrieve/{key_id} after --latency-ms of simulated
+network/KM time. Each concurrency level runs --requests retrievals of unique
+key_ids through qkd_client.retrieve_qkd_key (so the local cache never hits)
+and reports requests per second, next to the previous one-connection-per-call
+requests.get client for comparison.
+
+    python benchmarks/load_km_client.py --latency-ms 5 --requests 2000
+"""
+import argparse
+import asyncio
+import base64
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import uvicorn
+from fastapi import FastAPI
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stand_in_km(port, latency_s):
+    km = FastAPI()
+    key_b64 = base64.b64encode(os.urandom(1024)).decode("utf-8")
+
+    @km.get("/keys/retrieve/{key_id}")
+    async def retrieve(key_id: str):
+        await asyncio.sleep(latency_s)
+        return {"key_id": key_id, "key": key_b64}
+
+    server = uvicorn.Server(uvicorn.Config(km, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    port = free_port()
+    os.environ["KM_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["KM_PER_HOST_LIMIT"] = str(max(CONCURRENCY_LEVELS))
+    os.environ["KM_MAX_CONNECTIONS"] = str(max(CONCURRENCY_LEVELS))
+    from km_client import qkd_client
+
+    server = start_stand_in_km(port, args.latency_ms / 1000)
+
+    async def pooled_run(concurrency):
+        queue = iter(range(args.requests))
+
+        async def worker():
+            for _ in queue:
+                await qkd_client.retrieve_qkd_key(str(uuid.uuid4()))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return args.requests / (time.perf_counter() - started)
+
+    def legacy_run(concurrency):
+        url = f"{qkd_client.KM_URL}/keys/retrieve/"
+
+        def call(_):
+            base64.b64decode(requests.get(url + str(uuid.uuid4()), timeout=3).json()["key"])
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(call, range(args.requests)))
+        return args.requests / (time.perf_counter() - started)
+
+    print(f"stand-in KM latency {args.latency_ms} ms, {args.requests} requests per level")
+    print(f"{'concurrency':>12} {'pooled async req/s':>20} {'legacy req/s':>14}")
+    for concurrency in CONCURRENCY_LEVELS:
+        pooled = asyncio.run(pooled_run(concurrency))
+        qkd_client.key_cache.zeroize()
+        legacy = legacy_run(concurrency)
+        print(f"{concurrency:>12} {pooled:>20.0f} {legacy:>14.0f}")
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,34 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useMemo, useRef } from 'react';
 import { Mail, Unlock, ShieldAlert, FileWarning, Key } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
-import { getInbox } from '../services/api';
+import { getInbox, decryptEmail } from '../services/api';
 
 const Inbox = () => {
     const [selectedEmail, setSelectedEmail] = useState(null);
     const [decrypting, setDecrypting] = useState(false);
-    const [emails, setEmails] = useState([]);
+    // The newest page is re-polled; older pages are fetched on demand by following the cursor
+    const [latest, setLatest] = useState([]);
+    const [older, setOlder] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingOlder, setLoadingOlder] = useState(false);
+    const olderLoaded = useRef(false);
+    // Only the latest selection may fill the viewer once its decrypt returns
+    const selectedId = useRef(null);
+
+    const formatEmails = (data) => data.map(item => ({
+        ...item,
+        level: item.security_level,
+        time: new Date(item.timestamp).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
+    }));
 
     useEffect(() => {
         const loadEmails = async () => {
             try {
-                const data = await getInbox();
-                const formattedData = data.map(item => ({
-                    ...item,
-                    level: item.security_level,
-                    time: new Date(item.timestamp).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
-                }));
-                setEmails(formattedData);
+                const page = await getInbox();
+                setLatest(formatEmails(page.emails));
+                if (!olderLoaded.current) {
+                    setNextCursor(page.nextCursor);
+                }
             } catch (err) {
                 console.error("Failed to fetch inbox", err);
             }
@@ -27,11 +38,41 @@ const Inbox = () => {
         return () => clearInterval(interval);
     }, []);
 
-    const handleSelect = (email) => {
+    const loadOlder = async () => {
+        if (!nextCursor || loadingOlder) return;
+        setLoadingOlder(true);
+        try {
+            const page = await getInbox(nextCursor);
+            olderLoaded.current = true;
+            setOlder(prev => [...prev, ...formatEmails(page.emails)]);
+            setNextCursor(page.nextCursor);
+        } catch (err) {
+            console.error("Failed to fetch older messages", err);
+        } finally {
+            setLoadingOlder(false);
+        }
+    };
+
+    const emails = useMemo(() => {
+        const oldestLatest = latest.length ? latest[latest.length - 1].id : Infinity;
+        return [...latest, ...older.filter(email => email.id < oldestLatest)];
+    }, [latest, older]);
+
+    const handleSelect = async (email) => {
+        // The inbox poll carries headers only; the body is decrypted on demand
+        selectedId.current = email.id;
         setSelectedEmail(email);
-        setDecrypting(email.level > 1);
-        if (email.level > 1) {
-            setTimeout(() => setDecrypting(false), 2000); // Simulate KMS fetch & decrypt
+        setDecrypting(true);
+        let body;
+        try {
+            body = (await decryptEmail(email.id)).body;
+        } catch (err) {
+            console.error("Failed to decrypt email", err);
+            body = "[Decryption failed: QKD key material unavailable]";
+        }
+        if (selectedId.current === email.id) {
+            setSelectedEmail({ ...email, body });
+            setDecrypting(false);
         }
     };
 
@@ -81,6 +122,15 @@ const Inbox = () => {
                                 </div>
                             </div>
                         ))}
+                        {nextCursor && (
+                            <button
+                                onClick={loadOlder}
+                                disabled={loadingOlder}
+                                className="w-full py-2 text-xs font-mono uppercase tracking-widest text-gray-400 border border-white/10 rounded-lg hover:text-neonCyan hover:border-neonCyan/40 transition disabled:opacity-50"
+                            >
+                                {loadingOlder ? 'Loading older packets...' : 'Load older messages'}
+                            </button>
+                        )}
                     </div>
                 </div>
 
@@ -44,8 +44,20 @@ export const sendEncryptedEmail = async (payload) => {
     return response.data;
 };
 
-export const getInbox = async () => {
-    const response = await api.get('/email/inbox');
+// One page of inbox headers (no bodies), newest first. Pass the nextCursor of a page to get the
+// page after it; nextCursor is null on the last page. Bodies come from decryptEmail.
+export const getInbox = async (cursor = null) => {
+    const params = { headers_only: true };
+    if (cursor) {
+        params.cursor = cursor;
+    }
+    const response = await api.get('/email/inbox', { params });
+    return { emails: response.data, nextCursor: response.headers['x-next-cursor'] || null };
+};
+
+// Fetch QKD key material for one email and return it with its decrypted body
+export const decryptEmail = async (id) => {
+    const response = await api.get(`/email/${id}/decrypt`);
     return response.data;
 };
 
@@ -0,0 +1,89 @@
+"""
+Run several KM simulator nodes locally, one process per shard.
+
+Node i listens on base_port + i as shard km<i>, with its own key log in
+--data-dir. Prints the KM_NODES value to give the backend.
+
+    python -m km_simulator.cluster --nodes 3 --base-port 8001
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class KMCluster:
+    def __init__(self, nodes=3, base_port=8001, data_dir=".", host="127.0.0.1"):
+        self.shards = [(f"km{i}", base_port + i) for i in range(nodes)]
+        self.data_dir = data_dir
+        self.host = host
+        self.processes = {}
+
+    @property
+    def nodes_env(self):
+        return ",".join(f"{shard}=http://{self.host}:{port}" for shard, port in self.shards)
+
+    def start_node(self, shard, port):
+        env = dict(
+            os.environ,
+            PYTHONPATH=ROOT,
+            KM_SHARD_ID=shard,
+            KM_STORE_FILE=os.path.join(self.data_dir, f"keys_store.{shard}.log"),
+        )
+        self.processes[shard] = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "km_simulator.km_server:app",
+             "--host", self.host, "--port", str(port), "--log-level", "warning"],
+            cwd=self.data_dir, env=env,
+        )
+
+    def start(self, timeout=15):
+        for shard, port in self.shards:
+            self.start_node(shard, port)
+        deadline = time.monotonic() + timeout
+        for shard, port in self.shards:
+            while True:
+                try:
+                    httpx.get(f"http://{self.host}:{port}/stats", timeout=1)
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"KM node {shard} did not come up on port {port}")
+                    time.sleep(0.1)
+        return self.nodes_env
+
+    def stop_node(self, shard):
+        process = self.processes.pop(shard, None)
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    def stop(self):
+        for shard in list(self.processes):
+            self.stop_node(shard)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=8001)
+    parser.add_argument("--data-dir", default=".")
+    args = parser.parse_args()
+
+    cluster = KMCluster(args.nodes, args.base_port, os.path.abspath(args.data_dir))
+    print(f"KM_NODES={cluster.start()}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cluster.stop()
+
+
+if __name__ == "__main__":
+    main()
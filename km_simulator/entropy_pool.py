@@ -0,0 +1,60 @@
+import os
+import threading
+
+
+class EntropyPool:
+    """
+    Pre-generated key material. A background thread keeps up to `capacity`
+    keys' worth of random bytes ready, drawing them from os.urandom in large
+    blocks, so minting a batch is a buffer slice instead of one urandom call
+    per key. A request larger than what is buffered gets the shortfall
+    generated inline.
+    """
+
+    def __init__(self, key_size=1024, capacity=4096, block_keys=256, low_water=None):
+        self.key_size = key_size
+        self.capacity = capacity * key_size
+        self.block_size = block_keys * key_size
+        self.low_water = (low_water if low_water is not None else capacity // 2) * key_size
+        self._buf = bytearray()
+        self._lock = threading.Lock()
+        self._refill_needed = threading.Event()
+        self._thread = None
+        self.served_from_pool = 0
+        self.generated_inline = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="km-entropy-pool", daemon=True)
+                self._thread.start()
+        self._refill_needed.set()
+
+    def take(self, count):
+        """Return `count` keys of material as one contiguous bytes object."""
+        wanted = count * self.key_size
+        with self._lock:
+            available = min(wanted, len(self._buf))
+            out = bytes(self._buf[:available])
+            # Deleting from the front of a bytearray only moves its start offset
+            del self._buf[:available]
+            low = len(self._buf) < self.low_water
+        if low:
+            self._refill_needed.set()
+        self.served_from_pool += available // self.key_size
+        if available < wanted:
+            self.generated_inline += (wanted - available) // self.key_size
+            out += os.urandom(wanted - available)
+        return out
+
+    def _run(self):
+        while True:
+            self._refill_needed.wait()
+            self._refill_needed.clear()
+            while len(self._buf) < self.capacity:
+                block = os.urandom(self.block_size)
+                with self._lock:
+                    self._buf += block
+
+    def __len__(self):
+        return len(self._buf) // self.key_size
@@ -0,0 +1,314 @@
+import json
+import os
+import struct
+import threading
+import time
+
+# Append-only key log. Every record is a fixed header followed by the key_id
+# and a payload:
+#   [type: u8][key_id length: u16][payload length: u32][key_id][payload]
+# The in-memory index maps each live key_id to where its key material sits
+# in the file, so a retrieval is a single pread and a mint is a single
+# buffered append. Lifecycle transitions are appended as their own records
+# and replayed in order on startup:
+#   RECORD_KEY        key material, no expiry recorded (logs written before lifecycle states)
+#   RECORD_ISSUED     [expires_at: f64][key material]
+#   RECORD_DELIVERED  [expires_at: f64]  first retrieval by the peer (expiry ignored)
+#   RECORD_CONSUMED   (empty)            key retired by the peer (retrieve with consume)
+#   RECORD_EXPIRED    (empty)            issued key never delivered within its TTL
+# Consumed and expired keys leave the index immediately; compaction later
+# rewrites the log with only the live keys so the file stays bounded too.
+#
+# Retention: the backend keeps no key material of its own and re-retrieves a
+# key every time an email encrypted with it is read, so a key must outlive
+# the emails that use it. Delivered keys therefore never expire; only an
+# explicit consume retires them, which the backend sends when its retention
+# policy deletes the emails. Issued keys expire only when a TTL is set
+# (key_ttl=None, the default, keeps them until consumed).
+RECORD_HEADER = struct.Struct(">BHI")
+EXPIRY = struct.Struct(">d")
+RECORD_KEY = 1
+RECORD_ISSUED = 2
+RECORD_DELIVERED = 3
+RECORD_CONSUMED = 4
+RECORD_EXPIRED = 5
+
+ISSUED = "issued"
+DELIVERED = "delivered"
+NEVER = float("inf")
+
+
+class _Entry:
+    __slots__ = ("offset", "length", "state", "expires_at", "record_bytes")
+
+    def __init__(self, offset, length, state, expires_at, record_bytes):
+        self.offset = offset
+        self.length = length
+        self.state = state
+        self.expires_at = expires_at
+        self.record_bytes = record_bytes
+
+
+class KeyStore:
+    def __init__(self, path, legacy_json=None, key_ttl=None, compact_min_bytes=1 << 20):
+        self.path = path
+        # Seconds an issued key waits for the peer before it expires; None never expires
+        self.key_ttl = key_ttl
+        self.compact_min_bytes = compact_min_bytes
+        self._lock = threading.Lock()
+        self._index = {}
+        self._live_bytes = 0
+        self._file_size = 0
+        self._sweeper = None
+        self.consumed_total = 0
+        self.expired_total = 0
+        self.compactions = 0
+        self._fh = open(path, "ab+")
+        self._rebuild_index()
+        if not self._index and legacy_json and os.path.exists(legacy_json):
+            self._import_legacy(legacy_json)
+
+    def _rebuild_index(self):
+        # Only headers (plus the 8-byte expiry where present) are read; key
+        # payloads are skipped with seek so startup cost is proportional to
+        # the number of records, not their size.
+        size = os.fstat(self._fh.fileno()).st_size
+        now = time.time()
+        offset = 0
+        with open(self.path, "rb") as f:
+            while offset + RECORD_HEADER.size <= size:
+                f.seek(offset)
+                header = f.read(RECORD_HEADER.size)
+                rtype, id_len, payload_len = RECORD_HEADER.unpack(header)
+                end = offset + RECORD_HEADER.size + id_len + payload_len
+                if end > size:
+                    break
+                key_id = f.read(id_len).decode("ascii")
+                payload_offset = offset + RECORD_HEADER.size + id_len
+                record_bytes = end - offset
+                if rtype == RECORD_KEY:
+                    self._add(key_id, _Entry(payload_offset, payload_len, ISSUED, self._issued_deadline(now), record_bytes))
+                elif rtype == RECORD_ISSUED:
+                    (expires_at,) = EXPIRY.unpack(f.read(EXPIRY.size))
+                    self._add(key_id, _Entry(payload_offset + EXPIRY.size, payload_len - EXPIRY.size,
+                                             ISSUED, expires_at, record_bytes))
+                elif rtype == RECORD_DELIVERED:
+                    entry = self._index.get(key_id)
+                    if entry is not None:
+                        # Logs from before retention was unbounded carry a finite deadline here
+                        entry.expires_at = NEVER
+                        entry.state = DELIVERED
+                        entry.record_bytes += record_bytes
+                        self._live_bytes += record_bytes
+                elif rtype in (RECORD_CONSUMED, RECORD_EXPIRED):
+                    self._drop(key_id)
+                offset = end
+        if offset != size:
+            # Torn tail from a crash mid-append: drop the partial record
+            print(f"⚠️ [KEYSTORE] Truncating {size - offset} bytes of partial record")
+            self._fh.truncate(offset)
+        self._file_size = offset
+
+    def _issued_deadline(self, now):
+        return NEVER if not self.key_ttl else now + self.key_ttl
+
+    def _add(self, key_id, entry):
+        self._drop(key_id)
+        self._index[key_id] = entry
+        self._live_bytes += entry.record_bytes
+
+    def _drop(self, key_id):
+        entry = self._index.pop(key_id, None)
+        if entry is not None:
+            self._live_bytes -= entry.record_bytes
+        return entry
+
+    def _import_legacy(self, legacy_json):
+        import base64
+        try:
+            with open(legacy_json, "r") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"Error loading legacy key DB: {e}")
+            return
+        self.put_many((key_id, base64.b64decode(key_b64)) for key_id, key_b64 in legacy.items())
+        print(f"🚀 [KEYSTORE] Migrated {len(legacy)} keys from {legacy_json}")
+
+    @staticmethod
+    def _record(rtype, encoded_id, payload=b"", key_bytes=b""):
+        header = RECORD_HEADER.pack(rtype, len(encoded_id), len(payload) + len(key_bytes))
+        return [header, encoded_id, payload, key_bytes]
+
+    def _append(self, chunks):
+        # Caller holds the lock. Returns the file offset the chunks were written at.
+        offset = self._file_size
+        data = b"".join(chunks)
+        self._fh.seek(0, os.SEEK_END)
+        self._fh.write(data)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._file_size += len(data)
+        return offset
+
+    def put_many(self, items):
+        """Append a batch of (key_id, key_bytes) as issued keys and fsync once for the whole batch."""
+        expires_at = self._issued_deadline(time.time())
+        expiry = EXPIRY.pack(expires_at)
+        chunks = []
+        entries = []
+        with self._lock:
+            offset = self._file_size
+            for key_id, key_bytes in items:
+                encoded_id = key_id.encode("ascii")
+                record = self._record(RECORD_ISSUED, encoded_id, expiry, key_bytes)
+                chunks.extend(record)
+                record_bytes = sum(len(part) for part in record)
+                payload_offset = offset + RECORD_HEADER.size + len(encoded_id) + EXPIRY.size
+                entries.append((key_id, _Entry(payload_offset, len(key_bytes), ISSUED, expires_at, record_bytes)))
+                offset += record_bytes
+            if not entries:
+                return
+            self._append(chunks)
+            for key_id, entry in entries:
+                self._add(key_id, entry)
+
+    def _live(self, key_id, now):
+        entry = self._index.get(key_id)
+        if entry is None or entry.expires_at <= now:
+            # Past its deadline but not swept yet: already as good as gone
+            return None
+        return entry
+
+    def get(self, key_id):
+        """Key material of a live key without changing its state, or None."""
+        with self._lock:
+            entry = self._live(key_id, time.time())
+            if entry is None:
+                return None
+            return os.pread(self._fh.fileno(), entry.length, entry.offset)
+
+    def deliver_many(self, key_ids, consume=False):
+        """
+        Hand keys to the peer: returns {key_id: key_bytes} for every live key
+        among key_ids. The first retrieval moves a key to delivered, where it
+        stays retrievable until the peer asks for it with consume=True.
+        """
+        now = time.time()
+        found = {}
+        chunks = []
+        with self._lock:
+            for key_id in key_ids:
+                entry = self._live(key_id, now)
+                if entry is None or key_id in found:
+                    continue
+                found[key_id] = os.pread(self._fh.fileno(), entry.length, entry.offset)
+                encoded_id = key_id.encode("ascii")
+                if consume:
+                    chunks.extend(self._record(RECORD_CONSUMED, encoded_id))
+                elif entry.state == ISSUED:
+                    entry.expires_at = NEVER
+                    record = self._record(RECORD_DELIVERED, encoded_id, EXPIRY.pack(entry.expires_at))
+                    chunks.extend(record)
+                    entry.state = DELIVERED
+                    record_bytes = sum(len(part) for part in record)
+                    entry.record_bytes += record_bytes
+                    self._live_bytes += record_bytes
+            if chunks:
+                self._append(chunks)
+            if consume:
+                for key_id in found:
+                    self._drop(key_id)
+                self.consumed_total += len(found)
+        return found
+
+    def sweep(self, now=None):
+        """Expire every issued key past its TTL; returns how many were retired."""
+        now = time.time() if now is None else now
+        chunks = []
+        with self._lock:
+            # Delivered keys carry no deadline, so only undelivered keys can be due
+            due = [key_id for key_id, entry in self._index.items() if entry.expires_at <= now]
+            for key_id in due:
+                chunks.extend(self._record(RECORD_EXPIRED, key_id.encode("ascii")))
+            if chunks:
+                self._append(chunks)
+            for key_id in due:
+                self._drop(key_id)
+            self.expired_total += len(due)
+        return len(due)
+
+    def needs_compaction(self):
+        dead = self._file_size - self._live_bytes
+        return dead >= self.compact_min_bytes and dead > self._live_bytes
+
+    def compact(self):
+        """Rewrite the log with only live keys, then swap it in place of the old one."""
+        tmp_path = self.path + ".compact"
+        with self._lock:
+            before = self._file_size
+            index = {}
+            offset = 0
+            with open(tmp_path, "wb") as out:
+                for key_id, entry in self._index.items():
+                    key_bytes = os.pread(self._fh.fileno(), entry.length, entry.offset)
+                    encoded_id = key_id.encode("ascii")
+                    expiry = EXPIRY.pack(entry.expires_at)
+                    record = self._record(RECORD_ISSUED, encoded_id, expiry, key_bytes)
+                    if entry.state == DELIVERED:
+                        record += self._record(RECORD_DELIVERED, encoded_id, expiry)
+                    data = b"".join(record)
+                    out.write(data)
+                    payload_offset = offset + RECORD_HEADER.size + len(encoded_id) + EXPIRY.size
+                    index[key_id] = _Entry(payload_offset, entry.length, entry.state, entry.expires_at, len(data))
+                    offset += len(data)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, self.path)
+            self._fh.close()
+            self._fh = open(self.path, "ab+")
+            self._index = index
+            self._live_bytes = self._file_size = offset
+            self.compactions += 1
+        print(f"🧹 [KEYSTORE] Compacted key log {before} -> {offset} bytes ({len(index)} live keys)")
+
+    def start_sweeper(self, interval=60.0):
+        """Background thread that sweeps expired keys and compacts once most of the log is dead."""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    expired = self.sweep()
+                    if expired:
+                        print(f"🧹 [KEYSTORE] Retired {expired} expired keys")
+                    if self.needs_compaction():
+                        self.compact()
+                except Exception as e:
+                    print(f"❌ [KEYSTORE] Sweep failed: {e}")
+
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=run, name="km-key-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def stats(self):
+        with self._lock:
+            delivered = sum(1 for entry in self._index.values() if entry.state == DELIVERED)
+            return {
+                "issued": len(self._index) - delivered,
+                "delivered": delivered,
+                "consumed_total": self.consumed_total,
+                "expired_total": self.expired_total,
+                "log_bytes": self._file_size,
+                "live_bytes": self._live_bytes,
+                "compactions": self.compactions,
+            }
+
+    def __contains__(self, key_id):
+        return key_id in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
@@ -1,8 +1,11 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from pydantic import BaseModel
+from typing import List
 from fastapi.middleware.cors import CORSMiddleware
 import uuid
 import base64
 import os
+import struct
 
 app = FastAPI(title="QKD Key Management Simulator API")
 
@@ -14,61 +17,118 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-import json
+from km_simulator.key_store import KeyStore
+from km_simulator.entropy_pool import EntropyPool
 
 DB_FILE = "keys_persistence.json"
+# In a sharded cluster every node owns the key_ids it mints: "<shard>.<uuid>"
+SHARD_ID = os.environ.get("KM_SHARD_ID", "")
+STORE_FILE = os.environ.get("KM_STORE_FILE", f"keys_store.{SHARD_ID}.log" if SHARD_ID else "keys_store.log")
 
-def load_db():
-    if os.path.exists(DB_FILE):
-        try:
-            with open(DB_FILE, "r") as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+# Store keys in an append-only log to simulate retrieval capabilities within a cluster.
+# A legacy keys_persistence.json is imported once on first start.
+# Keys are kept until a peer retrieves them with consume=true, since stored
+# emails need their key on every read; the backend consumes them when its
+# EMAIL_RETENTION_DAYS policy deletes the emails. KM_KEY_TTL (seconds, 0 =
+# never) expires keys that were issued and never retrieved. The backend first
+# retrieves a key when its email is first read, so a nonzero TTL also destroys
+# the key of any email left unread for longer than that.
+keys_db = KeyStore(
+    STORE_FILE,
+    legacy_json=DB_FILE,
+    key_ttl=float(os.environ.get("KM_KEY_TTL", "0")) or None,
+    compact_min_bytes=int(os.environ.get("KM_COMPACT_MIN_BYTES", str(1 << 20))),
+)
+# Keys the simulated QKD link can hold at once; issued and delivered keys occupy it
+KEY_CAPACITY = int(os.environ.get("KM_KEY_CAPACITY", "4289"))
+SWEEP_INTERVAL = float(os.environ.get("KM_SWEEP_INTERVAL", "60"))
+
+# Provide larger key to accommodate OTP size matching requirement
+KEY_SIZE = 1024
+entropy_pool = EntropyPool(
+    key_size=KEY_SIZE,
+    capacity=int(os.environ.get("KM_ENTROPY_POOL_KEYS", "4096")),
+    block_keys=int(os.environ.get("KM_ENTROPY_BLOCK_KEYS", "256")),
+)
+
+# Binary bulk transport: the response body is one frame per key,
+#   [key_id length: u16][key length: u32][key_id][key]
+KEY_FRAME_HEADER = struct.Struct(">HI")
+
+@app.on_event("startup")
+def start_background_tasks():
+    if keys_db.key_ttl:
+        print(f"⚠️ [KM] KM_KEY_TTL={keys_db.key_ttl:.0f}s: emails left unread that long can no longer be decrypted")
+    entropy_pool.start()
+    keys_db.start_sweeper(SWEEP_INTERVAL)
 
-def save_db(db):
-    try:
-        with open(DB_FILE, "w") as f:
-            json.dump(db, f)
-    except Exception as e:
-        print(f"Error saving DB: {e}")
+def mint_keys(number):
+    material = memoryview(entropy_pool.take(number))
+    prefix = f"{SHARD_ID}." if SHARD_ID else ""
+    minted = [
+        (f"{prefix}{uuid.uuid4()}", material[i * KEY_SIZE:(i + 1) * KEY_SIZE])
+        for i in range(number)
+    ]
+    # Storing in simulated DB layer for decryption workflow fetching (one fsync per request)
+    keys_db.put_many(minted)
+    return minted
 
-# Store keys in memory and file to simulate retrieval capabilities within a cluster
-keys_db = load_db()
-remaining_keys = 4289 - len(keys_db)
+@app.get("/keys/{slave_id}/bulk")
+def get_keys_binary(slave_id: str, number: int = 1):
+    frames = []
+    for key_id, key_bytes in mint_keys(number):
+        encoded_id = key_id.encode("ascii")
+        frames.append(KEY_FRAME_HEADER.pack(len(encoded_id), len(key_bytes)))
+        frames.append(encoded_id)
+        frames.append(key_bytes)
+    return Response(
+        content=b"".join(frames),
+        media_type="application/octet-stream",
+        headers={"X-Key-Count": str(number)},
+    )
 
 @app.get("/keys/{slave_id}")
 def get_key(slave_id: str, number: int = 1):
-    global remaining_keys
-    keys = []
-    for _ in range(number):
-        key_id = str(uuid.uuid4())
-        # Provide larger key to accommodate OTP size matching requirement
-        key_bytes = os.urandom(1024) 
-        encoded_key = base64.b64encode(key_bytes).decode("utf-8")
-        
-        # Storing in simulated DB layer for decryption workflow fetching
-        keys_db[key_id] = encoded_key
-        remaining_keys -= 1
-        
-        save_db(keys_db)
-        
-        keys.append({
-            "key_id": key_id,
-            "key": encoded_key
-        })
-    
+    keys = [
+        {"key_id": key_id, "key": base64.b64encode(key_bytes).decode("utf-8")}
+        for key_id, key_bytes in mint_keys(number)
+    ]
     if number == 1:
         return keys[0]
     return {"keys": keys}
 
 @app.get("/keys/retrieve/{key_id}")
-def retrieve_key(key_id: str):
-    if key_id in keys_db:
-        return {"key_id": key_id, "key": keys_db[key_id]}
+def retrieve_key(key_id: str, consume: bool = False):
+    key_bytes = keys_db.deliver_many([key_id], consume=consume).get(key_id)
+    if key_bytes is not None:
+        return {"key_id": key_id, "key": base64.b64encode(key_bytes).decode("utf-8")}
     return {"error": "Key not found"}
 
+class BulkRetrieveRequest(BaseModel):
+    key_ids: List[str]
+    consume: bool = False
+
+@app.post("/keys/retrieve")
+def retrieve_keys(req: BulkRetrieveRequest):
+    delivered = keys_db.deliver_many(req.key_ids, consume=req.consume)
+    keys = []
+    missing = []
+    for key_id in req.key_ids:
+        key_bytes = delivered.get(key_id)
+        if key_bytes is None:
+            missing.append(key_id)
+        else:
+            keys.append({"key_id": key_id, "key": base64.b64encode(key_bytes).decode("utf-8")})
+    return {"keys": keys, "missing": missing}
+
 @app.get("/stats")
 def get_stats():
-    return {"remaining_keys": remaining_keys}
+    lifecycle = keys_db.stats()
+    live = lifecycle["issued"] + lifecycle["delivered"]
+    return {
+        "remaining_keys": max(0, KEY_CAPACITY - live),
+        "shard": SHARD_ID,
+        "capacity": KEY_CAPACITY,
+        "entropy_pool_keys": len(entropy_pool),
+        **lifecycle,
+    }